@@ -13,9 +13,15 @@ from swak.core import BaseAgent
 from swak.exception import ConfigError
 from swak.stdplugins.stdout.o_stdout import Stdout
 from swak.util import parse_and_validate_cmds
-from swak.plugin import ProxyOutput, ProxyInput, Output, Input
+from swak.plugin import ProxyOutput, ProxyInput, Output, Input, Modifier,\
+    TextInput
 from swak.config import main_logger_config, validate_cfg
 from swak.pluginpod import PluginPod
+from swak.datarouter import DEFAULT_MAX_PIPELINE, DEFAULT_PARALLEL_MIN_RECORD
+from swak.pool import make_stream_pool, DEFAULT_POOL_MAX_SIZE
+from swak.buffer import make_chunk_pool, DEFAULT_FLUSHER_TICK
+from swak.quota import make_quotas
+from swak.budget import make_budget
 from swak import __version__
 
 
@@ -125,7 +131,39 @@ class OutputThread(BaseThread):
         self.pluginpod.type = 'output'
         self.pluginpod.name = self.name = "OutTrd-{}".format(tag)
         super(OutputThread, self).init_from_commands(tag, cmds, False)
+        self._init_proxy_input(tag)
 
+    def init_copy_from_commands(self, tag, branches):
+        """Init output thread which copies streams to multiple branches.
+
+        Args:
+            tag (str): data tag.
+            branches (list): Seperated plugin commands list for each branch.
+        """
+        self.pluginpod.type = 'output'
+        self.pluginpod.name = self.name = "OutTrd-{}".format(tag)
+        logging.info("init_copy_from_commands thread name {}".
+                     format(self.name))
+        self.pluginpod.init_copy_from_commands(tag, branches)
+        self._init_proxy_input(tag)
+
+    def init_route_from_commands(self, tag, routes):
+        """Init output thread which routes records by field predicates.
+
+        Args:
+            tag (str): data tag.
+            routes (list): List of (field predicates, seperated plugin
+              commands list) tuple.
+        """
+        self.pluginpod.type = 'output'
+        self.pluginpod.name = self.name = "OutTrd-{}".format(tag)
+        logging.info("init_route_from_commands thread name {}".
+                     format(self.name))
+        self.pluginpod.init_route_from_commands(tag, routes)
+        self._init_proxy_input(tag)
+
+    def _init_proxy_input(self, tag):
+        """Init ProxyInput to receive streams from input threads."""
         # Confirm no input plugin.
         assert len(self.plugins) > 0
         for plugin in self.plugins:
@@ -151,6 +189,10 @@ class ServiceAgent(BaseAgent):
         self.input_threads = []
         self.output_threads = []
         self.stop_event = None
+        self.stream_pool = None
+        self.chunk_pools = None
+        self.executor = None
+        self.budget = None
 
     def init_from_cfg(self, cfg, dryrun):
         """Init agent from config.
@@ -237,12 +279,28 @@ class ServiceAgent(BaseAgent):
             """
             logging.info("create_output_thread with cmd '{}'".format(cmd))
             trd = OutputThread(stop_event)
-            cmds = parse_and_validate_cmds(cmd, False)
-            trd.init_from_commands(tag, cmds)
+            trd.pluginpod.set_labels(label_cmds)
+            if type(cmd) is list and len(cmd) > 0 and type(cmd[0]) is dict:
+                routes = [(route.get('where'),
+                           parse_and_validate_cmds(route['to'], False))
+                          for route in cmd]
+                trd.init_route_from_commands(tag, routes)
+            elif type(cmd) is list:
+                branches = [parse_and_validate_cmds(bcmd, False)
+                            for bcmd in cmd]
+                trd.init_copy_from_commands(tag, branches)
+            else:
+                cmds = parse_and_validate_cmds(cmd, False)
+                trd.init_from_commands(tag, cmds)
             self.output_threads.append(trd)
 
         self.stop_event = threading.Event()
 
+        # Labelled sub-pipelines are built in each output thread jumping to
+        #  them.
+        label_cmds = {label: parse_and_validate_cmds(cmd, False) for
+                      label, cmd in cfg.get('labels', {}).items()}
+
         # Create output threads first.
         if 'matches' in cfg:
             for tag, cmd in cfg['matches'].items():
@@ -254,10 +312,170 @@ class ServiceAgent(BaseAgent):
             # Link input & output threads if needed
             if proxy_info is not None:
                 tag, queue = proxy_info
-                self.link_output_thread_with_proxy(tag, queue)
+                self.link_output_thread_with_proxy(
+                    tag, queue, self.input_threads[-1].plugins[-1])
+
+        if cfg.get('router') is not None:
+            self.init_routers(cfg['router'])
+        if cfg.get('pooling') is not None:
+            self.init_pools(cfg['pooling'])
+        if cfg.get('parallel') is not None:
+            self.init_parallel(cfg['parallel'])
+        if cfg.get('lazy') is not None:
+            self.init_lazy(cfg['lazy'])
+        if cfg.get('quota') is not None:
+            self.init_quotas(cfg['quota'])
+        if cfg.get('flusher') is not None:
+            self.init_flushers(cfg['flusher'])
+        if cfg.get('memory') is not None:
+            self.init_budget(cfg['memory'])
+
+    def init_lazy(self, lcfg):
+        """Init lazy decoding of text inputs.
 
-    def link_output_thread_with_proxy(self, tag, queue):
-        """Link input and output thread."""
+        Args:
+            lcfg (dict): Lazy config with ``inputs`` to decode lazily by
+              plugin full name.
+        """
+        if type(lcfg) is not dict or type(lcfg.get('inputs')) is not list:
+            raise ConfigError("The value of the 'lazy' field must be a "
+                              "dictionary content with 'inputs' list.")
+        names = set(lcfg['inputs'])
+        for trd in self.input_threads:
+            for plugin in trd.pluginpod.plugins:
+                if isinstance(plugin, TextInput) and\
+                        getattr(plugin, 'fullname', None) in names:
+                    plugin.set_lazy(True)
+
+    def init_quotas(self, qcfg):
+        """Init tag quotas of input thread routers.
+
+        Quotas are applied as streams are read, before any modifier runs.
+         Output threads are left, since streams they receive from input
+         threads are admitted already. Records diverted in an input thread
+         are passed to the output thread with the divert tag.
+
+        Args:
+            qcfg (list): List of quota config.
+        """
+        make_quotas(qcfg)  # validate config even if no router takes it.
+        for trd in self.input_threads:
+            # Each router has its own buckets.
+            quotas = make_quotas(qcfg)
+            trd.pluginpod.router.set_quotas(quotas)
+            proxy_output = trd.plugins[-1]
+            if not isinstance(proxy_output, ProxyOutput):
+                continue
+            for divert in set(quota.divert for quota in quotas
+                              if quota.policy == 'divert'):
+                trd.pluginpod.router.add_rule(divert, proxy_output, False)
+
+    def init_flushers(self, fcfg):
+        """Init background flusher threads of buffered outputs.
+
+        Args:
+            fcfg (dict): Flusher config with optional ``tick`` seconds.
+        """
+        if type(fcfg) is not dict:
+            raise ConfigError("The value of the 'flusher' field must be a "
+                              "dictionary content.")
+        tick = fcfg.get('tick', DEFAULT_FLUSHER_TICK)
+        if type(tick) not in (int, float) or tick <= 0:
+            raise ConfigError("flusher tick must be a number greater than 0.")
+        for trd in self.input_threads + self.output_threads:
+            for output in trd.pluginpod.iter_outputs():
+                if output.buffer is not None:
+                    output.buffer.set_flusher(tick)
+
+    def init_budget(self, mcfg):
+        """Init memory budget shared by memory buffers and thread queues.
+
+        Args:
+            mcfg (dict): Memory config with ``max_size``.
+        """
+        self.budget = make_budget(mcfg)
+        for trd in self.input_threads + self.output_threads:
+            for plugin in trd.pluginpod.iter_plugins():
+                if isinstance(plugin, (ProxyOutput, ProxyInput)):
+                    plugin.set_budget(self.budget)
+                elif isinstance(plugin, Output) and plugin.buffer is not None\
+                        and plugin.buffer.memory:
+                    plugin.buffer.set_budget(self.budget)
+
+    def init_parallel(self, pcfg):
+        """Init worker processes for parallel modifiers.
+
+        Args:
+            pcfg (dict): Parallel config with ``modifiers`` to run in worker
+              processes by plugin full name, and optional ``workers`` and
+              ``min_record``.
+        """
+        if type(pcfg) is not dict or type(pcfg.get('modifiers')) is not list:
+            raise ConfigError("The value of the 'parallel' field must be a "
+                              "dictionary content with 'modifiers' list.")
+        workers = pcfg.get('workers', multiprocessing.cpu_count())
+        min_record = pcfg.get('min_record', DEFAULT_PARALLEL_MIN_RECORD)
+        if type(workers) is not int or workers <= 0:
+            raise ConfigError("parallel workers must be a integer greater "
+                              "than 0.")
+        names = set(pcfg['modifiers'])
+        try:
+            # Python 2 needs ``futures`` backport.
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError:
+            raise ConfigError("parallel needs 'futures' package in Python "
+                              "2.")
+        self.executor = ProcessPoolExecutor(workers)
+        for trd in self.input_threads + self.output_threads:
+            for plugin in trd.pluginpod.plugins:
+                if isinstance(plugin, Modifier) and\
+                        getattr(plugin, 'fullname', None) in names:
+                    plugin.set_parallel(True)
+            trd.pluginpod.router.set_executor(self.executor, workers,
+                                              min_record)
+
+    def init_routers(self, rcfg):
+        """Init data routers of all threads.
+
+        Args:
+            rcfg (dict): Router config with optional ``max_pipeline`` and
+              ``fold_pipeline``.
+        """
+        if type(rcfg) is not dict:
+            raise ConfigError("The value of the 'router' field must be a "
+                              "dictionary content.")
+        max_pipeline = rcfg.get('max_pipeline', DEFAULT_MAX_PIPELINE)
+        fold_pipeline = rcfg.get('fold_pipeline', False)
+        for trd in self.input_threads + self.output_threads:
+            trd.pluginpod.router.set_cache(max_pipeline, fold_pipeline)
+
+    def init_pools(self, pcfg):
+        """Init object pools shared by all threads.
+
+        Args:
+            pcfg (dict): Pooling config with optional ``max_stream`` and
+              ``max_chunk`` sizes.
+        """
+        if type(pcfg) is not dict:
+            raise ConfigError("The value of the 'pooling' field must be a "
+                              "dictionary content.")
+        max_stream = pcfg.get('max_stream', DEFAULT_POOL_MAX_SIZE)
+        max_chunk = pcfg.get('max_chunk', DEFAULT_POOL_MAX_SIZE)
+        self.stream_pool = make_stream_pool(max_stream)
+        self.chunk_pools = {binary: make_chunk_pool(binary, max_chunk)
+                            for binary in (True, False)}
+        for trd in self.input_threads + self.output_threads:
+            trd.pluginpod.set_pools(self.stream_pool, self.chunk_pools)
+
+    def link_output_thread_with_proxy(self, tag, queue, proxy_output=None):
+        """Link input and output thread.
+
+        Args:
+            tag (str): Data tag.
+            queue (Queue): Inter-proxy queue.
+            proxy_output (ProxyOutput): Proxy output sending to the queue,
+              which learns the receiving routers to project fields.
+        """
         for otrd in self.output_threads:
             match = otrd.pluginpod.router.match(tag)
             if match is None:
@@ -268,6 +486,8 @@ class ServiceAgent(BaseAgent):
                 first_plugin = otrd.pluginpod.plugins[0]
                 assert isinstance(first_plugin, ProxyInput)
                 first_plugin.append_recv_queue(tag, queue)
+                if proxy_output is not None:
+                    proxy_output.add_receiver(otrd.pluginpod.router)
 
     def start(self):
         """Start service."""
@@ -295,6 +515,28 @@ class ServiceAgent(BaseAgent):
             itrd.join()
 
         # Other shutdown processes goes here.
+        if self.executor is not None:
+            self.executor.shutdown()
+        for trd in self.input_threads + self.output_threads:
+            logging.info("pipeline cache stats {}".
+                         format(trd.pluginpod.router.cache_stats))
+            if len(trd.pluginpod.router.quotas) > 0:
+                logging.info("quota shed records {}".
+                             format(trd.pluginpod.router.quota_stats))
+        if self.stream_pool is not None:
+            logging.info("stream pool stats {}".format(self.stream_pool.stats))
+            for binary, pool in self.chunk_pools.items():
+                logging.info("chunk pool binary {} stats {}".
+                             format(binary, pool.stats))
+        if self.budget is not None:
+            logging.info("memory budget stats {}".format(self.budget.stats))
+            for trd in self.input_threads + self.output_threads:
+                for output in trd.pluginpod.iter_outputs():
+                    buf = output.buffer
+                    if buf is not None and buf.budget is not None:
+                        logging.info("buffer of '{}' dropped {} spilled {}".
+                                     format(trd.name, buf.cnt_dropped,
+                                            buf.cnt_spilled))
 
         logging.critical("service agent has been successfully shut down for "
                          "'{}'".format(self.name))
@@ -0,0 +1,106 @@
+"""This module implements memory budget shared by buffers and queues."""
+
+import threading
+
+from swak.util import size_value
+from swak.exception import ConfigError
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest', 'spill')
+# Seconds to wait for budget before checking again.
+BUDGET_WAIT = 0.1
+
+
+class MemoryBudget(object):
+    """Byte budget which memory buffers and inter-thread queues account.
+
+    Data are admitted while the budget has room. A holder which has nothing
+     accounted is admitted over the budget, so that a thread waiting for
+     others to release can not stall the agent.
+    """
+
+    def __init__(self, max_size):
+        """Init.
+
+        Args:
+            max_size (int): Maximum bytes.
+        """
+        assert max_size > 0
+        self.max_size = max_size
+        self.used = 0
+        self.peak = 0
+        self.cond = threading.Condition(threading.Lock())
+
+    def try_acquire(self, size):
+        """Account bytes if the budget has room.
+
+        Args:
+            size (int): Bytes to account.
+
+        Returns:
+            bool: True if accounted.
+        """
+        with self.cond:
+            if self.used + size > self.max_size:
+                return False
+            self._add(size)
+            return True
+
+    def force(self, size):
+        """Account bytes even over the budget.
+
+        Args:
+            size (int): Bytes to account.
+        """
+        with self.cond:
+            self._add(size)
+
+    def _add(self, size):
+        """Add used bytes with the lock held."""
+        self.used += size
+        if self.used > self.peak:
+            self.peak = self.used
+
+    def release(self, size):
+        """Release accounted bytes and wake up waiters.
+
+        Args:
+            size (int): Bytes to release.
+        """
+        with self.cond:
+            self.used -= size
+            self.cond.notify_all()
+
+    def wait(self, timeout=BUDGET_WAIT):
+        """Wait until some bytes are released or timed out."""
+        with self.cond:
+            self.cond.wait(timeout)
+
+    @property
+    def stats(self):
+        """Return budget statistics."""
+        return dict(max_size=self.max_size, used=self.used, peak=self.peak)
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<MemoryBudget {}>".format(self.stats)
+
+
+def make_budget(mcfg):
+    """Make a memory budget from config.
+
+    Args:
+        mcfg (dict): Memory config with ``max_size`` with size suffix.
+
+    Returns:
+        MemoryBudget
+    """
+    if type(mcfg) is not dict or 'max_size' not in mcfg:
+        raise ConfigError("The value of the 'memory' field must be a "
+                          "dictionary content with 'max_size'.")
+    try:
+        max_size = size_value(str(mcfg['max_size']))
+    except ValueError as e:
+        raise ConfigError(str(e))
+    if max_size is None or max_size <= 0:
+        raise ConfigError("memory max_size must be greater than 0.")
+    return MemoryBudget(max_size)
@@ -2,6 +2,31 @@
 
 from collections import deque
 import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from six import PY2
+
+from swak.pool import ObjectPool, DEFAULT_POOL_MAX_SIZE
+
+# Length prefix of a text record in disk chunk.
+FRAME = struct.Struct('<I')
+DEFAULT_FLUSHER_TICK = 0.1
+# Seconds to wait before writing a chunk again after a write failure. It is
+#  doubled on each failure up to the maximum.
+FLUSH_RETRY_MIN_WAIT = 1.0
+FLUSH_RETRY_MAX_WAIT = 60.0
+# Chunk file name with sequence and binary(b) or text(t) mark.
+CHUNK_FILE_PTRN = re.compile(r'^chunk\.(\d+)\.(b|t)$')
+
+
+def chunk_file_name(seq, binary):
+    """Return file name of a disk chunk."""
+    return 'chunk.{}.{}'.format(seq, 'b' if binary else 't')
 
 
 class Chunk(object):
@@ -14,6 +39,8 @@ class Chunk(object):
             binary(bool): Whether store data as binary or not.
         """
         self.binary = binary
+        # Sequence in the journal of the buffer.
+        self.seq = None
         self.reset()
 
     def reset(self):
@@ -43,21 +70,37 @@ class Chunk(object):
 class MemoryChunk(Chunk):
     """Memory chunk class."""
 
-    def __init__(self, binary):
-        """Init."""
+    def __init__(self, binary, recycle=False):
+        """Init.
+
+        Args:
+            binary(bool): Whether store data as binary or not.
+            recycle(bool): Keep the bulk and its capacity on reset for reuse
+              by a chunk pool. The bulk is then valid only during
+              ``Output.write``.
+        """
+        self.recycle = recycle
+        self.bulk = None
         super(MemoryChunk, self).__init__(binary)
-        self.reset()
 
     def reset(self):
         """Reset member variables."""
         super(MemoryChunk, self).reset()
-        self.bulk = bytearray() if self.binary else []
+        if not self.recycle or self.bulk is None:
+            self.bulk = bytearray() if self.binary else []
+        elif not self.binary:
+            del self.bulk[:]
 
     def concat(self, data, adding_size):
         """Concat new data."""
         logging.debug("MemoryChunk.concat adding_size {}".format(adding_size))
         if self.binary:
-            self.bulk += data
+            if self.recycle:
+                # Overwrite in place within capacity, extend otherwise.
+                end = self.bytesize + adding_size
+                self.bulk[self.bytesize:end] = data
+            else:
+                self.bulk += data
         else:
             self.bulk.append(data)
         self.num_record += 1
@@ -66,11 +109,174 @@ class MemoryChunk(Chunk):
     def _flush(self, output):
         """Flushing chunk into output."""
         logging.debug("MemoryChunk._flush")
+        if self.binary and self.recycle:
+            # Trim stale data over the size, which mostly keeps capacity.
+            del self.bulk[self.bytesize:]
         output.write(self.bulk)
 
 
+def make_chunk_pool(binary, max_size=DEFAULT_POOL_MAX_SIZE):
+    """Make a pool of recyclable memory chunks.
+
+    Args:
+        binary (bool): Whether chunks store data as binary or not.
+        max_size (int): Maximum number of free chunks to keep.
+
+    Returns:
+        ObjectPool
+    """
+    logging.info("make_chunk_pool binary {} max_size {}".format(binary,
+                                                                max_size))
+    return ObjectPool(lambda: MemoryChunk(binary, True),
+                      lambda chunk: chunk.reset(), max_size)
+
+
 class DiskChunk(Chunk):
-    """Disk chunk class."""
+    """Chunk which appends data to a file.
+
+    A binary chunk holds data as it is, and records of a text chunk are
+     prefixed with their byte length. The file is removed once flushed, so
+     files left by a crash can be recovered.
+    """
+
+    def __init__(self, binary, path):
+        """Init.
+
+        Args:
+            binary(bool): Whether store data as binary or not.
+            path(str): Chunk file path. The file is created on first data.
+        """
+        self.path = path
+        self.file = None
+        super(DiskChunk, self).__init__(binary)
+
+    @classmethod
+    def recover(cls, binary, path):
+        """Recover a chunk from a file left unflushed.
+
+        A partially written record at the end of a text chunk is truncated.
+         The file is removed if no data is left, since an empty chunk is
+         not flushed. It is created again on new data.
+
+        Args:
+            binary(bool): Whether the chunk stores data as binary or not.
+            path(str): Chunk file path.
+
+        Returns:
+            DiskChunk
+        """
+        chunk = cls(binary, path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if binary:
+            chunk.num_record = max(data.count(b'\n'), 1) if data else 0
+            chunk.bytesize = len(data)
+            if chunk.empty():
+                os.remove(path)
+            return chunk
+
+        pos = 0
+        while pos + FRAME.size <= len(data):
+            size = FRAME.unpack_from(data, pos)[0]
+            if pos + FRAME.size + size > len(data):
+                break
+            pos += FRAME.size + size
+            chunk.num_record += 1
+            chunk.bytesize += size
+        if pos < len(data):
+            logging.warning("DiskChunk.recover - truncate partial record of "
+                            "'{}'".format(path))
+            with open(path, 'r+b') as f:
+                f.truncate(pos)
+        if chunk.empty():
+            os.remove(path)
+        return chunk
+
+    def concat(self, data, adding_size):
+        """Concat new data."""
+        logging.debug("DiskChunk.concat adding_size {}".format(adding_size))
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+        if self.binary:
+            self.file.write(data)
+        else:
+            self.file.write(FRAME.pack(adding_size))
+            self.file.write(data if isinstance(data, (bytes, bytearray))
+                            else data.encode('utf8'))
+        self.num_record += 1
+        self.bytesize += adding_size
+
+    def read(self):
+        """Read data of the chunk.
+
+        Returns:
+            list: Records of text chunk, or one bytes of binary chunk.
+        """
+        self.sync()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        return [data] if self.binary else _unframe(data)
+
+    def sync(self):
+        """Write buffered data to the file."""
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        """Close the file, keeping it for recovery."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _flush(self, output):
+        """Flushing chunk into output.
+
+        Binary chunk is sent with ``os.sendfile`` if the output has a file
+         descriptor, or written as a memory mapped view. Python 2 can not
+         make a view of mmap, so writes a copy. Text chunk is written as a
+         list of records.
+        """
+        logging.debug("DiskChunk._flush")
+        self.close()
+        with open(self.path, 'rb') as f:
+            fd = output.fileno() if self.binary else None
+            if fd is not None and hasattr(os, 'sendfile'):
+                offset = 0
+                while offset < self.bytesize:
+                    offset += os.sendfile(fd, f.fileno(), offset,
+                                          self.bytesize - offset)
+            else:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                view = mm[:] if PY2 else memoryview(mm)
+                try:
+                    if self.binary:
+                        output.write(view)
+                    else:
+                        output.write(_unframe(view))
+                finally:
+                    if not PY2:
+                        view.release()
+                    mm.close()
+        os.remove(self.path)
+
+
+def _unframe(view):
+    """Return text records of length prefixed frames.
+
+    Args:
+        view (bytes-like): Frames of a text chunk.
+
+    Returns:
+        list: Records.
+    """
+    records = []
+    pos = 0
+    while pos < len(view):
+        size = FRAME.unpack_from(view, pos)[0]
+        pos += FRAME.size
+        records.append(bytes(view[pos:pos + size]).decode('utf8'))
+        pos += size
+    return records
 
 
 class Buffer(object):
@@ -88,18 +294,38 @@ class Buffer(object):
         self.memory = memory
         self.binary = binary
         self.tag = None
+        self.chunk_pool = None
         initial_chunk = self.new_chunk()
         self.chunks = deque([initial_chunk])
+        # Chunks popped to be written, but not flushed yet.
+        self.writing = []
         self.last_flush = None
         self.cnt_flushing = 0
         self.cnt_chunking = 0
         self.started = None
         self.flush_at_shutdown = flush_at_shutdown
+        # Guards chunks between appending and flusher threads.
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.flusher = None
+        self.budget = None
+        self.retry_wait = 0
+        self.retry_at = 0
 
     def set_tag(self, tag):
         """Set tag."""
         self.tag = tag
 
+    def set_chunk_pool(self, chunk_pool):
+        """Set chunk pool to recycle memory chunks.
+
+        Args:
+            chunk_pool (ObjectPool): Pool made by ``make_chunk_pool`` with the
+              same binary option.
+        """
+        assert self.memory, "Only memory chunks can be pooled."
+        self.chunk_pool = chunk_pool
+
     @property
     def empty(self):
         """All chunks empty or not."""
@@ -119,23 +345,41 @@ class Buffer(object):
         """Return number of chunks."""
         return len(self.chunks)
 
+    def set_flusher(self, tick=DEFAULT_FLUSHER_TICK):
+        """Flush chunks in a background thread instead of ``may_flushing``.
+
+        Args:
+            tick (float): Maximum seconds to wait before checking flushing.
+        """
+        logging.info("Buffer.set_flusher tick {}".format(tick))
+        assert not self.started
+        self.flusher = Flusher(self, tick)
+
     def start(self):
         """Start buffer."""
         assert not self.started
         self.started = True
+        if self.flusher is not None:
+            self.flusher.start()
 
     def stop(self):
         """Stop buffer."""
         assert self.started
         self.started = False
+        if self.flusher is not None:
+            with self.lock:
+                self.flusher.stopping = True
+                self.cond.notify()
+            self.flusher.join()
 
-    def append(self, data):
+    def append(self, data, binary_data=False):
         """Append data stream to buffer.
 
         If matches flush condition, will call ``flush`` with chunk
 
         Args:
             data: Formatted event.
+            binary_data (bool): Whether this data is already binarized or not.
 
         Returns:
             int: Adding size of data.
@@ -157,7 +401,10 @@ class Buffer(object):
     def flushing(self, flush_all=False):
         """Pop chunk and flush it.
 
-        If no remain chunks, create one and return it.
+        If no remain chunks, create one and return it. Chunks are popped with
+         the lock held, but written without it, so that appending is not
+         blocked by a slow output. A chunk failed to be written is put back
+         to the head with its budget, and flushing backs off for a while.
 
         Args:
             flush_all (bool): Whether flush all or just one.
@@ -166,23 +413,93 @@ class Buffer(object):
             Chunk: Chunk created after flushing.
         """
         logging.debug("Buffer.flushing")
-        while True:
+        with self.lock:
+            num_flush = self.num_chunk if flush_all else 1
+        new_chunk = None
+        for _ in range(num_flush):
+            head_chunk, new_chunk = self._pop_chunk()
+            size = self.budget_size(head_chunk)
+            # no flushing when chunk is empty
+            empty = head_chunk.empty()
             try:
-                head_chunk = self.chunks.popleft()
-                # no flushing when chunk is empty
-                if not head_chunk.empty():
-                    if self.output is not None:
-                        head_chunk.flush(self.output)
-                    self.cnt_flushing += 1
-                if not flush_all:
-                    break
-            except IndexError:
-                break
+                if not empty and self.output is not None:
+                    head_chunk.flush(self.output)
+            except Exception:
+                with self.lock:
+                    self.writing.remove(head_chunk)
+                    self.chunks.appendleft(head_chunk)
+                    self.retry_wait = min(max(self.retry_wait * 2,
+                                              FLUSH_RETRY_MIN_WAIT),
+                                          FLUSH_RETRY_MAX_WAIT)
+                    self.retry_at = time.time() + self.retry_wait
+                raise
+            try:
+                with self.lock:
+                    self.writing.remove(head_chunk)
+                    self.retry_wait = 0
+                    if not empty:
+                        self.cnt_flushing += 1
+                        self.flushed(head_chunk)
+            finally:
+                if size > 0:
+                    self.budget.release(size)
+            if self.chunk_pool is not None:
+                self.chunk_pool.release(head_chunk)
+        return new_chunk
+
+    def set_budget(self, budget):
+        """Set memory budget to account memory chunks against.
+
+        Chunks already in the buffer are accounted over the budget.
+
+        Args:
+            budget (MemoryBudget): Memory budget shared by buffers.
+        """
+        assert self.memory, "Only memory buffer can use budget."
+        logging.info("Buffer.set_budget {}".format(budget))
+        self.budget = budget
+        with self.lock:
+            budget.force(sum(self.budget_size(chunk) for chunk in
+                             self.chunks))
+
+    def budget_size(self, chunk):
+        """Return bytes of a chunk accounted against the budget."""
+        if self.budget is None or not isinstance(chunk, MemoryChunk):
+            return 0
+        return chunk.bytesize
+
+    def _pop_chunk(self):
+        """Pop the head chunk.
+
+        If no remain chunks, create one, so that the buffer always has an
+         active chunk to append.
+
+        Returns:
+            Chunk: Popped chunk.
+            Chunk: Chunk created after popping, or None.
+        """
+        with self.lock:
+            head_chunk = self.chunks.popleft()
+            self.writing.append(head_chunk)
+            if self.num_chunk == 0:
+                logging.debug("no more chunk, make one")
+                return head_chunk, self.chunking()
+        return head_chunk, None
 
-        # If there are no left chunks, make one.
-        if self.num_chunk == 0:
-            logging.debug("no more chunk, make one")
-            return self.chunking()
+    def flushed(self, chunk):
+        """Called with the lock held after a chunk is flushed.
+
+        The chunk is already out of ``writing``, which has chunks other
+         threads are still writing.
+
+        Args:
+            chunk (Chunk): Flushed chunk, before it is recycled.
+        """
+        pass
+
+    def shutdown(self):
+        """Shutdown buffer."""
+        pass
 
     def may_chunking(self, adding_size):
         """Chunking if needed.
@@ -203,6 +520,9 @@ class Buffer(object):
             logging.debug("need chunk, make one")
             new_chunk = self.chunking()
             active_chunk = new_chunk
+            # Sealed chunk may need flushing.
+            if self.flusher is not None:
+                self.cond.notify()
 
         return active_chunk
 
@@ -216,17 +536,34 @@ class Buffer(object):
         Returns:
             Chunk: Chunk created after flushing.
         """
-        # Check flushing
+        # Check flushing. A batch can add more than one chunk at once, so
+        #  keep flushing while needed.
         logging.debug("may_flushing")
-        if self.need_flushing(last_flush_interval):
-            return self.flushing()
+        if self.flusher is not None:
+            # Flusher thread does.
+            return None
+        new_chunk = None
+        while not self.backing_off() and\
+                self.need_flushing(last_flush_interval):
+            new_chunk = self.flushing() or new_chunk
+        return new_chunk
+
+    def backing_off(self):
+        """Whether waiting to write again after a write failure."""
+        return self.retry_wait > 0 and time.time() < self.retry_at
 
     def new_chunk(self):
-        """New chunk."""
+        """New chunk.
+
+        A disk buffer should implement this to make its chunks.
+        """
         if self.memory:
+            if self.chunk_pool is not None:
+                chunk = self.chunk_pool.acquire()
+                assert chunk.binary == self.binary
+                return chunk
             return MemoryChunk(self.binary)
-        else:
-            return DiskChunk(self.binary)
+        raise NotImplementedError()
 
     def need_chunking(self):
         """Need new chunk or not."""
@@ -240,3 +577,44 @@ class Buffer(object):
               is terminated.
         """
         raise NotImplementedError()
+
+
+class Flusher(threading.Thread):
+    """Thread which flushes chunks of a buffer in background.
+
+    The thread which appends to the buffer is not blocked by writing to the
+     output. The flusher wakes up when a chunk is sealed, or every tick to
+     check interval flushing. After a write failure, the chunk is written
+     again once the buffer's back off is over.
+    """
+
+    def __init__(self, abuffer, tick):
+        """Init.
+
+        Args:
+            abuffer (Buffer): Buffer to flush.
+            tick (float): Maximum seconds to wait before checking flushing.
+        """
+        super(Flusher, self).__init__()
+        self.daemon = True
+        self.buffer = abuffer
+        self.tick = tick
+        self.stopping = False
+
+    def run(self):
+        """Thread main."""
+        logging.info("starting flusher for {}".format(self.buffer.output))
+        buf = self.buffer
+        while True:
+            with buf.lock:
+                while not self.stopping and (buf.backing_off() or
+                                             not buf.need_flushing(None)):
+                    buf.cond.wait(self.tick)
+                if self.stopping:
+                    break
+            try:
+                buf.flushing()
+            except Exception as e:
+                logging.error("flusher error: {}, retry in {} seconds".
+                              format(e, buf.retry_wait))
+        logging.info("finished flusher for {}".format(self.buffer.output))
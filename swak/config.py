@@ -9,6 +9,7 @@ import yaml
 
 from swak.exception import ConfigError
 from swak.util import parse_and_validate_cmds, validate_tag
+from swak.predicate import validate_where
 
 ENVVAR = 'SWAK_HOME'
 CFG_FNAME = 'config.yml'
@@ -187,6 +188,53 @@ def validate_cfg(cfg):
     _validate_agent_cfg(cfg)
 
 
+def _ends_with_output(cmds):
+    """Check commands end with an output plugin or a label command."""
+    return cmds[-1][0].startswith('o.') or cmds[-1][0] == 'label'
+
+
+def _validate_labels(labels):
+    """Validate labelled sub-pipelines."""
+    if type(labels) is not dict:
+        raise ConfigError("The value of the 'labels' field must be a "
+                          "dictionary content.")
+    for label, cmds in labels.items():
+        if type(label) is not str or type(cmds) is not str:
+            raise ConfigError("each label and its commands must be a string.")
+        cmds = parse_and_validate_cmds(cmds, False)
+        if not _ends_with_output(cmds):
+            raise ConfigError("label '{}' must ends with output plugin or "
+                              "label command.".format(label))
+        for cmd in cmds:
+            if cmd[0] == 'label' and (len(cmd) != 2 or
+                                      cmd[1] not in labels):
+                raise ConfigError("label '{}' jumps to undefined label.".
+                                  format(label))
+
+
+def _validate_routes(routes):
+    """Validate routing match of field predicates."""
+    fallback = 0
+    for route in routes:
+        if type(route) is not dict or type(route.get('to')) is not str:
+            raise ConfigError("each routing match must be a dictionary with "
+                              "'to' command string.")
+        if not set(route.keys()) <= {'where', 'to'}:
+            raise ConfigError("routing match only can have 'where' and 'to' "
+                              "fields.")
+        if 'where' in route:
+            validate_where(route['where'])
+        else:
+            fallback += 1
+        cmds = parse_and_validate_cmds(route['to'], False)
+        if not _ends_with_output(cmds):
+            raise ConfigError("each routing match must ends with output "
+                              "plugin or label command.")
+    if fallback > 1:
+        raise ConfigError("routing match can have only one route without "
+                          "'where' field.")
+
+
 def _validate_agent_cfg(cfg):
     from swak.datarouter import Rule
 
@@ -219,6 +267,10 @@ def _validate_agent_cfg(cfg):
         first = cmds[0][0]
         check_source_input(first)
 
+    # Labels
+    if 'labels' in cfg:
+        _validate_labels(cfg['labels'])
+
     # Matches
     if 'matches' in cfg:
         matches = cfg['matches']
@@ -230,9 +282,28 @@ def _validate_agent_cfg(cfg):
         for tag, match_cmds in matches.items():
             try:
                 validate_tag(tag)
-                if type(match_cmds) is not str:
+                if type(match_cmds) is list and len(match_cmds) > 0 and\
+                        type(match_cmds[0]) is dict:
+                    # Route records by field predicates.
+                    _validate_routes(match_cmds)
+                elif type(match_cmds) is list:
+                    # Copy to multiple branches.
+                    if len(match_cmds) == 0:
+                        raise ConfigError("copying match must have one or "
+                                          "more commands.")
+                    for branch_cmds in match_cmds:
+                        if type(branch_cmds) is not str:
+                            raise ConfigError("each copying match must be a "
+                                              "string.")
+                        cmds = parse_and_validate_cmds(branch_cmds, False)
+                        if not _ends_with_output(cmds):
+                            raise ConfigError("each copying match must ends "
+                                              "with output plugin or label "
+                                              "command.")
+                elif type(match_cmds) is not str:
                     raise ConfigError("each match must be a string.")
-                cmds = parse_and_validate_cmds(match_cmds, False)
+                else:
+                    cmds = parse_and_validate_cmds(match_cmds, False)
             except ValueError as e:
                 raise ConfigError(e)
             match_tags.add(tag)
@@ -1,8 +1,62 @@
 """This module implements data stream classes."""
 
+from array import array
+from bisect import bisect_right
+
+from six import string_types, binary_type, integer_types
+from six.moves import zip
+
+# Estimated bytes for a value which is not a string.
+SCALAR_SIZE = 8
+
+
+def _int64_typecode():
+    """Return array typecode of 64 bit integer, or None if not exists."""
+    # Python 2 has no 'q' typecode, but 'l' is 64 bit on most platforms.
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+
+
+INT64_TYPECODE = _int64_typecode()
+
+
+def estimate_size(data):
+    """Estimate byte size of a record or a line cheaply.
+
+    String length is used for string keys and values, and ``SCALAR_SIZE``
+    for other values. Nested containers are not followed.
+
+    Args:
+        data (dict or str): A record or a line.
+
+    Returns:
+        int: Estimated size in bytes.
+    """
+    if isinstance(data, (string_types, binary_type, bytearray)):
+        return len(data)
+    size = 0
+    for key, val in data.items():
+        size += len(key)
+        if isinstance(val, (string_types, binary_type)):
+            size += len(val)
+        else:
+            size += SCALAR_SIZE
+    return size
+
 
 class DataStream(object):
-    """DataStream class."""
+    """DataStream class.
+
+    A data stream supports random access by index, zero-copy slicing with
+    ``ds[a:b]``, splitting with ``split`` and concatenation with ``concat``.
+    Slices and concatenations are views which share the storage of their
+    parent streams. Every iteration creates its own iterator, so a stream can
+    be consumed by more than one reader.
+    """
 
     def __init__(self):
         """init."""
@@ -16,6 +70,123 @@ class DataStream(object):
         """Wheter stream is empty."""
         return len(self) == 0
 
+    @property
+    def shares_records(self):
+        """Whether accessed records are the stored ones.
+
+        If not, records are built on each access and in place changes of
+        them are lost.
+        """
+        return True
+
+    def __iter__(self):
+        """Return iterator."""
+        return self._iter_range(0, len(self))
+
+    def __getitem__(self, idx):
+        """Return a (utime, record) tuple by index or a view by slice.
+
+        Args:
+            idx (int or slice): Index or slice. Slice step must be 1.
+
+        Returns:
+            tuple: (utime, record) if index is given.
+            DataStream: A view sharing storage if slice is given.
+        """
+        length = len(self)
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(length)
+            if step != 1:
+                raise ValueError("Data stream slice step must be 1.")
+            return self._view(start, max(start, stop))
+        if idx < 0:
+            idx += length
+        if not 0 <= idx < length:
+            raise IndexError("Data stream index out of range.")
+        return self._item(idx)
+
+    def _item(self, idx):
+        """Implement access by index.
+
+        Args:
+            idx (int): Index in range.
+
+        Returns:
+            tuple: (utime, record)
+        """
+        raise NotImplementedError()
+
+    def _iter_range(self, start, stop):
+        """Iterate (utime, record) in an index range."""
+        for idx in range(start, stop):
+            yield self._item(idx)
+
+    def _view(self, start, stop):
+        """Return a view for an index range."""
+        if start == 0 and stop == len(self):
+            return self
+        return DataStreamView(self, start, stop)
+
+    def split(self, n):
+        """Split into ``n`` contiguous views of almost equal length.
+
+        Args:
+            n (int): Number of views.
+
+        Returns:
+            list: List of DataStream.
+        """
+        assert n > 0
+        size, remain = divmod(len(self), n)
+        views = []
+        start = 0
+        for i in range(n):
+            stop = start + size + (1 if i < remain else 0)
+            views.append(self[start:stop])
+            start = stop
+        return views
+
+    def take(self, indices):
+        """Return a stream of records at given indices without copying.
+
+        Args:
+            indices (list): Increasing record indices.
+
+        Returns:
+            DataStream: A selection view sharing storage.
+        """
+        if len(indices) == len(self):
+            return self
+        return SelectedDataStream(self, indices)
+
+    def copy(self):
+        """Return a copy of the stream with shallow copied records.
+
+        Returns:
+            MultiDataStream
+        """
+        times = []
+        records = []
+        for utime, record in self:
+            times.append(utime)
+            records.append(dict(record) if type(record) is dict else record)
+        return MultiDataStream(times, records)
+
+    @staticmethod
+    def concat(streams):
+        """Concatenate data streams without copying.
+
+        Args:
+            streams (list): List of DataStream.
+
+        Returns:
+            DataStream: A view over the streams.
+        """
+        streams = [ds for ds in streams if not ds.empty()]
+        if len(streams) == 1:
+            return streams[0]
+        return ConcatDataStream(streams)
+
 
 class OneDataStream(DataStream):
     """DataStream class."""
@@ -32,21 +203,13 @@ class OneDataStream(DataStream):
         assert type(record) is dict
         self.record = record
 
+    def _item(self, idx):
+        """Implement access by index."""
+        return self.utime, self.record
+
     def __iter__(self):
         """Return iterator."""
-        self.iter_n = 0
-        return self
-
-    def __next__(self):
-        """Iterate next."""
-        if self.iter_n == 0:
-            self.iter_n += 1
-            return self.utime, self.record
-        raise StopIteration()
-
-    def next(self):
-        """Iterate next for Python2."""
-        return self.__next__()
+        yield self.utime, self.record
 
     def __len__(self):
         """Length of datas."""
@@ -56,32 +219,466 @@ class OneDataStream(DataStream):
 class MultiDataStream(DataStream):
     """MultiDataStream class."""
 
-    def __init__(self, times=[], records=[]):
+    def __init__(self, times=None, records=None):
         """init."""
         super(MultiDataStream, self).__init__()
+        times = times if times is not None else []
+        records = records if records is not None else []
         assert len(times) == len(records)
         self.times = times
         self.records = records
 
+    def _item(self, idx):
+        """Implement access by index."""
+        return self.times[idx], self.records[idx]
+
+    def _iter_range(self, start, stop):
+        """Iterate (utime, record) in an index range."""
+        times = self.times
+        records = self.records
+        for idx in range(start, stop):
+            yield times[idx], records[idx]
+
     def __iter__(self):
         """Return iterator."""
-        self.iter_n = 0
-        self.iter_max = len(self.times)
-        return self
-
-    def __next__(self):
-        """Iterate next."""
-        if self.iter_n < self.iter_max:
-            utime, record = self.times[self.iter_n], self.records[self.iter_n]
-            self.iter_n += 1
-            return utime, record
+        return zip(self.times, self.records)
+
+    def __len__(self):
+        """Length of data."""
+        return len(self.records)
+
+
+class DataStreamView(DataStream):
+    """View of a contiguous range of a data stream.
+
+    The view shares its parent's storage.
+    """
+
+    def __init__(self, parent, start, stop):
+        """init.
+
+        Args:
+            parent (DataStream): Viewed data stream.
+            start (int): Start index in the parent.
+            stop (int): Stop index in the parent.
+        """
+        super(DataStreamView, self).__init__()
+        assert 0 <= start <= stop <= len(parent)
+        self.parent = parent
+        self.start = start
+        self.stop = stop
+
+    @property
+    def shares_records(self):
+        """Whether accessed records are the stored ones."""
+        return self.parent.shares_records
+
+    def _item(self, idx):
+        """Implement access by index."""
+        return self.parent._item(self.start + idx)
+
+    def _iter_range(self, start, stop):
+        """Iterate (utime, record) in an index range."""
+        return self.parent._iter_range(self.start + start, self.start + stop)
+
+    def _view(self, start, stop):
+        """Return a view for an index range."""
+        return self.parent._view(self.start + start, self.start + stop)
+
+    def __len__(self):
+        """Length of data."""
+        return self.stop - self.start
+
+
+class SelectedDataStream(DataStream):
+    """View of selected records of a data stream.
+
+    The view keeps a selection vector of record indices and shares its
+    parent's storage.
+    """
+
+    def __init__(self, parent, indices):
+        """init.
+
+        Args:
+            parent (DataStream): Viewed data stream.
+            indices (list): Increasing record indices in the parent.
+        """
+        super(SelectedDataStream, self).__init__()
+        if isinstance(parent, SelectedDataStream):
+            # Select from the grand parent to avoid a chain of views.
+            indices = [parent.indices[idx] for idx in indices]
+            parent = parent.parent
+        self.parent = parent
+        self.indices = array('L', indices)
+
+    @property
+    def shares_records(self):
+        """Whether accessed records are the stored ones."""
+        return self.parent.shares_records
+
+    def _item(self, idx):
+        """Implement access by index."""
+        return self.parent._item(self.indices[idx])
+
+    def _iter_range(self, start, stop):
+        """Iterate (utime, record) in an index range."""
+        item = self.parent._item
+        for idx in self.indices[start:stop]:
+            yield item(idx)
+
+    def __len__(self):
+        """Length of data."""
+        return len(self.indices)
+
+
+class ConcatDataStream(DataStream):
+    """Concatenation of data streams.
+
+    The concatenation shares the storage of its streams.
+    """
+
+    def __init__(self, streams):
+        """init.
+
+        Args:
+            streams (list): List of DataStream.
+        """
+        super(ConcatDataStream, self).__init__()
+        self.streams = list(streams)
+        # Start index of each stream.
+        self.offsets = []
+        total = 0
+        for ds in self.streams:
+            self.offsets.append(total)
+            total += len(ds)
+        self.length = total
+
+    def _locate(self, idx):
+        """Return stream position and local index for an index."""
+        pos = bisect_right(self.offsets, idx) - 1
+        # Skip streams which end at this index.
+        while idx - self.offsets[pos] >= len(self.streams[pos]):
+            pos += 1
+        return pos, idx - self.offsets[pos]
+
+    @property
+    def shares_records(self):
+        """Whether accessed records are the stored ones."""
+        return all(ds.shares_records for ds in self.streams)
+
+    def _item(self, idx):
+        """Implement access by index."""
+        pos, lidx = self._locate(idx)
+        return self.streams[pos]._item(lidx)
+
+    def _iter_range(self, start, stop):
+        """Iterate (utime, record) in an index range."""
+        for ds, offset in zip(self.streams, self.offsets):
+            length = len(ds)
+            lstart = max(start - offset, 0)
+            lstop = min(stop - offset, length)
+            if lstart < lstop:
+                for item in ds._iter_range(lstart, lstop):
+                    yield item
+
+    def _view(self, start, stop):
+        """Return a view for an index range."""
+        if start == 0 and stop == self.length:
+            return self
+        views = []
+        for ds, offset in zip(self.streams, self.offsets):
+            lstart = max(start - offset, 0)
+            lstop = min(stop - offset, len(ds))
+            if lstart < lstop:
+                views.append(ds[lstart:lstop])
+        if len(views) == 0:
+            return MultiDataStream()
+        return DataStream.concat(views)
+
+    def __len__(self):
+        """Length of data."""
+        return self.length
+
+
+class _Missing(object):
+    """Marker for a field which a record does not have."""
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return '<MISSING>'
+
+
+MISSING = _Missing()
+
+
+class ColumnarDataStream(DataStream):
+    """Columnar data stream class.
+
+    Times are kept in a typed array and all records share one key schema.
+    Each field is stored as a column, so no per-record dict is held until a
+    record is iterated.
+    """
+
+    def __init__(self, keys=None, times=None, columns=None):
+        """init.
+
+        Args:
+            keys (list): Shared key schema.
+            times (iterable): Emit time stamps.
+            columns (list): Column per key. Each column must be as long as
+              ``times``. Use ``MISSING`` for a field a record does not have.
+        """
+        super(ColumnarDataStream, self).__init__()
+        self.keys = list(keys) if keys is not None else []
+        self.key_index = dict((key, i) for i, key in enumerate(self.keys))
+        self.times = times if isinstance(times, array) else\
+            array('d', times if times is not None else [])
+        if columns is None:
+            columns = [[MISSING] * len(self.times) for _ in self.keys]
+        assert len(columns) == len(self.keys)
+        for col in columns:
+            assert len(col) == len(self.times)
+        self.columns = list(columns)
+
+    @classmethod
+    def from_records(cls, times, records):
+        """Create a columnar stream from times and records.
+
+        Args:
+            times (list): Emit time stamps.
+            records (list): Records to emit.
+
+        Returns:
+            ColumnarDataStream
+        """
+        assert len(times) == len(records)
+        ds = cls()
+        for utime, record in zip(times, records):
+            ds.append(utime, record)
+        return ds
+
+    def append(self, utime, record):
+        """Append a record.
+
+        A new key in the record extends the schema, and previous records get
+        ``MISSING`` for it.
+
+        Args:
+            utime (float): emit time stamp.
+            record (dict): record to emit.
+        """
+        assert type(record) is dict
+        for key in record:
+            if key not in self.key_index:
+                self.add_column(key, [MISSING] * len(self.times))
+        self.times.append(utime)
+        for key, col in zip(self.keys, self.columns):
+            val = record.get(key, MISSING)
+            try:
+                col.append(val)
+            except (TypeError, OverflowError):
+                # Value does not fit a compacted column.
+                col = self.columns[self.key_index[key]] = list(col)
+                col.append(val)
+
+    def add_column(self, key, values):
+        """Add a new column to the schema.
+
+        Args:
+            key (str): Field key.
+            values (list): Column values.
+        """
+        assert key not in self.key_index, "Key '{}' already exists".\
+            format(key)
+        assert len(values) == len(self.times)
+        self.key_index[key] = len(self.keys)
+        self.keys.append(key)
+        self.columns.append(values)
+
+    def column(self, key):
+        """Return a column by key.
+
+        Args:
+            key (str): Field key.
+
+        Returns:
+            list or array: Column values, which can contain ``MISSING``.
+        """
+        return self.columns[self.key_index[key]]
+
+    def set_column(self, key, values):
+        """Set a column by key, adding it to the schema if needed.
+
+        Args:
+            key (str): Field key.
+            values (list): Column values.
+        """
+        assert len(values) == len(self.times)
+        if key in self.key_index:
+            self.columns[self.key_index[key]] = values
         else:
-            raise StopIteration()
+            self.add_column(key, values)
+
+    def del_column(self, key):
+        """Remove a column from the schema.
+
+        Args:
+            key (str): Field key.
+        """
+        idx = self.key_index.pop(key)
+        del self.keys[idx]
+        del self.columns[idx]
+        for i in range(idx, len(self.keys)):
+            self.key_index[self.keys[i]] = i
+
+    def compact(self):
+        """Store homogeneous integer or float columns in typed arrays."""
+        for i, col in enumerate(self.columns):
+            if isinstance(col, array) or len(col) == 0:
+                continue
+            types = set(type(val) for val in col)
+            if types <= set(integer_types):
+                if INT64_TYPECODE is None:
+                    continue
+                try:
+                    self.columns[i] = array(INT64_TYPECODE, col)
+                except OverflowError:
+                    pass
+            elif types == {float}:
+                self.columns[i] = array('d', col)
+
+    def record(self, idx):
+        """Materialize a record by index.
+
+        Args:
+            idx (int): Record index.
+
+        Returns:
+            dict: A record.
+        """
+        record = {}
+        for key, col in zip(self.keys, self.columns):
+            val = col[idx]
+            if val is not MISSING:
+                record[key] = val
+        return record
+
+    def take(self, indices):
+        """Return a columnar stream of records at given indices.
+
+        Args:
+            indices (list): Increasing record indices.
+
+        Returns:
+            ColumnarDataStream
+        """
+        times = array('d', (self.times[idx] for idx in indices))
+        columns = []
+        for col in self.columns:
+            values = [col[idx] for idx in indices]
+            if isinstance(col, array):
+                values = array(col.typecode, values)
+            columns.append(values)
+        return ColumnarDataStream(self.keys, times, columns)
+
+    def copy(self):
+        """Return a copy of the stream with copied columns.
+
+        Returns:
+            ColumnarDataStream
+        """
+        columns = [col[:] for col in self.columns]
+        return ColumnarDataStream(self.keys, self.times[:], columns)
+
+    @property
+    def records(self):
+        """Return all records materialized as dicts."""
+        return [self.record(i) for i in range(len(self.times))]
 
-    def next(self):
-        """Iterate next for Python2."""
-        return self.__next__()
+    @property
+    def shares_records(self):
+        """Records are built from columns on each access."""
+        return False
+
+    def _item(self, idx):
+        """Implement access by index."""
+        return self.times[idx], self.record(idx)
 
     def __len__(self):
         """Length of data."""
-        return len(self.records)
+        return len(self.times)
+
+
+class RawDataStream(DataStream):
+    """Data stream of raw lines which decodes records lazily.
+
+    Lines are kept as one block of bytes with offsets. Each line is stored
+    with a trailing newline, so a formatter which emits raw lines can copy
+    the slices straight into a chunk. A record is decoded only when it is
+    accessed.
+    """
+
+    def __init__(self, decode, times=None, lines=None):
+        """init.
+
+        Args:
+            decode (function): Function to decode a raw line (memoryview)
+              into a record.
+            times (iterable): Emit time stamps.
+            lines (list): Raw lines (bytes) without trailing newline.
+        """
+        super(RawDataStream, self).__init__()
+        self.decode = decode
+        self.times = array('d', times if times is not None else [])
+        lines = lines if lines is not None else []
+        assert len(self.times) == len(lines)
+        self.data = bytearray()
+        # Start offset of each line, and end offset of the last line.
+        self.offsets = array('L', [0])
+        for line in lines:
+            self.data += line
+            self.data += b'\n'
+            self.offsets.append(len(self.data))
+        self.view = memoryview(self.data)
+        self.records = None
+
+    @property
+    def materialized(self):
+        """Whether any record has been decoded or not."""
+        return self.records is not None
+
+    def raw(self, idx):
+        """Return a raw line without newline.
+
+        Args:
+            idx (int): Record index.
+
+        Returns:
+            memoryview: Raw line.
+        """
+        return self.view[self.offsets[idx]:self.offsets[idx + 1] - 1]
+
+    def iter_raw(self):
+        """Iterate time and raw line with trailing newline.
+
+        Yields:
+            tuple: (utime, memoryview)
+        """
+        view = self.view
+        offsets = self.offsets
+        for idx, utime in enumerate(self.times):
+            yield utime, view[offsets[idx]:offsets[idx + 1]]
+
+    def _item(self, idx):
+        """Implement access by index."""
+        if self.records is None:
+            self.records = [None] * len(self.times)
+        record = self.records[idx]
+        if record is None:
+            record = self.records[idx] = self.decode(self.raw(idx))
+        return self.times[idx], record
+
+    def __len__(self):
+        """Length of data."""
+        return len(self.times)
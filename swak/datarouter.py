@@ -1,39 +1,295 @@
 """This module implements data router."""
 import logging
-
-from swak.data import MultiDataStream, OneDataStream
-from swak.match import MatchPattern, OrMatchPattern
-from swak.plugin import Modifier, Output, is_kind_of_output
+import time
+import threading
+from collections import OrderedDict
+
+from swak.data import MultiDataStream, OneDataStream, DataStream
+from swak.predicate import PredicateIndex, validate_where
+from swak.match import MatchPattern, OrMatchPattern, TagMatcher
+from swak.plugin import Modifier, Output, is_kind_of_output, \
+    is_batch_modifier, is_commutative
 from swak.config import select_and_parse
+from swak.exception import ConfigError, WireFormatError
+from swak import wireformat
 
 _, cfg = select_and_parse()
 DEBUG = cfg['debug']
 default_placeholder = None
 
+DEFAULT_MAX_PIPELINE = 1000
+DEFAULT_PARALLEL_MIN_RECORD = 1000
+DEFAULT_PROFILE_INTERVAL = 100
+
+
+def compile_modifiers(modifiers):
+    """Compile a modifier chain into a fused function.
+
+    The function unrolls the chain and binds each ``modify`` method to a
+     local, so that no per record loop over modifiers, attribute lookup or
+     logging is left.
+
+    Args:
+        modifiers (list): Modifiers to apply in order.
+
+    Returns:
+        function: ``fused(tag, ds, select, changes)`` which modifies records
+          of ``ds``, appends indices of surviving records to ``select`` and
+          puts replaced (utime, record) into ``changes`` by index.
+    """
+    names = ['_m{}'.format(i) for i in range(len(modifiers))]
+    binds = ''.join(', {0}={0}'.format(name) for name in names)
+    lines = ["def fused(tag, ds, select, changes{}):".format(binds),
+             "    idx = -1",
+             "    for in_time, in_record in ds:",
+             "        idx += 1",
+             "        utime, record = in_time, in_record"]
+    for name in names:
+        lines += ["        result = {}(tag, utime, record)".format(name),
+                  "        if result is None:",
+                  "            continue",
+                  "        utime, record = result"]
+    lines += ["        if utime is not in_time or record is not in_record:",
+              "            changes[idx] = utime, record",
+              "        select(idx)"]
+    env = {name: mod.modify for name, mod in zip(names, modifiers)}
+    exec(compile('\n'.join(lines), '<pipeline>', 'exec'), env)
+    return env['fused']
+
+
+def _unzip(ds):
+    """Return times and records of a data stream as lists."""
+    times = []
+    records = []
+    for utime, record in ds:
+        times.append(utime)
+        records.append(record)
+    return times, records
+
+
+def _modify_shard(tag, modifiers, payload):
+    """Modify a shard of data stream in a worker process.
+
+    Args:
+        tag (str): Data tag.
+        modifiers (list): Modifiers to apply in order.
+        payload (bytes): Shard encoded by ``wireformat``.
+
+    Returns:
+        bytes: Modified shard encoded by ``wireformat``.
+    """
+    pipeline = Pipeline(tag)
+    pipeline.profile_interval = None
+    for mod in modifiers:
+        pipeline.add_modifier(mod)
+    pipeline.compile()
+    modified = pipeline.modify_stream(tag, wireformat.decode(payload))
+    return wireformat.encode(modified)
+
+
+class ParallelStage(object):
+    """Pipeline stage which runs modifiers in worker processes.
+
+    A stream is split into shards, which are shipped in wire format to the
+     workers and concatenated back in order.
+    """
+
+    def __init__(self, modifiers, executor, workers, min_record):
+        """Init.
+
+        Args:
+            modifiers (list): Parallel modifiers to apply in order.
+            executor (ProcessPoolExecutor): Executor of worker processes.
+            workers (int): Number of shards to split a stream.
+            min_record (int): Streams shorter than this are modified in
+              process.
+        """
+        self.modifiers = modifiers
+        self.executor = executor
+        self.workers = workers
+        self.min_record = min_record
+        # In process pipeline for short streams, compiled on first use.
+        self.local = None
+
+    def modify_stream(self, tag, ds):
+        """Modify data stream in worker processes.
+
+        Args:
+            tag (str): Data tag.
+            ds (DataStream): Data stream.
+
+        Returns:
+            DataStream: Modified data stream.
+        """
+        if len(ds) >= self.min_record:
+            try:
+                payloads = [wireformat.encode(shard) for shard in
+                            ds.split(self.workers)]
+            except WireFormatError as e:
+                logging.warning("ParallelStage - can not encode stream: {}".
+                                format(e))
+            else:
+                futures = [self.executor.submit(_modify_shard, tag,
+                                                self.modifiers, payload)
+                           for payload in payloads]
+                return DataStream.concat([wireformat.decode(fut.result())
+                                          for fut in futures])
+
+        if self.local is None:
+            self.local = Pipeline(tag)
+            self.local.profile_interval = None
+            for mod in self.modifiers:
+                self.local.add_modifier(mod)
+            self.local.compile()
+        return self.local.modify_stream(tag, ds)
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<ParallelStage modifiers {}>".format(self.modifiers)
+
 
 class Pipeline(object):
     """Pipeline class."""
 
-    def __init__(self, tag):
+    def __init__(self, tag, stream_pool=None):
         """Init.
 
         Args:
             tag (str): Pipeline tag
+            stream_pool (ObjectPool): Pool to recycle modified streams.
         """
         self.modifiers = []
         self.output = None
         self.tag = tag
+        self.stream_pool = stream_pool
+        self.stages = None
+        self.executor = None
+        self.workers = None
+        self.min_record = None
+        self.routes = []
+        self.index = None
+        self.fuse = False
+        self.profile_interval = DEFAULT_PROFILE_INTERVAL
+        self.num_stream = 0
+        # [input records, output records, elapsed seconds] by modifier.
+        self.mod_stats = {}
 
     def add_modifier(self, modifier):
         """Add modifier."""
         logging.debug("add_modifier {}".format(modifier))
         self.modifiers.append(modifier)
+        self.stages = None
+
+    def make_stages(self, fuse):
+        """Group modifiers into stages.
+
+        Batch modifiers make their own stages, and consecutive per record
+         modifiers are grouped into one stage. With an executor, consecutive
+         parallel modifiers are grouped into a batch ``ParallelStage``.
+
+        Args:
+            fuse (bool): Compile per record stages into fused functions.
+
+        Returns:
+            list: List of (batch, stage) tuple. A stage is a modifier or
+              ``ParallelStage`` for batch stage, (modifiers, fused function)
+              otherwise.
+        """
+        stages = []
+        for mod in self.modifiers:
+            if self.executor is not None and mod.parallel:
+                if len(stages) > 0 and \
+                        isinstance(stages[-1][1], ParallelStage):
+                    stages[-1][1].modifiers.append(mod)
+                else:
+                    stages.append((True, ParallelStage([mod], self.executor,
+                                                       self.workers,
+                                                       self.min_record)))
+            elif is_batch_modifier(mod):
+                stages.append((True, mod))
+            elif len(stages) > 0 and not stages[-1][0]:
+                stages[-1][1][0].append(mod)
+            else:
+                stages.append((False, ([mod], None)))
+        if fuse:
+            stages = [(batch, stage) if batch else
+                      (batch, (stage[0], compile_modifiers(stage[0])))
+                      for batch, stage in stages]
+        return stages
+
+    def set_executor(self, executor, workers,
+                     min_record=DEFAULT_PARALLEL_MIN_RECORD):
+        """Set executor to run parallel modifiers in worker processes.
+
+        Args:
+            executor (ProcessPoolExecutor): Executor of worker processes.
+            workers (int): Number of shards to split a stream.
+            min_record (int): Streams shorter than this are modified in
+              process.
+        """
+        self.executor = executor
+        self.workers = workers
+        self.min_record = min_record
+        self.stages = None
+
+    def compile(self):
+        """Compile per record modifiers into fused functions.
+
+        Modifiers are interpreted one by one with logging when debug logging
+         is enabled.
+        """
+        fuse = not logging.getLogger().isEnabledFor(logging.DEBUG)
+        if fuse and len(self.modifiers) > 0:
+            logging.info("compile pipeline for tag '{}'".format(self.tag))
+        self.fuse = fuse
+        self.stages = self.make_stages(fuse)
 
     def set_output(self, output):
         """Set output."""
         logging.debug("set_output {}".format(output))
         self.output = output
 
+    def add_route(self, where, output):
+        """Add an output for records which satisfy field predicates.
+
+        Records are routed to the first route they satisfy, and the others
+         to the pipeline output.
+
+        Args:
+            where (dict): Field predicates.
+            output (Output): Output of the route.
+        """
+        logging.debug("add_route where {} {}".format(where, output))
+        self.routes.append((where, output))
+        self.index = PredicateIndex([where for where, _ in self.routes])
+
+    def needed_fields(self, tag):
+        """Return record fields the pipeline uses.
+
+        Fields the outputs emit and the route predicates test are walked
+         back through modifiers, which discard some and read others.
+
+        Args:
+            tag (str): Data tag.
+
+        Returns:
+            set: Field names, or None for all fields.
+        """
+        fields = self.output.needed_fields(tag)
+        if fields is not None:
+            fields = set(fields)
+        for where, output in self.routes:
+            ofields = output.needed_fields(tag)
+            if fields is None or ofields is None:
+                return None
+            fields |= ofields | set(where)
+        for mod in reversed(self.modifiers):
+            reads = mod.read_fields()
+            if fields is None or reads is None:
+                return None
+            fields = (fields - (mod.delete_fields() or set())) | reads
+        return fields
+
     def emit_stream(self, tag, ds, stop_event):
         """Emit data stream output.
 
@@ -49,7 +305,35 @@ class Pipeline(object):
         """
         logging.debug("emit_stream")
         modified = self.modify_stream(tag, ds)
-        return self.output.emit_stream(tag, modified, stop_event)
+        if self.index is not None:
+            return self.emit_routes(tag, modified, stop_event)
+        adding_size = self.output.emit_stream(tag, modified, stop_event)
+        # Recycle the stream made by modifiers and consumed by the output,
+        #  unless it is queued. The given stream is owned by the caller.
+        # Selection views are not, since other views may share the parent.
+        if self.stream_pool is not None and not self.output.proxy and\
+                modified is not ds and type(modified) is MultiDataStream:
+            self.stream_pool.release(modified)
+        return adding_size
+
+    def emit_routes(self, tag, ds, stop_event):
+        """Partition a modified stream by routes and emit sub-streams.
+
+        Args:
+            tag (str): Data tag.
+            ds (DataStream): Modified data stream.
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            int: Adding size of the stream.
+        """
+        outputs = [output for _, output in self.routes] + [self.output]
+        adding_size = 0
+        for output, indices in zip(outputs, self.index.partition(ds)):
+            if len(indices) > 0:
+                adding_size += output.emit_stream(tag, ds.take(indices),
+                                                  stop_event) or 0
+        return adding_size
 
     def modify_stream(self, tag, ds):
         """Modify data stream.
@@ -59,7 +343,7 @@ class Pipeline(object):
 
         Returns:
             If modified
-                Modified MultiDataStream object
+                Modified DataStream object
 
             If no modifiers exists
                 Original data stream object
@@ -71,37 +355,187 @@ class Pipeline(object):
         for mod in self.modifiers:
             mod.prepare_for_stream(tag, ds)
 
-        # Modify each records
         logging.debug("modify_stream")
-        times = []
-        records = []
-        for utime, record in ds:
-            skip = False
-            for mod in self.modifiers:
-                logging.debug("apply modifier {}".format(mod))
-                result = mod.modify(tag, utime, record)
-                if result is None:
-                    skip = True
-                    break
-                utime, record = result
-            if not skip:
-                times.append(utime)
-                records.append(record)
-        logging.debug("modified records {}".format(records))
-        return MultiDataStream(times, records)
+        if self.stages is None:
+            self.stages = self.make_stages(self.fuse)
+        self.num_stream += 1
+        if self.profile_interval is not None and\
+                (self.num_stream - 1) % self.profile_interval == 0 and\
+                not any(isinstance(stage, ParallelStage)
+                        for _, stage in self.stages):
+            return self.profile_stream(tag, ds)
+        for batch, stage in self.stages:
+            if batch:
+                logging.debug("apply batch modifier {}".format(stage))
+                ds = stage.modify_stream(tag, ds)
+            else:
+                ds = self.modify_records(tag, ds, *stage)
+        return ds
+
+    def profile_stream(self, tag, ds):
+        """Modify data stream by each modifier to collect statistics.
+
+        Commutative modifiers are reordered by the statistics afterward.
+
+        Args:
+            tag (str): Data tag.
+            ds (DataStream): data stream to be modified.
+
+        Returns:
+            DataStream: Modified data stream.
+        """
+        for mod in self.modifiers:
+            num_in = len(ds)
+            st = time.time()
+            if is_batch_modifier(mod):
+                ds = mod.modify_stream(tag, ds)
+            else:
+                ds = self.modify_records(tag, ds, [mod], None)
+            stats = self.mod_stats.setdefault(mod, [0, 0, 0.0])
+            stats[0] += num_in
+            stats[1] += len(ds)
+            stats[2] += time.time() - st
+        self.reorder()
+        return ds
+
+    def _rank(self, mod):
+        """Rank a modifier to run earlier when it is cheap and selective.
+
+        Returns:
+            float: (selectivity - 1) / cost per record.
+        """
+        num_in, num_out, elapsed = self.mod_stats.get(mod, (0, 0, 0.0))
+        if num_in == 0:
+            return 0.0
+        drop = 1.0 - float(num_out) / num_in
+        cost = elapsed / num_in
+        if cost <= 0:
+            return float('-inf') if drop > 0 else 0.0
+        return -drop / cost
+
+    def reorder(self):
+        """Reorder adjacent commutative modifiers by their ranks.
+
+        Returns:
+            bool: True if the order is changed.
+        """
+        order = list(self.modifiers)
+        ranks = {mod: self._rank(mod) for mod in order}
+        swapped = True
+        while swapped:
+            swapped = False
+            for i in range(len(order) - 1):
+                mod1, mod2 = order[i], order[i + 1]
+                if ranks[mod2] < ranks[mod1] and is_commutative(mod1, mod2):
+                    order[i], order[i + 1] = mod2, mod1
+                    swapped = True
+        if order == self.modifiers:
+            return False
+        self.modifiers = order
+        self.stages = self.make_stages(self.fuse)
+        logging.info("reorder modifiers for tag '{}': {}".
+                     format(self.tag, self.stats))
+        return True
+
+    @property
+    def stats(self):
+        """Return statistics of modifiers in the order of application."""
+        stats = []
+        for mod in self.modifiers:
+            num_in, num_out, elapsed = self.mod_stats.get(mod, (0, 0, 0.0))
+            stats.append(dict(modifier=mod, records=num_in,
+                              drop_rate=1.0 - float(num_out) / num_in
+                              if num_in > 0 else 0.0, elapsed=elapsed))
+        return stats
+
+    def modify_records(self, tag, ds, modifiers, fused):
+        """Modify each records of data stream.
+
+        Modifiers produce a selection vector of surviving records. Records
+         modified in place are kept as they are, so a new stream is built
+         only when a modifier returns another time or record.
+
+        Args:
+            tag (str): Data tag.
+            ds (DataStream): data stream to be modified.
+            modifiers (list): Per record modifiers.
+            fused (function): Compiled function of modifiers or None.
+
+        Returns:
+            DataStream: Modified data stream.
+        """
+        if not ds.shares_records:
+            # Keep records built on access to see in place changes.
+            ds = MultiDataStream(*_unzip(ds))
+        selected = []
+        changes = {}
+        if fused is not None:
+            fused(tag, ds, selected.append, changes)
+        else:
+            for idx, (in_time, in_record) in enumerate(ds):
+                utime, record = in_time, in_record
+                skip = False
+                for mod in modifiers:
+                    logging.debug("apply modifier {}".format(mod))
+                    result = mod.modify(tag, utime, record)
+                    if result is None:
+                        skip = True
+                        break
+                    utime, record = result
+                if skip:
+                    continue
+                if utime is not in_time or record is not in_record:
+                    changes[idx] = utime, record
+                selected.append(idx)
+            logging.debug("selected records {}".format(selected))
+        return self.select_stream(ds, selected, changes)
+
+    def select_stream(self, ds, selected, changes):
+        """Make a stream of selected and changed records.
+
+        Args:
+            ds (DataStream): Original data stream.
+            selected (list): Increasing indices of surviving records.
+            changes (dict): Replaced (utime, record) by index.
+
+        Returns:
+            DataStream: The original stream if nothing is dropped or
+              replaced, a selection view if nothing is replaced, a new
+              MultiDataStream otherwise.
+        """
+        if len(changes) == 0:
+            return ds.take(selected)
+
+        if self.stream_pool is not None:
+            modified = self.stream_pool.acquire()
+        else:
+            modified = MultiDataStream()
+        times = modified.times
+        records = modified.records
+        for idx in selected:
+            change = changes.get(idx)
+            utime, record = ds._item(idx) if change is None else change
+            times.append(utime)
+            records.append(record)
+        return modified
 
 
 class Rule(object):
     """Rule class."""
 
-    def __init__(self, pattern, collector):
+    def __init__(self, pattern, collector, where=None):
         """init.
 
         Args:
             pattern (str): Glob style patterns seperated by space.
             collector: Modifier or Output
+            where (dict): Field predicates of records for output rule.
         """
-        patterns = [MatchPattern().create(ptrn) for ptrn in pattern.split()]
+        if where is not None:
+            validate_where(where)
+        self.where = where
+        self.globs = pattern.split()
+        patterns = [MatchPattern().create(ptrn) for ptrn in self.globs]
         self.pattern = patterns[0] if len(patterns) == 1 else\
             OrMatchPattern(patterns)
         self.collector = collector
@@ -119,6 +553,9 @@ class Rule(object):
 
     def __repr__(self):
         """Canonical string representation."""
+        if self.where is not None:
+            return "<Rule pattern '{}' where {} with collector '{}'>".\
+                format(self.pattern, self.where, self.collector)
         return "<Rule pattern '{}' with collector '{}'>".format(self.pattern,
                                                                 self.collector)
 
@@ -149,9 +586,175 @@ class DataRouter(object):
         """
         super(DataRouter, self).__init__()
         self.rules = []
-        self.match_cache = {}
+        self.matcher = None
+        self.match_cache = OrderedDict()
+        self.max_pipeline = DEFAULT_MAX_PIPELINE
+        self.fold_pipeline = False
+        self.shared_pipelines = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self.cache_invalidations = 0
         assert isinstance(def_output, Output)
         self.def_output = def_output
+        self.stream_pool = None
+        self.executor = None
+        self.workers = None
+        self.min_record = None
+        self.quotas = []
+        # Guards rules and pipeline caches, which may be changed by other
+        #  threads while streams are routed.
+        self.lock = threading.RLock()
+        # Called after rules are changed, to refresh what depends on them.
+        self.rule_callbacks = []
+
+    def add_rule_callback(self, callback):
+        """Add a callback called after rules are added or removed.
+
+        Callbacks are called out of the lock, since they may look up
+         pipelines of this and other routers.
+
+        Args:
+            callback (callable): Function with no argument.
+        """
+        self.rule_callbacks.append(callback)
+
+    def _rules_changed(self):
+        """Call rule callbacks."""
+        for callback in self.rule_callbacks:
+            callback()
+
+    def set_cache(self, max_pipeline=DEFAULT_MAX_PIPELINE,
+                  fold_pipeline=False):
+        """Set pipeline cache options.
+
+        Args:
+            max_pipeline (int): Maximum number of tags to cache pipeline.
+              Least recently used one is evicted when exceeded.
+            fold_pipeline (bool): Share one pipeline between tags which match
+              the same rules.
+        """
+        logging.info("set_cache max_pipeline {} fold_pipeline {}".
+                     format(max_pipeline, fold_pipeline))
+        if type(max_pipeline) is not int or max_pipeline <= 0:
+            raise ConfigError("max_pipeline must be a integer greater than "
+                              "0.")
+        with self.lock:
+            self.max_pipeline = max_pipeline
+            if fold_pipeline != self.fold_pipeline:
+                self.fold_pipeline = fold_pipeline
+                self.match_cache.clear()
+                self.shared_pipelines.clear()
+            while len(self.match_cache) > max_pipeline:
+                self._evict()
+
+    @property
+    def cache_stats(self):
+        """Return pipeline cache statistics."""
+        return dict(hits=self.cache_hits, misses=self.cache_misses,
+                    evictions=self.cache_evictions,
+                    invalidations=self.cache_invalidations,
+                    size=len(self.match_cache),
+                    shared=len(self.shared_pipelines))
+
+    def _evict(self):
+        """Evict least recently used pipeline from the cache."""
+        tag, _ = self.match_cache.popitem(last=False)
+        self.cache_evictions += 1
+        logging.debug("DataRouter._evict - pipeline for tag '{}'".
+                      format(tag))
+
+    def set_stream_pool(self, stream_pool):
+        """Set pool to recycle streams in pipelines.
+
+        Streams emitted through the router are recycled once an output has
+         consumed them, so they must not be used after emitting.
+
+        Args:
+            stream_pool (ObjectPool): Pool made by ``make_stream_pool``.
+        """
+        self.stream_pool = stream_pool
+        for pline in self.match_cache.values():
+            pline.stream_pool = stream_pool
+        for pline in self.shared_pipelines.values():
+            pline.stream_pool = stream_pool
+
+    def set_executor(self, executor, workers,
+                     min_record=DEFAULT_PARALLEL_MIN_RECORD):
+        """Set executor to run parallel modifiers in worker processes.
+
+        Args:
+            executor (ProcessPoolExecutor): Executor of worker processes.
+            workers (int): Number of shards to split a stream.
+            min_record (int): Streams shorter than this are modified in
+              process.
+        """
+        self.executor = executor
+        self.workers = workers
+        self.min_record = min_record
+        self.match_cache.clear()
+        self.shared_pipelines.clear()
+
+    def set_quotas(self, quotas):
+        """Set quotas to admit streams before routing.
+
+        Args:
+            quotas (list): List of Quota. The first matching one applies.
+        """
+        logging.info("set_quotas {}".format(quotas))
+        self.quotas = quotas
+
+    @property
+    def quota_stats(self):
+        """Return shed records by tag."""
+        shed = {}
+        for quota in self.quotas:
+            for tag, cnt in quota.shed.items():
+                shed[tag] = shed.get(tag, 0) + cnt
+        return shed
+
+    def admit(self, tag, ds, stop_event):
+        """Admit a data stream by the first matching quota.
+
+        Records to divert are emitted with the divert tag without admission.
+
+        Args:
+            tag (str): Data tag
+            ds (DataStream): Data stream
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            DataStream: Admitted data stream.
+        """
+        for quota in self.quotas:
+            if quota.match(tag):
+                ds, diverted = quota.admit(tag, ds)
+                if diverted is not None:
+                    self.route_stream(quota.divert, diverted, stop_event)
+                break
+        return ds
+
+    def needed_fields(self, tag):
+        """Return record fields pipelines for a tag use.
+
+        Fields of the divert tag pipeline are included, if the tag has a
+         quota which diverts records.
+
+        Args:
+            tag (str): Data tag.
+
+        Returns:
+            set: Field names, or None for all fields.
+        """
+        fields = self.match(tag).needed_fields(tag)
+        for quota in self.quotas:
+            if quota.match(tag):
+                if fields is not None and quota.policy == 'divert':
+                    dfields = self.match(quota.divert).needed_fields(
+                        quota.divert)
+                    fields = None if dfields is None else fields | dfields
+                break
+        return fields
 
     def emit(self, tag, utime, record):
         """Emit one data.
@@ -164,7 +767,7 @@ class DataRouter(object):
         Returns:
             int: Adding size of the stream if succeeded, or None.
         """
-        return self.emit_stream(tag, OneDataStream(utime, record))
+        return self.emit_stream(tag, OneDataStream(utime, record), None)
 
     def emit_stream(self, tag, ds, stop_event):
         """Emit an data stream with tag.
@@ -178,6 +781,23 @@ class DataRouter(object):
             int: Adding size of the stream if succeeded, or None.
         """
         logging.debug("emit_stream tag '{}' ds {}".format(tag, ds))
+        if len(self.quotas) > 0:
+            ds = self.admit(tag, ds, stop_event)
+            if ds.empty():
+                return 0
+        return self.route_stream(tag, ds, stop_event)
+
+    def route_stream(self, tag, ds, stop_event):
+        """Route a data stream to the matching pipeline.
+
+        Args:
+            tag (str): Data tag
+            ds (DataStream): Data stream
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            int: Adding size of the stream if succeeded, or None.
+        """
         try:
             adding_size = self.match(tag).emit_stream(tag, ds, stop_event)
             return adding_size
@@ -186,40 +806,143 @@ class DataRouter(object):
                 raise
             logging.error(e)
 
-    def add_rule(self, tag, collector, insert_first):
+    def add_rule(self, tag, collector, insert_first, where=None):
         """Add new rule.
 
         Args:
             tag (str): Multiple patterns seperated by space for tag.
             collector (Plugin): Input or Modifier or Output plugin
             insert_first (bool): Do not append, insert at first.
+            where (dict): Field predicates of records for output rule.
         """
         logging.info("add_rule tag '{}' collector {}".format(tag, collector))
+        if where is not None and not is_kind_of_output(collector):
+            raise ConfigError("Only output rules can have field predicates.")
         collector.set_tag(tag)
-        rule = Rule(tag, collector)
-        if insert_first:
-            self.rules.insert(0, rule)
-        else:
-            self.rules.append(rule)
+        rule = Rule(tag, collector, where)
+        with self.lock:
+            if insert_first:
+                self.rules.insert(0, rule)
+            else:
+                self.rules.append(rule)
+            self.matcher = None
+            self.invalidate(rule)
+        self._rules_changed()
+
+    def remove_rule(self, collector):
+        """Remove rules of a collector.
+
+        Args:
+            collector (Plugin): Modifier or Output plugin of the rules.
+
+        Returns:
+            int: Number of removed rules.
+        """
+        logging.info("remove_rule collector {}".format(collector))
+        with self.lock:
+            removed = [rule for rule in self.rules
+                       if rule.collector is collector]
+            if len(removed) == 0:
+                return 0
+            self.rules = [rule for rule in self.rules
+                          if rule.collector is not collector]
+            self.matcher = None
+            for rule in removed:
+                self.invalidate(rule)
+                for key in list(self.shared_pipelines.keys()):
+                    if rule in key:
+                        del self.shared_pipelines[key]
+        self._rules_changed()
+        return len(removed)
+
+    def invalidate(self, rule):
+        """Invalidate cached pipelines of tags which match a rule.
+
+        Pipelines of other tags are kept, since their matching rules are
+         not changed.
+
+        Args:
+            rule (Rule): Added or removed rule.
+
+        Returns:
+            int: Number of invalidated tags.
+        """
+        with self.lock:
+            tags = [tag for tag in self.match_cache if rule.match(tag)]
+            for tag in tags:
+                del self.match_cache[tag]
+            self.cache_invalidations += len(tags)
+        if len(tags) > 0:
+            logging.info("invalidated pipelines of {} tags for rule {}".
+                         format(len(tags), rule))
+        return len(tags)
+
+    def build_matcher(self):
+        """Build a tag matcher for all rules.
+
+        Returns:
+            ``TagMatcher``
+        """
+        logging.info("build_matcher for {} rules".format(len(self.rules)))
+        matcher = TagMatcher()
+        for i, rule in enumerate(self.rules):
+            for glob in rule.globs:
+                matcher.add(glob, i)
+        return matcher
 
     def match(self, tag):
         """Match pipeline by tag.
 
+        The lock is held only while looking up or building the pipeline, so
+         rules can be changed from other threads while streams are routed.
+
         Args:
             tag (str): data tag
 
         Returns:
             ``Pipeline``
         """
-        if tag not in self.match_cache:
-            logging.debug("DataRouter.match - not found in cache '{}'".
-                          format(tag))
-            pline = self.build_pipeline(tag)
-            self.match_cache[tag] = pline
-        else:
-            pline = self.match_cache[tag]
+        with self.lock:
+            try:
+                pline = self.match_cache[tag]
+            except KeyError:
+                logging.debug("DataRouter.match - not found in cache '{}'".
+                              format(tag))
+                self.cache_misses += 1
+                pline = self.build_pipeline(tag)
+                self.match_cache[tag] = pline
+                if len(self.match_cache) > self.max_pipeline:
+                    self._evict()
+            else:
+                self.cache_hits += 1
+                # Reinsert as most recently used. No ``move_to_end`` in
+                #  Python 2.
+                del self.match_cache[tag]
+                self.match_cache[tag] = pline
         return pline
 
+    def match_rules(self, tag):
+        """Match rules for tag until the first output rule.
+
+        Output rules with field predicates do not stop matching.
+
+        Args:
+            tag (str): data tag.
+
+        Returns:
+            list: Matched rules.
+        """
+        if self.matcher is None:
+            self.matcher = self.build_matcher()
+        rules = []
+        for i in self.matcher.match(tag):
+            rule = self.rules[i]
+            logging.info("matched tag '{}' rule {}".format(tag, rule))
+            rules.append(rule)
+            if is_kind_of_output(rule.collector) and rule.where is None:
+                break
+        return rules
+
     def build_pipeline(self, tag):
         """Build a pipeline for tag and returns it.
 
@@ -229,19 +952,31 @@ class DataRouter(object):
         Returns:
             ``Pipeline``
         """
+        rules = self.match_rules(tag)
+        if self.fold_pipeline:
+            key = tuple(rules)
+            if key in self.shared_pipelines:
+                logging.debug("build_pipeline - fold tag '{}'".format(tag))
+                return self.shared_pipelines[key]
+
         logging.info("build_pipeline for tag '{}'".format(tag))
-        pipeline = Pipeline(tag)
-        for rule in self.rules:
-            if not rule.match(tag):
-                continue
-            logging.info("matched tag '{}' rule {}".format(tag, rule))
+        pipeline = Pipeline(tag, self.stream_pool)
+        if self.executor is not None:
+            pipeline.set_executor(self.executor, self.workers,
+                                  self.min_record)
+        for rule in rules:
             if isinstance(rule.collector, Modifier):
                 pipeline.add_modifier(rule.collector)
+            elif rule.where is not None:
+                pipeline.add_route(rule.where, rule.collector)
             elif is_kind_of_output(rule.collector):
                 pipeline.set_output(rule.collector)
-                return pipeline
 
-        logging.info("no output. fallback to default output '{}'".
-                     format(self.def_output))
-        pipeline.set_output(self.def_output)
+        if pipeline.output is None:
+            logging.info("no output. fallback to default output '{}'".
+                         format(self.def_output))
+            pipeline.set_output(self.def_output)
+        pipeline.compile()
+        if self.fold_pipeline:
+            self.shared_pipelines[key] = pipeline
         return pipeline
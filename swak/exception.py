@@ -23,3 +23,9 @@ class GracefulExit(Exception):
     """Exception for graceful exit."""
 
     pass
+
+
+class WireFormatError(Exception):
+    """Exception: Malformed or unsupported wire format."""
+
+    pass
@@ -0,0 +1,111 @@
+"""This module implements file buffer."""
+
+import os
+import logging
+
+from swak.buffer import DiskChunk, CHUNK_FILE_PTRN, chunk_file_name
+from swak.memorybuffer import MemoryBuffer, DEFAULT_CHUNK_MAX_RECORD,\
+    DEFAULT_CHUNK_MAX_SIZE, DEFAULT_BUFFER_MAX_CHUNK
+from swak.exception import ConfigError
+
+
+class FileBuffer(MemoryBuffer):
+    """Buffer which stores its chunks in append-only files.
+
+    Chunking and flushing conditions are the same as ``MemoryBuffer``, but
+     the backlog is bound by disk instead of memory. Chunk files left by the
+     last run are recovered and flushed first. Data of binary chunks are
+     handed to the output as memory mapped views, which are valid only
+     during ``Output.write``.
+    """
+
+    def __init__(self, output, binary, path,
+                 chunk_max_record=DEFAULT_CHUNK_MAX_RECORD,
+                 chunk_max_size=DEFAULT_CHUNK_MAX_SIZE,
+                 buffer_max_chunk=DEFAULT_BUFFER_MAX_CHUNK,
+                 flush_interval=None, flush_at_shutdown=False):
+        """Init.
+
+        Args:
+            output (Output): An output.
+            binary (bool): Store data as binary or not.
+            path (str): Directory to store chunk files. Each buffer needs its
+              own directory.
+            chunk_max_record (int): Maximum records per chunk for slicing.
+            chunk_max_size (str): Maximum chunk size for slicing with suffix.
+            buffer_max_chunk (int): Maximum chunks per buffer for slicing.
+            flush_interval (str): Flush interval with time suffix.
+            flush_at_shutdown (bool): Flush all chunks at shutdown, or keep
+              them for the next run.
+        """
+        if path is None:
+            raise ConfigError("FileBuffer needs a directory path.")
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        recovered = self._find_chunks(binary)
+        self.seq = recovered[-1][0] + 1 if len(recovered) > 0 else 0
+
+        super(FileBuffer, self).__init__(output, binary, chunk_max_record,
+                                         chunk_max_size, buffer_max_chunk,
+                                         flush_interval)
+        self.memory = False
+        self.flush_at_shutdown = flush_at_shutdown
+        logging.info("FileBuffer.__init__ - path '{}' recovered {} chunks".
+                     format(path, len(recovered)))
+        # Recovered chunks are flushed before the active one.
+        self.chunks.extendleft(reversed([DiskChunk.recover(binary, cpath)
+                                         for _, cpath in recovered]))
+
+    def _find_chunks(self, binary):
+        """Find chunk files left by the last run.
+
+        Args:
+            binary (bool): Find binary chunks or text chunks.
+
+        Returns:
+            list: List of (sequence, path) tuple in order.
+        """
+        mark = 'b' if binary else 't'
+        chunks = []
+        for fname in os.listdir(self.path):
+            match = CHUNK_FILE_PTRN.match(fname)
+            if match is None:
+                continue
+            cpath = os.path.join(self.path, fname)
+            if match.group(2) != mark:
+                logging.warning("FileBuffer - skip chunk of other format "
+                                "'{}'".format(cpath))
+                continue
+            if os.path.getsize(cpath) == 0:
+                os.remove(cpath)
+                continue
+            chunks.append((int(match.group(1)), cpath))
+        return sorted(chunks)
+
+    def new_chunk(self):
+        """New chunk with the next file sequence."""
+        fname = chunk_file_name(self.seq, self.binary)
+        self.seq += 1
+        return DiskChunk(self.binary, os.path.join(self.path, fname))
+
+    def chunking(self):
+        """Close the file of the active chunk and create new chunk.
+
+        Returns:
+            Chunk: Created chunk.
+        """
+        if self.num_chunk > 0:
+            self.active_chunk.close()
+        return super(FileBuffer, self).chunking()
+
+    def stop(self):
+        """Stop buffer, writing buffered data to chunk files."""
+        super(FileBuffer, self).stop()
+        for chunk in self.chunks:
+            chunk.sync()
+
+    def shutdown(self):
+        """Close chunk files, keeping them for the next run."""
+        for chunk in self.chunks:
+            chunk.close()
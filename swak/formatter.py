@@ -1,12 +1,20 @@
 """This module implements formatters."""
 
+import json
 from datetime import datetime
 
 import pytz
+from six import string_types
 
 
 class Formatter(object):
-    """Base class for formatter."""
+    """Base class for formatter.
+
+    A formatter which can emit raw lines sets ``raw`` and implements
+    ``format_raw``.
+    """
+
+    raw = False
 
     def __init__(self, binary, localtime=True, timezone=None,
                  time_format=None):
@@ -38,6 +46,26 @@ class Formatter(object):
         else:
             self.timezone = pytz.timezone(timezone)
 
+    @property
+    def config_key(self):
+        """Return a key which is equal for formatters of the same config.
+
+        Formatters of the same key format a record into the same result.
+        """
+        return (type(self), self.binary, self.localtime, self.timezone,
+                self.time_format)
+
+    def emit_fields(self):
+        """Return record fields the formatter emits.
+
+        A formatter which emits only some fields can implement this, so that
+         parsers skip the others.
+
+        Returns:
+            set: Field names, or None for all fields.
+        """
+        return None
+
     def format(self, tag, dtime, record):
         """Format an event.
 
@@ -48,6 +76,19 @@ class Formatter(object):
         """
         raise NotImplemented()
 
+    def format_raw(self, tag, utime, line):
+        """Format a raw line.
+
+        Args:
+            tag (str): data tag.
+            utime (float): data time stamp.
+            line (memoryview): raw line with trailing newline.
+
+        Returns:
+            bytes-like: Formatted line.
+        """
+        raise NotImplementedError()
+
     def timestamp_to_datetime(self, utime):
         """Convert UTC Unix time stamp to datetime.
 
@@ -93,3 +134,45 @@ class StdoutFormatter(Formatter):
         """
         return "{dtime}\t{tag}\t{record}".format(dtime=dtime, tag=tag,
                                                  record=record)
+
+
+class RawFormatter(Formatter):
+    """Formatter class which emits original lines.
+
+    Raw lines of a ``RawDataStream`` are emitted as they are. Other records
+    are emitted as JSON, and text records as they are.
+    """
+
+    raw = True
+
+    def __init__(self):
+        """Init."""
+        super(RawFormatter, self).__init__(True)
+
+    def format(self, tag, dtime, record):
+        """Format an data.
+
+        Args:
+            tag (str): data tag
+            dtime (datetime): data datetime
+            record (dict or str): data record
+
+        Returns:
+            str: Formatted string
+        """
+        if isinstance(record, string_types):
+            return record + '\n'
+        return json.dumps(record) + '\n'
+
+    def format_raw(self, tag, utime, line):
+        """Format a raw line.
+
+        Args:
+            tag (str): data tag.
+            utime (float): data time stamp.
+            line (memoryview): raw line with trailing newline.
+
+        Returns:
+            memoryview: The line itself.
+        """
+        return line
@@ -0,0 +1,148 @@
+"""This module implements write-ahead journal for memory buffer."""
+
+import os
+import time
+import struct
+import logging
+
+# Entry header of kind, chunk sequence and payload size.
+ENTRY = struct.Struct('<BQI')
+ENTRY_DATA = 1
+ENTRY_COMMIT = 2
+# Rewrite the journal with pending data after this many bytes are written.
+JOURNAL_ROTATE_SIZE = 64 * 1024 * 1024
+
+
+class Journal(object):
+    """Sequential log of data appended to memory chunks.
+
+    Data are written as they are appended, but synced to disk at most once
+     per ``sync_interval``, so that many appends share one ``fsync``. A
+     chunk is marked as committed when flushed, and only data of chunks not
+     committed are replayed after a crash.
+    """
+
+    def __init__(self, path, sync_interval):
+        """Init.
+
+        Args:
+            path (str): Journal file path.
+            sync_interval (float): Seconds between syncs to disk.
+        """
+        self.path = path
+        self.sync_interval = sync_interval
+        self.file = None
+        self.last_sync = None
+        self.written = 0
+        self.cnt_sync = 0
+        self.seq = 0
+
+    def replay(self):
+        """Read data of chunks not committed, and rewrite the journal.
+
+        A partially written entry at the end is discarded.
+
+        Returns:
+            list: List of (chunk sequence, payloads) tuple in order.
+        """
+        pending = {}
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            pos = 0
+            while pos + ENTRY.size <= len(data):
+                kind, seq, size = ENTRY.unpack_from(data, pos)
+                end = pos + ENTRY.size + size
+                if end > len(data):
+                    break
+                if kind == ENTRY_DATA:
+                    pending.setdefault(seq, []).append(
+                        data[pos + ENTRY.size:end])
+                elif kind == ENTRY_COMMIT:
+                    pending.pop(seq, None)
+                self.seq = max(self.seq, seq + 1)
+                pos = end
+            if pos < len(data):
+                logging.warning("Journal.replay - discard partial entry of "
+                                "'{}'".format(self.path))
+
+        chunks = sorted(pending.items())
+        self.rotate(chunks)
+        logging.info("Journal.replay - {} chunks from '{}'".
+                     format(len(chunks), self.path))
+        return chunks
+
+    def next_seq(self):
+        """Return sequence for a new chunk."""
+        seq = self.seq
+        self.seq += 1
+        return seq
+
+    def _write(self, kind, seq, payload):
+        """Write an entry."""
+        self.file.write(ENTRY.pack(kind, seq, len(payload)))
+        self.file.write(payload)
+        self.written += ENTRY.size + len(payload)
+
+    def append(self, seq, payload):
+        """Write data appended to a chunk.
+
+        Args:
+            seq (int): Chunk sequence.
+            payload (bytes-like): Data.
+        """
+        self._write(ENTRY_DATA, seq, payload)
+        self.may_sync()
+
+    def commit(self, seq):
+        """Mark a chunk as committed.
+
+        Args:
+            seq (int): Chunk sequence.
+        """
+        self._write(ENTRY_COMMIT, seq, b'')
+
+    def may_sync(self):
+        """Sync to disk if the interval has passed."""
+        now = time.time()
+        if now - self.last_sync >= self.sync_interval:
+            self.sync(now)
+
+    def sync(self, now=None):
+        """Sync written entries to disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = now if now is not None else time.time()
+        self.cnt_sync += 1
+
+    def need_rotate(self):
+        """Return True if the journal is to be rewritten."""
+        return self.written >= JOURNAL_ROTATE_SIZE
+
+    def rotate(self, chunks):
+        """Rewrite the journal with data of pending chunks only.
+
+        Args:
+            chunks (list): List of (chunk sequence, payloads) tuple.
+        """
+        logging.debug("Journal.rotate")
+        self.close()
+        tmp_path = self.path + '.tmp'
+        self.file = open(tmp_path, 'wb')
+        self.written = 0
+        for seq, payloads in chunks:
+            for payload in payloads:
+                self._write(ENTRY_DATA, seq, payload)
+        self.written = 0
+        self.sync()
+        self.file.close()
+        # Python 2 has no atomic replace on Windows.
+        getattr(os, 'replace', os.rename)(tmp_path, self.path)
+        self.file = open(self.path, 'ab')
+
+    def close(self):
+        """Sync and close the journal."""
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
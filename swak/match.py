@@ -3,32 +3,148 @@
 import re
 
 
+# Literal pattern without glob syntax.
+ptrn_literal = re.compile(r'^[^*{}\\]+$')
+
+
+def _is_literal(ptrn):
+    """Check whether a pattern is a literal tag."""
+    return ptrn_literal.match(ptrn) is not None and\
+        '' not in ptrn.split('.')
+
+
 class MatchPattern(object):
     """MatchPattern class."""
 
     def create(self, ptrn):
         """Create object.
 
+        Pick a specialized pattern for literal, prefix, suffix and brace set
+         patterns, ``GlobMatchPattern`` otherwise.
+
         Args:
             ptrn (str): Glob pattern.
         """
         if ptrn == '**':
             return AllMatchPattern()
-        else:
-            return GlobMatchPattern(ptrn)
+        if _is_literal(ptrn):
+            return ExactMatchPattern(ptrn)
+        for wild, dot in (('.**', True), ('**', False)):
+            if ptrn.endswith(wild) and _is_literal(ptrn[:-len(wild)]):
+                return PrefixMatchPattern(ptrn[:-len(wild)], dot)
+        for wild, dot in (('**.', True), ('**', False)):
+            if ptrn.startswith(wild) and _is_literal(ptrn[len(wild):]):
+                return SuffixMatchPattern(ptrn[len(wild):], dot)
+        if '{' in ptrn and '\\' not in ptrn:
+            expanded = expand_braces(ptrn)
+            if expanded is not None and all(_is_literal(pat) for pat in
+                                            expanded):
+                return SetMatchPattern(ptrn, expanded)
+        return GlobMatchPattern(ptrn)
 
 
 class AllMatchPattern(MatchPattern):
     """AllMatchPattern class."""
 
-    def __init__(self, arg):
-        """init."""
-        super(AllMatchPattern, self).__init__()
-        self.arg = arg
+    def match(self, strn):
+        """Match any string."""
+        return True
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<AllMatchPattern>"
+
+
+class ExactMatchPattern(MatchPattern):
+    """ExactMatchPattern class."""
+
+    def __init__(self, tag):
+        """init.
+
+        Args:
+            tag (str): Literal tag.
+        """
+        self.tag = tag
+
+    def match(self, strn):
+        """Check string equals to the tag."""
+        return strn == self.tag
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<ExactMatchPattern tag '{}'>".format(self.tag)
+
+
+class PrefixMatchPattern(MatchPattern):
+    """PrefixMatchPattern class for ``a.**`` or ``a**``."""
+
+    def __init__(self, prefix, dot):
+        """init.
+
+        Args:
+            prefix (str): Literal prefix.
+            dot (bool): Prefix is followed by tag segments.
+        """
+        self.prefix = prefix
+        self.dot = dot
+        self.dotted = prefix + '.'
+
+    def match(self, strn):
+        """Check string starts with the prefix."""
+        if self.dot:
+            return strn == self.prefix or strn.startswith(self.dotted)
+        return strn.startswith(self.prefix)
 
     def __repr__(self):
         """Canonical string representation."""
-        return "<AllMatchPattern arg '{}'>".format(self.arg)
+        return "<PrefixMatchPattern prefix '{}'>".format(self.prefix)
+
+
+class SuffixMatchPattern(MatchPattern):
+    """SuffixMatchPattern class for ``**.a`` or ``**a``."""
+
+    def __init__(self, suffix, dot):
+        """init.
+
+        Args:
+            suffix (str): Literal suffix.
+            dot (bool): Suffix is preceded by tag segments.
+        """
+        self.suffix = suffix
+        self.dot = dot
+        self.dotted = '.' + suffix
+
+    def match(self, strn):
+        """Check string ends with the suffix."""
+        if self.dot:
+            return strn == self.suffix or strn.endswith(self.dotted)
+        return strn.endswith(self.suffix)
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<SuffixMatchPattern suffix '{}'>".format(self.suffix)
+
+
+class SetMatchPattern(MatchPattern):
+    """SetMatchPattern class for braces of literal tags."""
+
+    def __init__(self, pat, tags):
+        """init.
+
+        Args:
+            pat (str): Glob pattern.
+            tags (list): Literal tags expanded from the pattern.
+        """
+        self.pat = pat
+        self.tags = frozenset(tags)
+
+    def match(self, strn):
+        """Check string is one of the tags."""
+        return strn in self.tags
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<SetMatchPattern pattern '{}'>".format(self.pat)
 
 
 class GlobMatchPattern(MatchPattern):
@@ -83,7 +199,7 @@ class GlobMatchPattern(MatchPattern):
                 stack.append([])
                 regex.append('')
             elif c == "}" and stack:
-                stack[-1] += regex.pop()
+                stack[-1].append(regex.pop())
                 regex[-1] += "({})".format('|'.join(stack.pop()))
             elif c == "," and stack:
                 stack[-1].append(regex.pop())
@@ -91,12 +207,12 @@ class GlobMatchPattern(MatchPattern):
             elif re.search(r'[a-zA-Z0-9_]', c) is not None:
                 regex[-1] += c
             else:
-                regex[-1] += "\\#{}".format(c)
+                regex[-1] += re.escape(c)
 
             i += 1
 
         while stack:
-            stack[-1] += regex.pop()
+            stack[-1].append(regex.pop())
             regex[-1] += '|'.join(stack.pop())
 
         self.regex = re.compile("^" + regex[-1] + "$")
@@ -110,7 +226,7 @@ class GlobMatchPattern(MatchPattern):
         Returns:
             (bool): True if string matches.
         """
-        return len(self.regex.findall(strn)) > 0
+        return self.regex.match(strn) is not None
 
     def __repr__(self):
         """Canonical string representation."""
@@ -141,8 +257,175 @@ class OrMatchPattern(MatchPattern):
         for pattern in self.patterns:
             if pattern.match(strn):
                 return True
+        return False
 
     def __repr__(self):
         """Canonical string representation."""
         pats = [repr(pat) for pat in self.patterns]
         return "<OrMatchPattern {}>".format(', '.join(pats))
+
+
+# Tag segment which the tag matcher handles without regex fallback.
+ptrn_segment = re.compile(r'^[^{}\\]+$')
+
+
+def expand_braces(ptrn):
+    """Expand ``{a,b}`` alternatives of a glob pattern.
+
+    Args:
+        ptrn (str): Glob pattern.
+
+    Returns:
+        list: Expanded patterns, or None if the pattern has unbalanced
+          braces.
+    """
+    start = ptrn.find('{')
+    if start < 0:
+        return None if '}' in ptrn else [ptrn]
+
+    # Find matching close brace and top level commas.
+    depth = 0
+    commas = []
+    for i in range(start, len(ptrn)):
+        c = ptrn[i]
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+            if depth == 0:
+                break
+        elif c == ',' and depth == 1:
+            commas.append(i)
+    else:
+        return None
+
+    bounds = [start] + commas + [i]
+    head, tail = ptrn[:start], ptrn[i + 1:]
+    if '}' in head:
+        return None
+    result = []
+    for j in range(len(bounds) - 1):
+        alt = ptrn[bounds[j] + 1:bounds[j + 1]]
+        expanded = expand_braces(head + alt + tail)
+        if expanded is None:
+            return None
+        result += expanded
+    return result
+
+
+class _Node(object):
+    """State of the tag matcher."""
+
+    def __init__(self):
+        """Init."""
+        self.children = {}
+        self.globs = {}
+        self.any = None
+        self.loop = False
+        self.accepts = set()
+
+
+class TagMatcher(object):
+    """Automaton which matches a tag against many glob patterns at once.
+
+    Patterns are expanded by braces and compiled into a trie over dot
+     separated tag segments, where a ``**`` segment matches zero or more
+     segments. Patterns a trie can not express, like ``a**`` or escapes,
+     fall back to ``GlobMatchPattern``.
+    """
+
+    def __init__(self):
+        """Init."""
+        self.root = _Node()
+        self.fallbacks = []
+
+    def add(self, ptrn, order):
+        """Add a glob pattern.
+
+        Args:
+            ptrn (str): Glob pattern.
+            order (int): Order of the pattern to report when matched.
+        """
+        expanded = expand_braces(ptrn) if '\\' not in ptrn else None
+        if expanded is None or not all(self._supported(pat)
+                                       for pat in expanded):
+            self.fallbacks.append((GlobMatchPattern(ptrn), order))
+            return
+
+        for pat in expanded:
+            node = self.root
+            for seg in pat.split('.'):
+                if seg == '**':
+                    if node.any is None:
+                        node.any = _Node()
+                        node.any.loop = True
+                    node = node.any
+                elif '*' in seg:
+                    if seg not in node.globs:
+                        # Other characters are literal as in glob pattern.
+                        regex = re.compile('^{}$'.format('[^\\.]*'.join(
+                            re.escape(part) for part in seg.split('*'))))
+                        node.globs[seg] = (regex, _Node())
+                    node = node.globs[seg][1]
+                else:
+                    node = node.children.setdefault(seg, _Node())
+            node.accepts.add(order)
+
+    @staticmethod
+    def _supported(ptrn):
+        """Check whether the trie can express an expanded pattern."""
+        for seg in ptrn.split('.'):
+            if ptrn_segment.match(seg) is None:
+                return False
+            if '**' in seg and seg != '**':
+                return False
+        return True
+
+    @staticmethod
+    def _closure(nodes):
+        """Add states reachable by matching zero segments with ``**``."""
+        result = {}
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if id(node) in result:
+                continue
+            result[id(node)] = node
+            if node.any is not None:
+                stack.append(node.any)
+        return list(result.values())
+
+    def match(self, tag):
+        """Match a tag against all patterns.
+
+        Args:
+            tag (str): Target tag.
+
+        Returns:
+            list: Sorted orders of matched patterns.
+        """
+        nodes = self._closure([self.root])
+        for seg in tag.split('.'):
+            nexts = []
+            for node in nodes:
+                child = node.children.get(seg)
+                if child is not None:
+                    nexts.append(child)
+                for regex, child in node.globs.values():
+                    if regex.match(seg) is not None:
+                        nexts.append(child)
+                if node.loop:
+                    # ``**`` consumes a segment and stays.
+                    nexts.append(node)
+            if not nexts:
+                nodes = []
+                break
+            nodes = self._closure(nexts)
+
+        orders = set()
+        for node in nodes:
+            orders |= node.accepts
+        for pattern, order in self.fallbacks:
+            if order not in orders and pattern.match(tag):
+                orders.add(order)
+        return sorted(orders)
@@ -1,11 +1,15 @@
 """This module implements buffers."""
 
+import os
 import time
 import logging
 
 from six import string_types
 
-from swak.buffer import Buffer
+from swak.buffer import Buffer, MemoryChunk, DiskChunk, CHUNK_FILE_PTRN,\
+    chunk_file_name
+from swak.budget import OVERFLOW_POLICIES
+from swak.journal import Journal
 from swak.util import time_value, size_value
 from swak.exception import ConfigError
 
@@ -13,16 +17,31 @@ from swak.exception import ConfigError
 DEFAULT_CHUNK_MAX_RECORD = 1000
 DEFAULT_CHUNK_MAX_SIZE = '4m'
 DEFAULT_BUFFER_MAX_CHUNK = 4
+DEFAULT_JOURNAL_SYNC = '1s'
 
 
 class MemoryBuffer(Buffer):
-    """Buffer which store its chunks in memory."""
+    """Buffer which store its chunks in memory.
+
+    With a journal, appended data are also written to a sequential log, so
+     that chunks not flushed are recovered after a crash.
+
+    With a memory budget, the ``overflow`` policy applies when the budget is
+     full:
+
+    - block: Flush chunks of this buffer in the appending thread.
+    - drop_oldest: Drop the oldest chunk in memory.
+    - drop_newest: Drop the appending data.
+    - spill: Move the oldest chunk in memory to a file in ``spill`` path.
+    """
 
     def __init__(self, output, binary,
                  chunk_max_record=DEFAULT_CHUNK_MAX_RECORD,
                  chunk_max_size=DEFAULT_CHUNK_MAX_SIZE,
                  buffer_max_chunk=DEFAULT_BUFFER_MAX_CHUNK,
-                 flush_interval=None):
+                 flush_interval=None, journal=None,
+                 journal_sync=DEFAULT_JOURNAL_SYNC, overflow='block',
+                 spill=None):
         """Init.
 
         Args:
@@ -32,7 +51,12 @@ class MemoryBuffer(Buffer):
             chunk_max_size (str): Maximum chunk size for slicing with suffix.
             buffer_max_chunk (int): Maximum chunks per buffer for slicing.
             flush_interval (str): Flush interval with time suffix.
+            journal (str): Journal file path. No journal if None.
+            journal_sync (str): Journal sync interval with time suffix.
+            overflow (str): Policy when the memory budget is full.
+            spill (str): Directory to spill chunks for ``spill`` policy.
         """
+        self.journal = None
         super(MemoryBuffer, self).__init__(output, True, binary, True)
 
         assert isinstance(chunk_max_size, string_types), "chunk_max_size must"\
@@ -44,6 +68,7 @@ class MemoryBuffer(Buffer):
         try:
             chunk_max_size = size_value(chunk_max_size)
             flush_interval = time_value(flush_interval)
+            journal_sync = time_value(journal_sync)
         except ValueError as e:
             raise ConfigError(str(e))
 
@@ -56,6 +81,13 @@ class MemoryBuffer(Buffer):
             raise ConfigError("chunk_max_size must be greater than 0.")
         if flush_interval is not None and flush_interval <= 0:
             raise ConfigError("flush_interval must be greater than 0.")
+        if journal_sync is None or journal_sync < 0:
+            raise ConfigError("journal_sync must not be negative.")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ConfigError("Unsupported overflow policy '{}'.".
+                              format(overflow))
+        if overflow == 'spill' and spill is None:
+            raise ConfigError("spill policy needs a directory to spill.")
 
         self.chunk_max_record = chunk_max_record
         self.chunk_max_size = chunk_max_size
@@ -71,6 +103,89 @@ class MemoryBuffer(Buffer):
 
         self.queue = None
         self.max_record = 0
+        self.overflow = overflow
+        self.cnt_dropped = 0
+        self.cnt_spilled = 0
+        self.spill = spill
+        if spill is not None:
+            self._init_spill()
+        if journal is not None:
+            self.open_journal(journal, journal_sync)
+
+    def _init_spill(self):
+        """Make spill directory, removing chunks left by the last run.
+
+        Spilled chunks are not recovered, since they are memory chunks.
+        """
+        if not os.path.isdir(self.spill):
+            os.makedirs(self.spill)
+        for fname in os.listdir(self.spill):
+            if CHUNK_FILE_PTRN.match(fname) is not None:
+                os.remove(os.path.join(self.spill, fname))
+        self.spill_seq = 0
+
+    def open_journal(self, path, sync_interval):
+        """Open journal and recover chunks not flushed.
+
+        Recovered chunks are flushed before the active one.
+
+        Args:
+            path (str): Journal file path.
+            sync_interval (float): Journal sync interval in seconds.
+        """
+        logging.info("MemoryBuffer.open_journal '{}'".format(path))
+        self.journal = Journal(path, sync_interval)
+        recovered = []
+        for seq, payloads in self.journal.replay():
+            chunk = super(MemoryBuffer, self).new_chunk()
+            chunk.seq = seq
+            for payload in payloads:
+                data = payload if self.binary else payload.decode('utf8')
+                chunk.concat(data, len(payload))
+            recovered.append(chunk)
+        self.active_chunk.seq = self.journal.next_seq()
+        self.chunks.extendleft(reversed(recovered))
+
+    def new_chunk(self):
+        """New chunk with the next journal sequence."""
+        chunk = super(MemoryBuffer, self).new_chunk()
+        if self.journal is not None:
+            chunk.seq = self.journal.next_seq()
+        return chunk
+
+    def flushed(self, chunk):
+        """Commit a flushed chunk to the journal.
+
+        The journal is rewritten with chunks not flushed, if it has grown and
+         no other chunk is being written.
+
+        Args:
+            chunk (Chunk): Flushed chunk.
+        """
+        if self.journal is None:
+            return
+        self.journal.commit(chunk.seq)
+        # Chunks being written by other threads are not committed yet, and
+        #  would be lost by rotating now. Rotate on a later flush instead.
+        if self.journal.need_rotate() and len(self.writing) == 0:
+            self.journal.rotate([(ch.seq, self._journal_payloads(ch)) for ch
+                                 in self.chunks if not ch.empty()])
+
+    def _journal_payloads(self, chunk):
+        """Return data of a chunk to write in the journal."""
+        if isinstance(chunk, DiskChunk):
+            records = chunk.read()
+        elif self.binary:
+            return [bytes(chunk.bulk[:chunk.bytesize])]
+        else:
+            records = chunk.bulk
+        return [data if isinstance(data, (bytes, bytearray)) else
+                data.encode('utf8') for data in records]
+
+    def shutdown(self):
+        """Close the journal."""
+        if self.journal is not None:
+            self.journal.close()
 
     def set_max_record(self, max_record):
         """Set maximum records number."""
@@ -93,10 +208,130 @@ class MemoryBuffer(Buffer):
         if self.binary:
             data = bytedata
 
-        chunk = self.may_chunking(adding_size)
-        chunk.concat(data, adding_size)
+        if self.budget is not None and not self.admit(adding_size):
+            self.cnt_dropped += 1
+            return 0
+
+        with self.lock:
+            chunk = self.may_chunking(adding_size)
+            chunk.concat(data, adding_size)
+            if self.journal is not None:
+                self.journal.append(chunk.seq, bytedata)
         return adding_size
 
+    def admit(self, size):
+        """Account appending data against the memory budget.
+
+        Data are admitted over the budget if this buffer has nothing in
+         memory to flush, drop or spill.
+
+        Args:
+            size (int): Bytes of the data.
+
+        Returns:
+            bool: False if the data are to be dropped.
+        """
+        budget = self.budget
+        while not budget.try_acquire(size):
+            if self.overflow == 'drop_newest':
+                return False
+            chunk = self._pop_memory_chunk(self.overflow != 'block')
+            if chunk is None:
+                if self.overflow == 'drop_oldest':
+                    return False
+                budget.force(size)
+                break
+            if self.overflow == 'block':
+                # Flush in this thread to slow down the input.
+                self.flushing()
+            elif self.overflow == 'drop_oldest':
+                logging.warning("MemoryBuffer.admit - drop {} records over "
+                                "memory budget".format(chunk.num_record))
+                self._discard(chunk)
+            else:
+                self._spill(chunk)
+        return True
+
+    def _pop_memory_chunk(self, pop):
+        """Find the oldest non-empty memory chunk.
+
+        Active chunk is sealed before it is popped, so that the buffer always
+         has one.
+
+        Args:
+            pop (bool): Remove the chunk from the buffer.
+
+        Returns:
+            MemoryChunk: The chunk, or None if no data in memory.
+        """
+        with self.lock:
+            for idx, chunk in enumerate(self.chunks):
+                if isinstance(chunk, MemoryChunk) and not chunk.empty():
+                    break
+            else:
+                return None
+            if pop:
+                if chunk is self.active_chunk:
+                    self.chunking()
+                del self.chunks[idx]
+            return chunk
+
+    def _discard(self, chunk):
+        """Discard a popped memory chunk."""
+        self.cnt_dropped += chunk.num_record
+        size = chunk.bytesize
+        with self.lock:
+            self.flushed(chunk)
+        self.budget.release(size)
+        if self.chunk_pool is not None:
+            self.chunk_pool.release(chunk)
+
+    def _spill(self, chunk):
+        """Move a popped memory chunk to a file in place of it.
+
+        The file chunk goes back to the head, as popped chunk is the oldest
+         in memory and chunks before it are on disk already.
+        """
+        fname = chunk_file_name(self.spill_seq, self.binary)
+        self.spill_seq += 1
+        disk_chunk = DiskChunk(self.binary, os.path.join(self.spill, fname))
+        disk_chunk.seq = chunk.seq
+        if self.binary:
+            disk_chunk.concat(memoryview(chunk.bulk)[:chunk.bytesize],
+                              chunk.bytesize)
+            disk_chunk.num_record = chunk.num_record
+        else:
+            for data in chunk.bulk:
+                bytedata = data if isinstance(data, (bytes, bytearray)) else\
+                    data.encode('utf8')
+                disk_chunk.concat(bytedata, len(bytedata))
+        disk_chunk.close()
+        with self.lock:
+            spilled = [ch for ch in self.chunks if isinstance(ch, DiskChunk)]
+            self.chunks.rotate(-len(spilled))
+            self.chunks.appendleft(disk_chunk)
+            self.chunks.rotate(len(spilled))
+        self.cnt_spilled += 1
+        size = chunk.bytesize
+        self.budget.release(size)
+        if self.chunk_pool is not None:
+            self.chunk_pool.release(chunk)
+
+    def may_flushing(self, last_flush_interval=None):
+        """Flushing if needed, syncing the journal on its interval.
+
+        Args:
+            last_flush_interval (float): Force flushing interval when input
+              is terminated.
+
+        Returns:
+            Chunk: Chunk created after flushing.
+        """
+        if self.journal is not None:
+            with self.lock:
+                self.journal.may_sync()
+        return super(MemoryBuffer, self).may_flushing(last_flush_interval)
+
     def need_chunking(self, adding_size):
         """Need new chunk or not.
 
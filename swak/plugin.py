@@ -9,15 +9,22 @@ import types
 import time
 from queue import Empty, Full
 
+from six import binary_type, get_unbound_function
+
 from swak.config import get_exe_dir
 from swak.exception import UnsupportedPython
 from swak.const import PLUGINDIR_PREFIX
 from swak.formatter import StdoutFormatter
 from swak.util import get_plugin_module_name, stop_iter_when_signalled
-from swak.data import OneDataStream
+from swak.data import MultiDataStream, RawDataStream, estimate_size
 
 
 PUT_WAIT_TIME = 1.0
+DEFAULT_BATCH_MAX_RECORD = 1000
+DEFAULT_BATCH_MAX_SIZE = None
+DEFAULT_BATCH_MAX_WAIT = 1.0
+# Marks batch thresholds not given to ``Input.set_batch``.
+KEEP_BATCH = object()
 PREFIX = ['i', 'p', 'm', 'o']
 
 PluginInfo = namedtuple('PluginInfo', ['fname', 'pname', 'dname', 'cname',
@@ -99,6 +106,10 @@ class Input(Plugin):
         super(Input, self).__init__()
         self.encoding = None
         self.proxy = False
+        self.batch_max_record = DEFAULT_BATCH_MAX_RECORD
+        self.batch_max_size = DEFAULT_BATCH_MAX_SIZE
+        self.batch_max_wait = DEFAULT_BATCH_MAX_WAIT
+        self.stream_pool = None
 
     def read(self, stop_event):
         """Generate data stream.
@@ -126,7 +137,21 @@ class Input(Plugin):
     def generate_stream(self, gen_data, stop_event):
         """Generate data stream from data generator.
 
-        Inefficient default implementation.
+        Collect data into a ``MultiDataStream`` batch and yield it when one of
+         the following thresholds is reached:
+
+        - ``batch_max_record``: number of records in the batch.
+        - ``batch_max_size``: estimated byte size of the batch.
+        - ``batch_max_wait``: seconds since the first data of the batch.
+
+        The batch is also yielded as soon as the generator yields blank data,
+         which means the source is idle, so batches adapt to the input rate
+         without adding latency. Stop event is checked once per batch, and
+         whenever the generator yields blank data under blocking situations.
+
+        Thresholds are checked only when the generator yields, so a source
+         blocking without yielding blank data holds its partial batch until
+         the next data. Such a source must yield blank data when it waits.
 
         Args:
             gen_data (function): Data generator function.
@@ -136,15 +161,91 @@ class Input(Plugin):
             tuple: (tag, DataStream)
         """
         logging.debug("Input.generate_stream gen_data {}".format(gen_data))
+        max_record = self.batch_max_record
+        max_size = self.batch_max_size
+        max_wait = self.batch_max_wait
+        batch = self.new_stream()
+        times, records = batch.times, batch.records
+        size = 0
+        first_time = None
         for utime, data in gen_data(stop_event):
+            if len(data) > 0:
+                if len(times) == 0:
+                    first_time = time.time()
+                times.append(utime)
+                records.append(data)
+                if max_size is not None:
+                    size += estimate_size(data)
+                if len(times) < max_record and\
+                        (max_size is None or size < max_size) and\
+                        (max_wait is None or
+                         time.time() - first_time < max_wait):
+                    continue
             # Omit blank data that would have been generated under
             #  inappropriate input conditions.
-            if len(data) == 0:
+            elif len(times) == 0:
+                if _is_signalled(stop_event):
+                    break
                 continue
-            logging.warning("yield inefficient OneDataStream from {}. "
-                            "Implement optimized generate_stream!.".
-                            format(self))
-            yield self.tag, OneDataStream(utime, data)
+            # Otherwise the source is idle, so yield the batch so far.
+
+            yield self.tag, self.make_stream(batch)
+            batch = self.new_stream()
+            times, records = batch.times, batch.records
+            size = 0
+            if _is_signalled(stop_event):
+                break
+
+        # yield remain data
+        if len(times) > 0:
+            yield self.tag, self.make_stream(batch)
+
+    def set_stream_pool(self, stream_pool):
+        """Set pool to recycle batch streams.
+
+        Args:
+            stream_pool (ObjectPool): Pool made by ``make_stream_pool``.
+        """
+        self.stream_pool = stream_pool
+
+    def new_stream(self):
+        """Return an empty MultiDataStream to collect a batch."""
+        if self.stream_pool is not None:
+            return self.stream_pool.acquire()
+        return MultiDataStream()
+
+    def make_stream(self, batch):
+        """Make a data stream to yield for a collected batch.
+
+        Args:
+            batch (MultiDataStream): Collected batch.
+
+        Returns:
+            DataStream
+        """
+        return batch
+
+    def set_batch(self, max_record=KEEP_BATCH, max_size=KEEP_BATCH,
+                  max_wait=KEEP_BATCH):
+        """Set batch thresholds for generating data stream.
+
+        Thresholds not given are kept.
+
+        Args:
+            max_record (int): Maximum records per batch.
+            max_size (int): Maximum estimated bytes per batch. None for no
+              limit.
+            max_wait (float): Maximum seconds to hold a batch. None for no
+              limit.
+        """
+        if max_record is not KEEP_BATCH:
+            assert max_record is not None and max_record > 0,\
+                "max_record must be greater than 0."
+            self.batch_max_record = max_record
+        if max_size is not KEEP_BATCH:
+            self.batch_max_size = max_size
+        if max_wait is not KEEP_BATCH:
+            self.batch_max_wait = max_wait
 
 
 class ProxyInput(Input):
@@ -158,6 +259,15 @@ class ProxyInput(Input):
         super(ProxyInput, self).__init__()
         self.recv_queues = {}
         self.proxy = True
+        self.budget = None
+
+    def set_budget(self, budget):
+        """Set memory budget to release received data streams from.
+
+        Args:
+            budget (MemoryBudget): Memory budget shared by the agent.
+        """
+        self.budget = budget
 
     def append_recv_queue(self, tag, queue):
         """Append receive queue.
@@ -176,6 +286,9 @@ class ProxyInput(Input):
         Note: Yield (None, None) tuple if the queue is empty to give agent a
          chance to flush,
 
+        Streams are yielded with the tag they were emitted with, which may
+         differ from the queue's, e.g. records diverted by a quota.
+
         Args:
             gen_data: Data generator.
             stop_event (threading.Event): Stop event.
@@ -185,17 +298,19 @@ class ProxyInput(Input):
         """
         while True:
             # Loop each receive queue
-            for tag, queue in self.recv_queues.items():
+            for queue in self.recv_queues.values():
                 while True:
                     try:
                         stop_iter_when_signalled(stop_event)
-                        ds = queue.get_nowait()
+                        tag, ds, size = queue.get_nowait()
                     except Empty:
                         # Give a chance to flush.
                         yield None, None
                         # Process next queue
                         break
                     else:
+                        if size > 0:
+                            self.budget.release(size)
                         logging.debug("yield ds")
                         yield tag, ds
 
@@ -225,7 +340,6 @@ class RecordInput(Input):
         """
         logging.debug("RecordInput.generate_data")
         for record in self.generate_record():
-            stop_iter_when_signalled(stop_event)
             yield time.time(), record
 
     def generate_record(self):
@@ -236,7 +350,7 @@ class RecordInput(Input):
          blocking situations.
 
         Note: When operating synchronously, flushing with time interval does
-         not work.
+         not work, and a partial batch is held until the next data.
 
         Yields:
             dict: A record.
@@ -261,6 +375,7 @@ class TextInput(Input):
         self.parser = None
         self.filter_fn = None
         self.encoding = None
+        self.lazy = False
 
     def set_encoding(self, encoding):
         """Set encoding of input source.
@@ -274,10 +389,22 @@ class TextInput(Input):
         """Set parser for this TextInput plugin."""
         self.parser = parser
 
+    def set_lazy(self, lazy):
+        """Set lazy decoding of lines.
+
+        When lazy, lines are emitted as ``RawDataStream`` and decoded & parsed
+         only when a record is accessed.
+
+        Args:
+            lazy (bool): Decode lazily or not.
+        """
+        self.lazy = lazy
+
     def generate_data(self, stop_event):
         """Generate data by reading lines from the source.
 
-        If explicit encoding, filter & parser exist, apply them.
+        If explicit encoding, filter & parser exist, apply them. In lazy mode,
+         only the filter is applied and raw lines are generated.
 
         Args:
             stop_event (threading.Event): Stop event
@@ -285,9 +412,12 @@ class TextInput(Input):
         Yields:
             tuple: time, data
         """
-        for line in self.generate_line():
-            stop_iter_when_signalled(stop_event)
+        if self.lazy:
+            for tdata in self._generate_raw_data():
+                yield tdata
+            return
 
+        for line in self.generate_line():
             if self.encoding is not None:
                 line = line.decode(self.encoding)
             # Test by filter function
@@ -300,6 +430,48 @@ class TextInput(Input):
                 data = line
             yield time.time(), data
 
+    def _generate_raw_data(self):
+        """Generate raw lines as bytes for lazy decoding."""
+        for line in self.generate_line():
+            if self.filter_fn is not None and len(line) > 0:
+                text = line.decode(self.encoding) if self.encoding is not\
+                    None else line
+                if not self.filter_fn(text):
+                    continue
+            if not isinstance(line, binary_type):
+                line = line.encode('utf8')
+            yield time.time(), line
+
+    def decode_line(self, raw):
+        """Decode and parse a raw line.
+
+        Args:
+            raw (memoryview): Raw line.
+
+        Returns:
+            Parsed record if parser exists, decoded line otherwise.
+        """
+        line = raw.tobytes().decode(self.encoding or 'utf8')
+        if self.parser is not None:
+            return self.parser.parse(line)
+        return line
+
+    def make_stream(self, batch):
+        """Make a data stream to yield for a collected batch.
+
+        Args:
+            batch (MultiDataStream): Collected batch.
+
+        Returns:
+            DataStream
+        """
+        if not self.lazy:
+            return batch
+        ds = RawDataStream(self.decode_line, batch.times, batch.records)
+        if self.stream_pool is not None:
+            self.stream_pool.release(batch)
+        return ds
+
     def generate_line(self):
         """Generate lines.
 
@@ -308,7 +480,7 @@ class TextInput(Input):
          blocking situations.
 
         Note: When operating synchronously, flushing with time interval does
-         not work.
+         not work, and a partial batch is held until the next data.
 
         Yields:
             str: A text line.
@@ -326,8 +498,21 @@ class Parser(Plugin):
     Following methods should be implemented:
         execute
 
+    A parser can skip extracting or converting fields not in ``fields``, as
+     the pipeline does not use them.
     """
 
+    fields = None
+
+    def set_fields(self, fields):
+        """Set record fields the pipeline uses.
+
+        Args:
+            fields (set): Field names, or None for all fields.
+        """
+        logging.info("Parser.set_fields {}".format(fields))
+        self.fields = fields
+
     def parse(self, line):
         """Parse.
 
@@ -339,14 +524,89 @@ class Parser(Plugin):
         """
         raise NotImplementedError()
 
+    def raw_field(self, key):
+        """Return a function to get a field from a line without parsing.
+
+        A parser which knows where a field is in a line can implement this,
+         so that filters can test lines before they are parsed.
+
+        Args:
+            key (str): Field name.
+
+        Returns:
+            function: ``get(line)`` which returns the field value as parsed,
+              or None if the line does not have it. None if the field can not
+              be located.
+        """
+        return None
+
 
 class Modifier(Plugin):
     """Base class for modify plugin.
 
     Following methods should be implemented:
         modify
+
+    A modifier can also implement ``modify_stream`` to process a whole
+     stream in one call.
+
+    A modifier marked ``parallel`` can be run in worker processes, so it
+     should be picklable and keep no state between streams.
+
+    A ``commutative`` modifier can be reordered with adjacent commutative
+     modifiers, if their fields from ``read_fields`` and ``write_fields`` do
+     not conflict.
     """
 
+    parallel = False
+    commutative = False
+
+    def set_parallel(self, parallel):
+        """Mark to run in worker processes or not."""
+        self.parallel = parallel
+
+    def read_fields(self):
+        """Return record fields the modifier reads.
+
+        Returns:
+            set: Field names, or None if unknown.
+        """
+        return None
+
+    def write_fields(self):
+        """Return record fields the modifier writes or deletes.
+
+        Returns:
+            set: Field names, or None if unknown.
+        """
+        return None
+
+    def delete_fields(self):
+        """Return record fields whose values the modifier always discards.
+
+        Fields which are overwritten or deleted in every record need not be
+         parsed, unless the modifier reads them.
+
+        Returns:
+            set: Field names, or None if unknown.
+        """
+        return None
+
+    def line_filter(self, parser):
+        """Return a function to drop lines before parsing.
+
+        The function must pass every line whose record this modifier keeps.
+
+        Args:
+            parser (Parser): Parser of the lines, or None if the input has no
+              parser.
+
+        Returns:
+            function: ``test(line)`` which returns False to drop the line, or
+              None if the modifier can not test lines.
+        """
+        return None
+
     def prepare_for_stream(self, tag, ds):
         """Prepare to modify data stream.
 
@@ -374,6 +634,27 @@ class Modifier(Plugin):
         """
         raise NotImplementedError()
 
+    def modify_stream(self, tag, ds):
+        """Modify a data stream at once.
+
+        The default implementation applies ``modify`` to each record.
+
+        Args:
+            tag (str): data tag
+            ds (DataStream): data stream
+
+        Returns:
+            DataStream: Modified stream, which can be ``ds`` itself or a
+              selection of it.
+        """
+        modified = MultiDataStream()
+        for utime, record in ds:
+            result = self.modify(tag, utime, record)
+            if result is not None:
+                modified.times.append(result[0])
+                modified.records.append(result[1])
+        return modified
+
 
 class Output(Plugin):
     """Base class for output plugin.
@@ -404,6 +685,8 @@ class Output(Plugin):
             logging.info("need flushing at shutdown for {} buffer {}".
                          format(self, self.buffer))
             self.flush(True)
+        if self.buffer is not None:
+            self.buffer.shutdown()
 
     def flush(self, flush_all=False):
         """Flushing buffer.
@@ -415,6 +698,31 @@ class Output(Plugin):
             logging.debug("Output.flush")
             self.buffer.flushing(flush_all)
 
+    def needed_fields(self, tag):
+        """Return record fields the formatter emits.
+
+        Args:
+            tag (str): Data tag.
+
+        Returns:
+            set: Field names, or None for all fields.
+        """
+        if self.formatter is None:
+            return None
+        return self.formatter.emit_fields()
+
+    def fileno(self):
+        """Return a file descriptor to send binary disk chunks directly.
+
+        An output which writes to a file or socket can return its descriptor,
+         so that disk chunks are sent with ``os.sendfile`` without reading
+         them.
+
+        Returns:
+            int: File descriptor, or None to write bulks.
+        """
+        return None
+
     def set_buffer(self, buffer):
         """Set output bufer."""
         self.buffer = buffer
@@ -441,14 +749,60 @@ class Output(Plugin):
             int: Adding size of the stream.
         """
         logging.debug("Output.handle_stream")
+        if self.formatter.raw and self.buffer is not None and\
+                self.buffer.binary and isinstance(ds, RawDataStream) and\
+                not ds.materialized:
+            return self._emit_raw_stream(tag, ds)
+
+        return self.emit_formatted(self.format_stream(tag, ds))
+
+    def format_stream(self, tag, ds):
+        """Format records of a data stream.
+
+        Args:
+            tag (str): Data tag.
+            ds (datatream): Data stream.
+
+        Returns:
+            list: Formatted records.
+        """
+        formatter = self.formatter
+        return [formatter.format(tag, formatter.timestamp_to_datetime(utime),
+                                 record) for utime, record in ds]
+
+    def emit_formatted(self, formatted, binary_data=False):
+        """Emit formatted records to the buffer or directly to output target.
+
+        Args:
+            formatted (list): Formatted records.
+            binary_data (bool): Whether records are already binarized or not.
+
+        Returns:
+            int: Adding size of the records.
+        """
         adding_size = 0
-        for utime, record in ds:
-            dtime = self.formatter.timestamp_to_datetime(utime)
-            formatted = self.formatter.format(tag, dtime, record)
+        for data in formatted:
             if self.buffer is not None:
-                adding_size += self.buffer.append(formatted)
+                adding_size += self.buffer.append(data, binary_data)
             else:
-                self.write(formatted)
+                self.write(data)
+        return adding_size
+
+    def _emit_raw_stream(self, tag, ds):
+        """Copy raw lines of a stream into binary buffer without decoding.
+
+        Args:
+            tag (str): Data tag.
+            ds (RawDataStream): Data stream.
+
+        Returns:
+            int: Adding size of the stream.
+        """
+        logging.debug("Output._emit_raw_stream")
+        adding_size = 0
+        for utime, raw in ds.iter_raw():
+            formatted = self.formatter.format_raw(tag, utime, raw)
+            adding_size += self.buffer.append(formatted, True)
         return adding_size
 
     def write(self, bulk):
@@ -519,6 +873,43 @@ class ProxyOutput(Plugin):
         self.send_queue = queue
         logging.debug("ProxyOutput queue {}".format(queue))
         self.proxy = True
+        self.budget = None
+        self.receivers = []
+
+    def set_budget(self, budget):
+        """Set memory budget to account queued data streams against.
+
+        Args:
+            budget (MemoryBudget): Memory budget shared by the agent.
+        """
+        self.budget = budget
+
+    def add_receiver(self, router):
+        """Add the router of an output thread receiving the data streams.
+
+        Args:
+            router (DataRouter): Router of the output thread.
+        """
+        self.receivers.append(router)
+
+    def needed_fields(self, tag):
+        """Return record fields the receiving threads use for a tag.
+
+        Args:
+            tag (str): Data tag.
+
+        Returns:
+            set: Field names, or None for all fields.
+        """
+        if len(self.receivers) == 0:
+            return None
+        fields = set()
+        for router in self.receivers:
+            rfields = router.needed_fields(tag)
+            if rfields is None:
+                return None
+            fields |= rfields
+        return fields
 
     def emit_stream(self, tag, ds, stop_event):
         """Emit data stream to inter-thread queue.
@@ -532,15 +923,23 @@ class ProxyOutput(Plugin):
         # Put data stream to the queue, block if necessary.
         st = time.time()
 
+        size = 0
+        if self.budget is not None:
+            size = sum(estimate_size(record) for _, record in ds)
+            if not self._acquire(size, stop_event):
+                return
+
         while True:
             try:
-                self.send_queue.put(ds, True, PUT_WAIT_TIME)
+                self.send_queue.put((tag, ds, size), True, PUT_WAIT_TIME)
             except Full:
                 logging.info(" queue full!")
                 if stop_event is not None:
                     if stop_event.wait(0.0):
                         logging.info(" stop_event triggered!")
                         # stop event triggered. exit.
+                        if size > 0:
+                            self.budget.release(size)
                         return
             else:
                 break
@@ -549,10 +948,201 @@ class ProxyOutput(Plugin):
         logging.debug("ProxyOutput.emit_events - queue put latency {:.2f}".
                       format(latency))
 
+    def _acquire(self, size, stop_event):
+        """Wait until the memory budget has room for a data stream.
+
+        A data stream is admitted over the budget if the queue is empty, as
+         the receiving thread has nothing to release then.
+
+        Args:
+            size (int): Estimated bytes of the data stream.
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            bool: False if stopped while waiting.
+        """
+        while not self.budget.try_acquire(size):
+            if self.send_queue.empty():
+                self.budget.force(size)
+                break
+            if stop_event is not None and stop_event.is_set():
+                return False
+            self.budget.wait()
+        return True
+
+
+class CopyOutput(Plugin):
+    """Output which copies data streams to multiple branches.
+
+    A branch is a pipeline of zero or more modifiers and an output. Branches
+     without modifiers share the stream, and the ones whose formatters have
+     the same config share formatted records too. Branches with modifiers
+     get their own copy of the stream, except the last one.
+    """
+
+    def __init__(self, branches):
+        """Init.
+
+        Args:
+            branches (list): Pipelines to copy streams into.
+        """
+        super(CopyOutput, self).__init__()
+        assert len(branches) > 0, "No branches to copy."
+        self.branches = branches
+        self.proxy = False
+
+    def needed_fields(self, tag):
+        """Return record fields any branch uses.
+
+        Args:
+            tag (str): Data tag.
+
+        Returns:
+            set: Field names, or None for all fields.
+        """
+        fields = set()
+        for branch in self.branches:
+            bfields = branch.needed_fields(tag)
+            if bfields is None:
+                return None
+            fields |= bfields
+        return fields
+
+    def emit_stream(self, tag, ds, stop_event):
+        """Emit data stream to all branches.
+
+        Args:
+            tag (str): Data tag.
+            ds (datatream): Data stream.
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            int: Adding size of the stream.
+        """
+        logging.debug("CopyOutput.emit_stream")
+        adding_size = 0
+        shared = {}
+        # Emit to branches sharing the stream first, as modifiers of other
+        #  branches can change records in place.
+        modifying = []
+        for branch in self.branches:
+            # Labelled sub-pipelines can modify records too.
+            if len(branch.modifiers) > 0 or\
+                    isinstance(branch.output, LabelOutput):
+                modifying.append(branch)
+            else:
+                adding_size += self._emit_shared(tag, ds, branch.output,
+                                                 shared, stop_event)
+
+        last = len(modifying) - 1
+        for i, branch in enumerate(modifying):
+            bds = ds if i == last else ds.copy()
+            modified = branch.modify_stream(tag, bds)
+            adding_size += branch.output.emit_stream(tag, modified,
+                                                     stop_event)
+        return adding_size
+
+    def _emit_shared(self, tag, ds, output, shared, stop_event):
+        """Emit data stream with formatted records shared between outputs.
+
+        Args:
+            tag (str): Data tag.
+            ds (datatream): Data stream.
+            output (Output): Output to emit.
+            shared (dict): Formatted records by formatter config.
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            int: Adding size of the stream.
+        """
+        buf = output.buffer
+        if output.formatter.raw and isinstance(ds, RawDataStream) and\
+                not ds.materialized:
+            return output.emit_stream(tag, ds, stop_event)
+
+        binary = buf is not None and buf.binary
+        key = (output.formatter.config_key, binary)
+        if key not in shared:
+            formatted = output.format_stream(tag, ds)
+            if binary:
+                formatted = [data.encode('utf8') if
+                             not isinstance(data, binary_type) else data
+                             for data in formatted]
+            shared[key] = formatted
+        return output.emit_formatted(shared[key], binary)
+
+
+class LabelOutput(Plugin):
+    """Output which jumps data streams to a labelled sub-pipeline.
+
+    The sub-pipeline is bound at config time, so streams skip tag matching.
+    """
+
+    def __init__(self, label, pipeline):
+        """Init.
+
+        Args:
+            label (str): Label name.
+            pipeline (Pipeline): Labelled sub-pipeline.
+        """
+        super(LabelOutput, self).__init__()
+        self.label = label
+        self.pipeline = pipeline
+        self.proxy = False
+
+    def needed_fields(self, tag):
+        """Return record fields the sub-pipeline uses."""
+        return self.pipeline.needed_fields(tag)
+
+    def emit_stream(self, tag, ds, stop_event):
+        """Emit data stream to the sub-pipeline.
+
+        Args:
+            tag (str): Data tag.
+            ds (datatream): Data stream.
+            stop_event (threading.Event): Stop event.
+
+        Returns:
+            int: Adding size of the stream.
+        """
+        logging.debug("LabelOutput.emit_stream label '{}'".format(self.label))
+        return self.pipeline.emit_stream(tag, ds, stop_event)
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<LabelOutput label '{}'>".format(self.label)
+
+
+def _is_signalled(stop_event):
+    """Return True if stop event is given and signalled."""
+    return stop_event is not None and stop_event.is_set()
+
 
 def is_kind_of_output(plugin):
     """Return True if given plugin is Output or ProxyOutput."""
-    return isinstance(plugin, Output) or isinstance(plugin, ProxyOutput)
+    return isinstance(plugin, Output) or isinstance(plugin, ProxyOutput) or\
+        isinstance(plugin, CopyOutput) or isinstance(plugin, LabelOutput)
+
+
+def is_commutative(mod1, mod2):
+    """Return True if two modifiers can be applied in any order.
+
+    Both modifiers must be commutative, and neither writes a field the
+     other reads or writes.
+    """
+    if not mod1.commutative or not mod2.commutative:
+        return False
+    reads1, writes1 = mod1.read_fields(), mod1.write_fields()
+    reads2, writes2 = mod2.read_fields(), mod2.write_fields()
+    if None in (reads1, writes1, reads2, writes2):
+        return False
+    return not (writes1 & (reads2 | writes2)) and not (writes2 & reads1)
+
+
+def is_batch_modifier(modifier):
+    """Return True if given modifier implements ``modify_stream``."""
+    return get_unbound_function(type(modifier).modify_stream) is not\
+        get_unbound_function(Modifier.modify_stream)
 
 
 BASE_CLASS_MAP = {
@@ -903,4 +1493,6 @@ def create_plugin_by_name(plugin_name, args):
                                  format(plugin_name))
         else:
             mod = sys.modules[path]
-            return mod.main(args=args, standalone_mode=False)
+            plugin = mod.main(args=args, standalone_mode=False)
+            plugin.fullname = plugin_name
+            return plugin
@@ -2,8 +2,12 @@
 
 import logging
 
-from swak.datarouter import DataRouter
-from swak.plugin import create_plugin_by_name, Input, Output, ProxyInput
+from swak.datarouter import DataRouter, Pipeline
+from swak.plugin import create_plugin_by_name, Input, Output, ProxyInput,\
+    ProxyOutput, Modifier, CopyOutput, LabelOutput, TextInput,\
+    is_kind_of_output, is_commutative
+from swak.data import MultiDataStream
+from swak.exception import ConfigError
 
 
 MAX_BUFFER_RECORD = 10
@@ -25,6 +29,9 @@ class PluginPod(object):
         self.router = router
         self.plugins = []
         self.type = None
+        self.label_cmds = {}
+        self.labels = {}
+        self.stream_pool = None
 
     def register_plugin(self, tag, plugin, insert_first=False):
         """Register a plugin by data tag pattern.
@@ -44,6 +51,86 @@ class PluginPod(object):
             self.plugins.append(plugin)
         self.router.add_rule(tag, plugin, insert_first)
 
+    def unregister_plugin(self, plugin):
+        """Unregister a plugin and remove its rules from the router.
+
+        The plugin is not stopped or shut down.
+
+        Args:
+            plugin: Plugin to unregister.
+        """
+        logging.info("unregister_plugin - pod name '{}' plugin '{}'".
+                     format(self.name, plugin))
+        self.plugins.remove(plugin)
+        self.router.remove_rule(plugin)
+
+    def set_labels(self, label_cmds):
+        """Set commands of labelled sub-pipelines.
+
+        Sub-pipelines are built when a command jumps to their label.
+
+        Args:
+            label_cmds (dict): Seperated plugin commands list by label.
+        """
+        self.label_cmds = label_cmds
+
+    def create_plugin(self, cmd):
+        """Create a plugin or a jump to labelled sub-pipeline by command.
+
+        Args:
+            cmd (list): Plugin name and arguments, or ``label`` and name.
+
+        Returns:
+            Plugin
+        """
+        if cmd[0] == 'label':
+            if len(cmd) != 2:
+                raise ConfigError("label command must have one label name.")
+            return self.label_output(cmd[1])
+        return create_plugin_by_name(cmd[0], cmd[1:])
+
+    def label_output(self, label, jumping=()):
+        """Return output to a labelled sub-pipeline, building it if needed.
+
+        Each label is built once per pod, and shared by jumps to it.
+
+        Args:
+            label (str): Label name.
+            jumping (tuple): Labels jumping to this label, to detect loops.
+
+        Returns:
+            LabelOutput
+        """
+        if label in self.labels:
+            return self.labels[label]
+        if label in jumping:
+            raise ConfigError("label '{}' jumps to itself.".format(label))
+        if label not in self.label_cmds:
+            raise ConfigError("label '{}' is not defined.".format(label))
+
+        logging.info("label_output - build label '{}'".format(label))
+        pipeline = Pipeline(label)
+        for cmd in self.label_cmds[label]:
+            if cmd[0] == 'label':
+                plugin = self.label_output(cmd[1], jumping + (label,))
+            else:
+                plugin = create_plugin_by_name(cmd[0], cmd[1:])
+                plugin.set_tag(label)
+                self.plugins.append(plugin)
+            if isinstance(plugin, Modifier):
+                pipeline.add_modifier(plugin)
+            elif is_kind_of_output(plugin):
+                pipeline.set_output(plugin)
+            else:
+                raise ConfigError("label can only have modifier or output "
+                                  "plugins.")
+        if pipeline.output is None:
+            raise ConfigError("label '{}' must ends with output plugin or "
+                              "label command.".format(label))
+        pipeline.compile()
+        output = self.labels[label] = LabelOutput(label, pipeline)
+        return output
+
     def init_from_commands(self, tag, cmds):
         """Init agent from plugin commands.
 
@@ -60,17 +147,102 @@ class PluginPod(object):
         assert getattr(cmds, '__iter__') is not None
         last_idx = len(cmds) - 1
         for i, cmd in enumerate(cmds):
-            args = cmd[1:]
             pname = cmd[0]
             if pname == 'tag':
                 assert i == last_idx
                 break
-            plugin = create_plugin_by_name(pname, args)
+            plugin = self.create_plugin(cmd)
             self.register_plugin(tag, plugin)
             if i == 0 and isinstance(plugin, Input):
                 input_pl = plugin
         return input_pl
 
+    def init_copy_from_commands(self, tag, branches):
+        """Init a copying output from plugin commands of branches.
+
+        Args:
+            tag (str): data tag.
+            branches (list): Seperated plugin commands list for each branch.
+
+        Returns:
+            CopyOutput
+        """
+        logging.info("init_copy_from_commands")
+        pipelines = []
+        for cmds in branches:
+            pipeline = Pipeline(tag)
+            for cmd in cmds:
+                plugin = self.create_plugin(cmd)
+                if isinstance(plugin, Modifier):
+                    pipeline.add_modifier(plugin)
+                elif isinstance(plugin, (Output, LabelOutput)):
+                    pipeline.set_output(plugin)
+                else:
+                    raise ConfigError("Copying match can only have modifier "
+                                      "or output plugins.")
+                if isinstance(plugin, LabelOutput):
+                    continue
+                plugin.set_tag(tag)
+                assert plugin not in self.plugins
+                self.plugins.append(plugin)
+            if pipeline.output is None:
+                raise ConfigError("Copying match must ends with output "
+                                  "plugin.")
+            pipeline.compile()
+            pipelines.append(pipeline)
+
+        copy_output = CopyOutput(pipelines)
+        self.register_plugin(tag, copy_output)
+        return copy_output
+
+    def init_route_from_commands(self, tag, routes):
+        """Init outputs which route records by field predicates.
+
+        A route with modifiers is run as a one branch ``CopyOutput``.
+
+        Args:
+            tag (str): data tag.
+            routes (list): List of (field predicates, seperated plugin
+              commands list) tuple. Predicates of the fallback route are
+              None.
+        """
+        logging.info("init_route_from_commands")
+        fallback = None
+        for where, cmds in routes:
+            plugins = [self.create_plugin(cmd) for cmd in cmds]
+            if len(plugins) == 1 and isinstance(plugins[0], (Output,
+                                                             LabelOutput)):
+                output = plugins[0]
+            else:
+                pipeline = Pipeline(tag)
+                for plugin in plugins:
+                    if isinstance(plugin, Modifier):
+                        pipeline.add_modifier(plugin)
+                    elif isinstance(plugin, (Output, LabelOutput)):
+                        pipeline.set_output(plugin)
+                    else:
+                        raise ConfigError("Routing match can only have "
+                                          "modifier or output plugins.")
+                    if not isinstance(plugin, LabelOutput):
+                        plugin.set_tag(tag)
+                        self.plugins.append(plugin)
+                if pipeline.output is None:
+                    raise ConfigError("Routing match must ends with output "
+                                      "plugin.")
+                pipeline.compile()
+                output = CopyOutput([pipeline])
+            if where is None:
+                if fallback is not None:
+                    raise ConfigError("Routing match can have only one route "
+                                      "without predicates.")
+                fallback = output
+                continue
+            if not isinstance(output, LabelOutput):
+                self.plugins.append(output)
+            self.router.add_rule(tag, output, False, where)
+        if fallback is not None:
+            self.register_plugin(tag, fallback)
+
     def iter_plugins(self):
         """Iterate all plugins in the agent.
 
@@ -96,9 +268,104 @@ class PluginPod(object):
             if isinstance(plugin, Output):
                 yield plugin
 
+    def set_pools(self, stream_pool, chunk_pools):
+        """Set object pools for streams and chunks.
+
+        Args:
+            stream_pool (ObjectPool): Pool to recycle data streams.
+            chunk_pools (dict): Pool to recycle memory chunks by whether
+              binary or not.
+        """
+        logging.info("set_pools - pod name '{}'".format(self.name))
+        self.router.set_stream_pool(stream_pool)
+        # Streams queued to other threads are owned by the receiving pod.
+        if not any(isinstance(plugin, ProxyOutput) for plugin in
+                   self.iter_plugins()):
+            self.stream_pool = stream_pool
+        for plugin in self.iter_plugins():
+            if isinstance(plugin, Input):
+                plugin.set_stream_pool(stream_pool)
+            elif isinstance(plugin, Output):
+                buf = plugin.buffer
+                if buf is not None and buf.memory:
+                    buf.set_chunk_pool(chunk_pools[buf.binary])
+
+    def push_down_filters(self):
+        """Push filters down to the text input to drop lines before parsing.
+
+        A modifier's line filter is pushed if the modifier commutes with all
+         modifiers before it. The modifier stays in the pipeline. Filters
+         which need no parser, like whole line excludes, are pushed even if
+         the input has no parser.
+
+        Returns:
+            int: Number of pushed filters.
+        """
+        if len(self.plugins) == 0 or not isinstance(self.plugins[0],
+                                                    TextInput):
+            return 0
+        tinput = self.plugins[0]
+        tests = []
+        preceding = []
+        for plugin in self.plugins[1:]:
+            if not isinstance(plugin, Modifier):
+                break
+            if all(is_commutative(prev, plugin) for prev in preceding):
+                test = plugin.line_filter(tinput.parser)
+                if test is not None:
+                    logging.info("push_down_filters - pod name '{}' "
+                                 "modifier {}".format(self.name, plugin))
+                    tests.append(test)
+            preceding.append(plugin)
+        pushed = len(tests)
+        if pushed == 0:
+            return 0
+
+        if tinput.filter_fn is not None:
+            tests.insert(0, tinput.filter_fn)
+
+        def filter_fn(line):
+            for test in tests:
+                if not test(line):
+                    return False
+            return True
+        tinput.set_filter_func(filter_fn)
+        return pushed
+
+    def project_fields(self):
+        """Tell the parser of the text input which fields the pipeline uses.
+
+        Data streams sent by a proxy output are projected to the fields the
+         receiving output threads use for the tag. This is called again
+         whenever rules of those routers are changed.
+
+        Returns:
+            set: Field names, or None for all fields.
+        """
+        if len(self.plugins) == 0 or not isinstance(self.plugins[0],
+                                                    TextInput):
+            return None
+        tinput = self.plugins[0]
+        if tinput.parser is None:
+            return None
+        fields = self.router.needed_fields(tinput.tag)
+        if fields != tinput.parser.fields:
+            logging.info("project_fields - pod name '{}' fields {}".
+                         format(self.name, fields and sorted(fields)))
+            tinput.parser.set_fields(fields)
+        return fields
+
     def start(self):
         """Start plugins in the router."""
         logging.info("starting all plugins")
+        self.push_down_filters()
+        routers = [self.router]
+        for plugin in self.iter_plugins():
+            if isinstance(plugin, ProxyOutput):
+                routers += plugin.receivers
+        for router in routers:
+            router.add_rule_callback(self.project_fields)
+        self.project_fields()
         for plugin in self.iter_plugins():
             plugin.start()
 
@@ -163,12 +430,22 @@ class PluginPod(object):
             #  aggregated thread model.
             if not(tag is None or ds.empty()):
                 self.router.emit_stream(tag, ds, stop_event)
+                self.release_stream(ds)
             # Need to check for flushing even if there is no data
             self.may_flushing()
         logging.info("stop event received")
         self.stop()
         self.shutdown()
 
+    def release_stream(self, ds):
+        """Recycle a data stream read from the input, once it is emitted.
+
+        Args:
+            ds (DataStream): Data stream emitted through the router.
+        """
+        if self.stream_pool is not None and type(ds) is MultiDataStream:
+            self.stream_pool.release(ds)
+
     def simple_process(self, input_pl):
         """Read from input and emit through router.
 
@@ -180,7 +457,8 @@ class PluginPod(object):
         ainput = input_pl if input_pl is not None else self.input
         for tag, ds in ainput.read(None):
             if not ds.empty():
-                self.router.emit_stream(tag, ds)
+                self.router.emit_stream(tag, ds, None)
+                self.release_stream(ds)
                 # Check forflushing only when there is data.
                 self.may_flushing()
 
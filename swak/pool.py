@@ -0,0 +1,103 @@
+"""This module implements object pools."""
+
+from collections import deque
+import logging
+
+from swak.data import MultiDataStream
+
+DEFAULT_POOL_MAX_SIZE = 64
+
+
+class ObjectPool(object):
+    """Pool of reusable objects.
+
+    Objects are acquired from the pool and released back when done. A pool
+    is shared between threads, so free objects are kept in a deque whose
+    append & pop are atomic.
+    """
+
+    def __init__(self, factory, reset=None, max_size=DEFAULT_POOL_MAX_SIZE):
+        """Init.
+
+        Args:
+            factory (function): Function to create a new object.
+            reset (function): Function to reset an object when released.
+            max_size (int): Maximum number of free objects to keep.
+        """
+        assert max_size > 0, "max_size must be greater than 0."
+        self.factory = factory
+        self.reset = reset
+        self.max_size = max_size
+        self.free = deque()
+        self.hits = 0
+        self.misses = 0
+        self.releases = 0
+        self.discards = 0
+
+    def acquire(self):
+        """Acquire an object from the pool or create a new one.
+
+        Returns:
+            object: An object.
+        """
+        try:
+            obj = self.free.pop()
+            self.hits += 1
+        except IndexError:
+            obj = self.factory()
+            self.misses += 1
+        return obj
+
+    def release(self, obj):
+        """Release an object back to the pool.
+
+        The object is discarded if the pool is full.
+
+        Args:
+            obj (object): An object acquired from or compatible with the pool.
+
+        Returns:
+            bool: True if the object is kept, False if discarded.
+        """
+        if len(self.free) >= self.max_size:
+            self.discards += 1
+            return False
+        if self.reset is not None:
+            self.reset(obj)
+        self.free.append(obj)
+        self.releases += 1
+        return True
+
+    @property
+    def stats(self):
+        """Return pool statistics."""
+        return dict(hits=self.hits, misses=self.misses,
+                    releases=self.releases, discards=self.discards,
+                    free=len(self.free))
+
+    def __len__(self):
+        """Number of free objects."""
+        return len(self.free)
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<ObjectPool {}>".format(self.stats)
+
+
+def _reset_stream(ds):
+    """Reset a MultiDataStream for reuse."""
+    del ds.times[:]
+    del ds.records[:]
+
+
+def make_stream_pool(max_size=DEFAULT_POOL_MAX_SIZE):
+    """Make a pool of MultiDataStream.
+
+    Args:
+        max_size (int): Maximum number of free streams to keep.
+
+    Returns:
+        ObjectPool
+    """
+    logging.info("make_stream_pool max_size {}".format(max_size))
+    return ObjectPool(MultiDataStream, _reset_stream, max_size)
@@ -0,0 +1,103 @@
+"""This module implements record field predicates for routing."""
+
+from six import string_types
+
+from swak.exception import ConfigError
+
+
+def validate_where(where):
+    """Validate field predicates of a rule.
+
+    Args:
+        where (dict): Field value or list of values by field name. A record
+          satisfies it if every field equals to the value or one of the
+          values.
+    """
+    if type(where) is not dict or len(where) == 0:
+        raise ConfigError("Field predicates must be a non empty dictionary.")
+    for key, value in where.items():
+        if not isinstance(key, string_types):
+            raise ConfigError("Predicate field name must be a string.")
+        values = value if type(value) is list else [value]
+        for val in values:
+            if isinstance(val, (dict, list)):
+                raise ConfigError("Predicate value of '{}' must be a "
+                                  "scalar.".format(key))
+
+
+class PredicateIndex(object):
+    """Index of field predicates of routes.
+
+    Predicates of all routes are compiled into one lookup table per field,
+     which maps a field value to a bitmask of routes accepting it. A record
+     is evaluated by one lookup per field, and goes to the first route whose
+     bit survives.
+    """
+
+    def __init__(self, wheres):
+        """Init.
+
+        Args:
+            wheres (list): Field predicates of each route in order.
+        """
+        for where in wheres:
+            validate_where(where)
+        self.num_route = len(wheres)
+        all_mask = (1 << self.num_route) - 1
+        self.keys = []
+        # Routes which do not test the field, and value to routes by field.
+        self.free = {}
+        self.table = {}
+        for i, where in enumerate(wheres):
+            for key, value in where.items():
+                if key not in self.table:
+                    self.keys.append(key)
+                    self.free[key] = all_mask
+                    self.table[key] = {}
+                self.free[key] &= ~(1 << i)
+                values = value if type(value) is list else [value]
+                for val in values:
+                    table = self.table[key]
+                    table[val] = table.get(val, 0) | (1 << i)
+        # Bit of routes not testing a field accepts any value of it.
+        for key in self.keys:
+            table = self.table[key]
+            for val in table:
+                table[val] |= self.free[key]
+
+    def route(self, record):
+        """Return the first route whose predicates the record satisfies.
+
+        Args:
+            record (dict): A record.
+
+        Returns:
+            int: Route index, or ``num_route`` if none is satisfied.
+        """
+        mask = (1 << self.num_route) - 1
+        for key in self.keys:
+            try:
+                mask &= self.table[key].get(record.get(key), self.free[key])
+            except TypeError:
+                # Unhashable value.
+                mask &= self.free[key]
+            if mask == 0:
+                return self.num_route
+        # Lowest set bit.
+        return (mask & -mask).bit_length() - 1
+
+    def partition(self, ds):
+        """Partition records of a data stream by route in a single pass.
+
+        Args:
+            ds (DataStream): Data stream.
+
+        Returns:
+            list: Record indices of each route, and of unmatched records at
+              last.
+        """
+        parts = [[] for _ in range(self.num_route + 1)]
+        route = self.route
+        for idx, (_, record) in enumerate(ds):
+            parts[route(record)].append(idx)
+        return parts
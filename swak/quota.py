@@ -0,0 +1,197 @@
+"""This module implements admission control by tag quotas."""
+
+import logging
+import time
+
+from swak.data import estimate_size
+from swak.match import MatchPattern
+from swak.exception import ConfigError
+
+QUOTA_POLICIES = ('drop', 'sample', 'divert')
+DEFAULT_QUOTA_SAMPLE = 100
+
+
+class TokenBucket(object):
+    """Token bucket which refills at a constant rate.
+
+    The bucket holds up to one second worth of tokens.
+    """
+
+    def __init__(self, rate, now=None):
+        """Init.
+
+        Args:
+            rate (float): Tokens refilled per second.
+            now (float): Current time stamp.
+        """
+        assert rate > 0
+        self.rate = rate
+        self.tokens = float(rate)
+        self.last = now if now is not None else time.time()
+
+    def refill(self, now):
+        """Refill tokens for the time passed.
+
+        Args:
+            now (float): Current time stamp.
+        """
+        elapsed = now - self.last
+        if elapsed > 0:
+            self.tokens = min(self.rate, self.tokens + elapsed * self.rate)
+        self.last = now
+
+
+class Quota(object):
+    """Rate quota of tags matching a pattern.
+
+    Each matching tag has its own token buckets for records and bytes per
+     second, so that a flooding tag does not eat up the quota of others.
+     Records over the quota are shed by the policy:
+
+    - drop: Drop them.
+    - sample: Keep one out of every ``sample`` records.
+    - divert: Emit them with the ``divert`` tag instead.
+    """
+
+    def __init__(self, ptrn, records=None, bytes=None, policy='drop',
+                 sample=DEFAULT_QUOTA_SAMPLE, divert=None):
+        """Init.
+
+        Args:
+            ptrn (str): Tag pattern.
+            records (int): Records per second.
+            bytes (int): Estimated bytes per second.
+            policy (str): Overflow policy.
+            sample (int): Keep one out of this number of shed records for
+              ``sample`` policy.
+            divert (str): Tag to emit shed records for ``divert`` policy.
+        """
+        if records is None and bytes is None:
+            raise ConfigError("Quota for '{}' needs records or bytes per "
+                              "second.".format(ptrn))
+        for rate in (records, bytes):
+            if rate is not None and (type(rate) is not int or rate <= 0):
+                raise ConfigError("Quota rate must be a integer greater than "
+                                  "0.")
+        if policy not in QUOTA_POLICIES:
+            raise ConfigError("Unsupported quota policy '{}'.".format(policy))
+        if policy == 'sample' and (type(sample) is not int or sample <= 0):
+            raise ConfigError("Quota sample must be a integer greater than "
+                              "0.")
+        if policy == 'divert':
+            if divert is None:
+                raise ConfigError("Quota divert policy needs divert tag.")
+            if MatchPattern().create(ptrn).match(divert):
+                raise ConfigError("Divert tag '{}' must not match the quota "
+                                  "pattern '{}'.".format(divert, ptrn))
+        self.ptrn = ptrn
+        self.pattern = MatchPattern().create(ptrn)
+        self.records = records
+        self.bytes = bytes
+        self.policy = policy
+        self.sample = sample
+        self.divert = divert
+        # (records bucket, bytes bucket) by tag.
+        self.buckets = {}
+        # Shed records by tag.
+        self.shed = {}
+
+    def match(self, tag):
+        """Check the quota applies to the tag."""
+        return self.pattern.match(tag)
+
+    def _buckets(self, tag, now):
+        """Return refilled buckets of a tag."""
+        buckets = self.buckets.get(tag)
+        if buckets is None:
+            buckets = self.buckets[tag] = tuple(
+                TokenBucket(rate, now) if rate is not None else None
+                for rate in (self.records, self.bytes))
+        for bucket in buckets:
+            if bucket is not None:
+                bucket.refill(now)
+        return buckets
+
+    def admit(self, tag, ds, now=None):
+        """Admit records of a data stream within the quota.
+
+        Args:
+            tag (str): Data tag.
+            ds (DataStream): Data stream.
+            now (float): Current time stamp.
+
+        Returns:
+            DataStream: Admitted records including sampled ones.
+            DataStream: Records to divert, or None.
+        """
+        now = now if now is not None else time.time()
+        rbucket, bbucket = self._buckets(tag, now)
+        length = len(ds)
+        if bbucket is None:
+            # Records only quota admits the leading records at once.
+            admit = min(length, int(rbucket.tokens))
+            rbucket.tokens -= admit
+            if admit == length:
+                return ds, None
+            admitted = list(range(admit))
+            shed = list(range(admit, length))
+        else:
+            admitted = []
+            shed = []
+            for idx, (_, record) in enumerate(ds):
+                size = estimate_size(record)
+                if (rbucket is None or rbucket.tokens >= 1) and\
+                        bbucket.tokens >= size:
+                    if rbucket is not None:
+                        rbucket.tokens -= 1
+                    bbucket.tokens -= size
+                    admitted.append(idx)
+                else:
+                    shed.append(idx)
+            if len(shed) == 0:
+                return ds, None
+
+        diverted = None
+        if self.policy == 'sample':
+            # Count shed records across streams to sample evenly.
+            base = self.shed.get(tag, 0)
+            sampled = [idx for i, idx in enumerate(shed)
+                       if (base + i) % self.sample == 0]
+            admitted = sorted(admitted + sampled)
+        elif self.policy == 'divert':
+            diverted = ds.take(shed)
+        self.shed[tag] = self.shed.get(tag, 0) + len(shed)
+        logging.debug("Quota.admit - shed {} records of tag '{}'".
+                      format(len(shed), tag))
+        return ds.take(admitted), diverted
+
+    def __repr__(self):
+        """Canonical string representation."""
+        return "<Quota '{}' records {} bytes {} policy {}>".\
+            format(self.ptrn, self.records, self.bytes, self.policy)
+
+
+def make_quotas(qcfg):
+    """Make quotas from config.
+
+    Args:
+        qcfg (list): List of quota config dict with ``match`` pattern and
+          ``Quota`` arguments.
+
+    Returns:
+        list: List of Quota.
+    """
+    if type(qcfg) is not list:
+        raise ConfigError("The value of the 'quota' field must be a list.")
+    quotas = []
+    for cfg in qcfg:
+        if type(cfg) is not dict or 'match' not in cfg:
+            raise ConfigError("Each quota must be a dictionary with 'match' "
+                              "pattern.")
+        cfg = dict(cfg)
+        ptrn = cfg.pop('match')
+        try:
+            quotas.append(Quota(ptrn, **cfg))
+        except TypeError:
+            raise ConfigError("Invalid quota config for '{}'.".format(ptrn))
+    return quotas
@@ -28,4 +28,10 @@
                 None
         """
         raise NotImplementedError()
+
+    # Implement modify_stream(self, tag, ds) instead to modify a whole data
+    # stream in one call.
+    #
+    # Modifying the record in place and returning the given time & record
+    # lets the pipeline pass the stream on without copying it.
 {% endblock %}
@@ -4,7 +4,9 @@
 from swak.formatter import Formatter, StdoutFormatter
 from swak.buffer import Buffer
 from swak.memorybuffer import MemoryBuffer, DEFAULT_CHUNK_MAX_RECORD,\
-    DEFAULT_CHUNK_MAX_SIZE, DEFAULT_BUFFER_MAX_CHUNK
+    DEFAULT_CHUNK_MAX_SIZE, DEFAULT_BUFFER_MAX_CHUNK, DEFAULT_JOURNAL_SYNC
+from swak.filebuffer import FileBuffer
+from swak.budget import OVERFLOW_POLICIES
 {% endblock %}
 
 {% block class_body %}
@@ -72,10 +74,41 @@ def f_stdout(timezone):
               show_default=True, help="Maximum chunks per buffer.")
 @click.option('-c', '--buffer-max-chunk', default=DEFAULT_BUFFER_MAX_CHUNK,
               show_default=True, help="Maximum chunks per buffer.")
+@click.option('-j', '--journal', default=None, type=str,
+              help="Journal file path to recover chunks after a crash.")
+@click.option('--journal-sync', default=DEFAULT_JOURNAL_SYNC,
+              show_default=True, help="Journal sync interval.")
+@click.option('-o', '--overflow', default='block', show_default=True,
+              type=click.Choice(OVERFLOW_POLICIES),
+              help="Policy when the memory budget is full.")
+@click.option('--spill', default=None, type=str,
+              help="Directory to spill chunks with 'spill' policy.")
 def b_memory(flush_interval, chunk_max_record, chunk_max_size,
-             buffer_max_chunk):
+             buffer_max_chunk, journal, journal_sync, overflow, spill):
     """Formatter entry."""
     return MemoryBuffer(None, False, flush_interval=flush_interval,
                         buffer_max_chunk=buffer_max_chunk,
-                        chunk_max_record=chunk_max_record)
+                        chunk_max_record=chunk_max_record, journal=journal,
+                        journal_sync=journal_sync, overflow=overflow,
+                        spill=spill)
+
+
+@main.command('b.file', help="File buffer for this output.")
+@click.option('-p', '--path', required=True, type=str,
+              help="Directory to store chunk files.")
+@click.option('-f', '--flush-interval', default=None, type=str,
+              show_default=True, help="Flush interval.")
+@click.option('-r', '--chunk-max-record', default=DEFAULT_CHUNK_MAX_RECORD,
+              type=int, show_default=True, help="Maximum records per chunk.")
+@click.option('-s', '--chunk-max-size', default=DEFAULT_CHUNK_MAX_SIZE,
+              show_default=True, help="Maximum chunk size.")
+@click.option('-c', '--buffer-max-chunk', default=DEFAULT_BUFFER_MAX_CHUNK,
+              show_default=True, help="Maximum chunks per buffer.")
+def b_file(path, flush_interval, chunk_max_record, chunk_max_size,
+           buffer_max_chunk):
+    """Buffer entry."""
+    return FileBuffer(None, False, path, flush_interval=flush_interval,
+                      buffer_max_chunk=buffer_max_chunk,
+                      chunk_max_record=chunk_max_record,
+                      chunk_max_size=chunk_max_size)
 {% endblock %}
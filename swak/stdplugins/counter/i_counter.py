@@ -6,9 +6,6 @@ import click
 from six.moves import range
 
 from swak.plugin import RecordInput
-# from swak.data import MultiDataStream
-
-YIELD_STEP = 10
 
 DEFAULT_NUMBER = 3
 DEFAUTL_FIELD = 1
@@ -67,29 +64,6 @@ class Counter(RecordInput):
                     else:
                         break
 
-    # def generate_stream(self, gen_data, stop_event):
-    #     """Generate data stream from data generator.
-
-    #     Args:
-    #         gen_data (function): Data generator function.
-    #         stop_event (threading.Event): Stop event
-
-    #     Yields:
-    #         tuple: (tag, DataStream)
-    #     """
-    #     times = []
-    #     datas = []
-    #     for i, event in enumerate(gen_data(stop_event)):
-    #         utime, data = event
-    #         times.append(utime)
-    #         datas.append(data)
-    #         if i % YIELD_STEP == 0:
-    #             yield self.tag, MultiDataStream(times, datas)
-    #             times = []
-    #             datas = []
-    #     # yield remain data
-    #     yield self.tag, MultiDataStream(times, datas)
-
 
 @click.command(help="Generate incremental numbers.")
 @click.option('-n', '--number', default=DEFAULT_NUMBER, show_default=True,
@@ -1,10 +1,13 @@
 from __future__ import absolute_import  # NOQA
 """This module implements modifier plugin of filter."""
 import re
+import logging
 
 import click
+from six import string_types
 
 from swak.plugin import Modifier
+from swak.data import ColumnarDataStream, MISSING
 
 
 def make_effective_patterns(ptrns):
@@ -21,15 +24,21 @@ def make_effective_patterns(ptrns):
 class Filter(Modifier):
     """Filter class."""
 
-    def __init__(self, includes, excludes=[]):
+    commutative = True
+
+    def __init__(self, includes, excludes=[], line_excludes=[]):
         """Init.
 
         Args:
             includes (list): Regular expressions to include
             excludes (list): Regular expressions to exclude
+            line_excludes (list): Regular expressions to exclude whole lines
+              of text input. They are tested against text records, which
+              are lines of an input without a parser.
         """
         self.includes = make_effective_patterns(includes)
         self.excludes = make_effective_patterns(excludes)
+        self.line_excludes = [re.compile(regex) for regex in line_excludes]
 
     def modify(self, tag, utime, record):
         """Modify data by filtering.
@@ -51,20 +60,158 @@ class Filter(Modifier):
             If excluded
                 None
         """
-        if not self.includes and not self.excludes:
+        if not self.includes and not self.excludes and\
+                not self.line_excludes:
             return utime, record
 
+        return (utime, record) if self.match(record) else None
+
+    def read_fields(self):
+        """Return fields of the patterns."""
+        return set(self.includes) | set(self.excludes)
+
+    def write_fields(self):
+        """Filter writes no field."""
+        return set()
+
+    def delete_fields(self):
+        """Filter deletes no field."""
+        return set()
+
+    def line_filter(self, parser):
+        """Return a function to test lines by fields the parser locates.
+
+        Line excludes are tested only if there is no parser, since parsed
+         records are not tested by them in the pipeline either. Field
+         patterns are tested if the parser can locate all of their fields.
+
+        Args:
+            parser (Parser): Parser of the lines, or None.
+
+        Returns:
+            function: ``test(line)``, or None if nothing can be tested.
+        """
+        if parser is None:
+            if len(self.line_excludes) == 0:
+                return None
+            return self.match_line
+
+        if len(self.line_excludes) > 0:
+            logging.warning("line excludes of {} are not applied to parsed "
+                            "records".format(self))
+        getters = {}
+        for key in self.read_fields():
+            getter = parser.raw_field(key)
+            if getter is None:
+                return None
+            getters[key] = getter
+        if len(getters) == 0:
+            return None
+
+        def test(line):
+            record = {}
+            for key, getter in getters.items():
+                val = getter(line)
+                if val is not None:
+                    record[key] = val
+            return self.match(record)
+        return test
+
+    def match_line(self, line):
+        """Check whether a line passes the line excludes.
+
+        Args:
+            line (str): Line of text input.
+
+        Returns:
+            bool: False if excluded, True otherwise.
+        """
+        for regexp in self.line_excludes:
+            if regexp.search(line) is not None:
+                return False
+        return True
+
+    def match(self, record):
+        """Check whether a record passes the filter.
+
+        A text record is tested by line excludes, and then as a record with
+         no field. Line excludes are not applied to a parsed record.
+
+        Args:
+            record (dict or str): data record
+
+        Returns:
+            bool: True if included, False otherwise.
+        """
+        if isinstance(record, string_types):
+            if not self.match_line(record):
+                return False
+            record = {}
+
         for key, regexp in self.excludes.items():
             if key in record:
                 if regexp.search(record[key]) is not None:
-                    return None
+                    return False
 
         for key, regexp in self.includes.items():
             if key not in record:
-                return None
+                return False
             if regexp.search(record[key]) is None:
-                return None
-        return utime, record
+                return False
+        return True
+
+    def modify_stream(self, tag, ds):
+        """Modify data stream by filtering.
+
+        Args:
+            tag (str): data tag
+            ds (DataStream): data stream
+
+        Returns:
+            DataStream: ``ds`` itself if all records are included, the
+              selection of included records otherwise.
+        """
+        if not self.includes and not self.excludes and\
+                not self.line_excludes:
+            return ds
+
+        if isinstance(ds, ColumnarDataStream):
+            selected = self._select_columns(ds)
+        else:
+            match = self.match
+            selected = [idx for idx, (_, record) in enumerate(ds)
+                        if match(record)]
+        if len(selected) == len(ds):
+            return ds
+        return ds.take(selected)
+
+    def _select_columns(self, ds):
+        """Select included records by testing columns.
+
+        Args:
+            ds (ColumnarDataStream): data stream
+
+        Returns:
+            list: Indices of included records.
+        """
+        keep = [True] * len(ds)
+        for key, regexp in self.excludes.items():
+            if key not in ds.key_index:
+                continue
+            search = regexp.search
+            for idx, val in enumerate(ds.column(key)):
+                if keep[idx] and val is not MISSING and\
+                        search(val) is not None:
+                    keep[idx] = False
+
+        for key, regexp in self.includes.items():
+            if key not in ds.key_index:
+                return []
+            search = regexp.search
+            for idx, val in enumerate(ds.column(key)):
+                if keep[idx] and (val is MISSING or search(val) is None):
+                    keep[idx] = False
+        return [idx for idx, kept in enumerate(keep) if kept]
 
 
 @click.command(help="Filter data by regular expression.")
@@ -72,10 +219,12 @@ class Filter(Modifier):
               help="Key and RegExp to include.")
 @click.option('-x', '--exclude', nargs=2, type=str, multiple=True,
               help="Key and RegExp to exclude.")
+@click.option('-X', '--exclude-line', type=str, multiple=True,
+              help="RegExp to exclude lines of text input without parser.")
 @click.pass_context
-def main(ctx, include, exclude):
+def main(ctx, include, exclude, exclude_line):
     """Plugin entry."""
-    return Filter(include, exclude)
+    return Filter(include, exclude, exclude_line)
 
 
 if __name__ == '__main__':
@@ -3,6 +3,7 @@
 from .m_filter import Filter
 
 from swak.core import DummyAgent
+from swak.data import MultiDataStream, ColumnarDataStream
 
 
 def emit_records(router, agent):
@@ -77,3 +78,52 @@ def test_filter_basic():
     filter = Filter(includes, excludes)
     def_output = emit_for_modifiers([filter])
     assert len(def_output.bulks) == 1
+
+
+def test_filter_stream():
+    """Test filtering a whole data stream."""
+    times = [0.0, 1.0, 2.0, 3.0]
+    records = [
+        {"k1": "a", "k2": "A"},
+        {"k1": "b", "k2": "B"},
+        {"k1": "c", "k2": "C"},
+        {"k2": "D"},
+    ]
+    filter = Filter([("k1", "a|c")], [("k2", "C")])
+    ds = MultiDataStream(times, records)
+    modified = filter.modify_stream("test", ds)
+    assert list(modified) == [(0.0, records[0])]
+
+    # all included returns the stream itself.
+    filter = Filter([("k2", ".")])
+    assert filter.modify_stream("test", ds) is ds
+
+    # columnar stream is filtered by columns.
+    cds = ColumnarDataStream.from_records(times, records)
+    filter = Filter([("k1", "a|c")], [("k2", "C")])
+    modified = filter.modify_stream("test", cds)
+    assert isinstance(modified, ColumnarDataStream)
+    assert list(modified) == [(0.0, records[0])]
+    filter = Filter([("k3", ".")])
+    assert len(filter.modify_stream("test", cds)) == 0
+
+
+def test_filter_line():
+    """Test excluding whole lines."""
+    filter = Filter([], [], ["DEBUG", "^#"])
+    assert filter.modify("test", 0.0, "INFO start") == (0.0, "INFO start")
+    assert filter.modify("test", 0.0, "DEBUG conn") is None
+    ds = MultiDataStream([0.0, 1.0, 2.0], ["# header", "INFO a", "DEBUG b"])
+    assert list(filter.modify_stream("test", ds)) == [(1.0, "INFO a")]
+
+    # tested without a parser.
+    test = filter.line_filter(None)
+    assert [test(line) for line in ["INFO a", "DEBUG b"]] == [True, False]
+    assert Filter([("k1", "a")]).line_filter(None) is None
+
+    # a text record has no field to include.
+    filter = Filter([("k1", "a")], [("k2", "B")], ["DEBUG"])
+    assert not filter.match("INFO a")
+    assert Filter([], [("k2", "B")], ["DEBUG"]).match("INFO a")
+    # line excludes are not applied to parsed records.
+    assert filter.match({"k1": "a DEBUG"})
@@ -4,11 +4,14 @@ from __future__ import absolute_import  # NOQA
 import re
 import socket
 import logging
+from string import Formatter
 
 import click
 from six import string_types
 
 from swak.plugin import Modifier
+from swak.data import ColumnarDataStream, MultiDataStream, OneDataStream,\
+    RawDataStream
 
 # Syntax patterns
 ptrn_tag_parts = re.compile(r'{tag_parts\[(-?\d)\]}')
@@ -16,6 +19,9 @@ ptrn_hostaddr_parts = re.compile(r'{hostaddr_parts\[(-?\d)\]}')
 ptrn_variable = re.compile(r'\$\{([^}]+?)\}')
 ptrn_curly_bracket = re.compile(r'([^\$]|^)\{([^}]+?)\}')
 
+# Streams whose records can be modified in place.
+RECORD_STREAMS = (MultiDataStream, OneDataStream, RawDataStream)
+
 
 def _tag_prefix(tag_parts):
     cnt = len(tag_parts)
@@ -68,6 +74,19 @@ def _expand(val, placeholders):
     Returns:
         dict: Expanded value
     """
+    return _expand_parts(val, placeholders).format(**placeholders)
+
+
+def _expand_parts(val, placeholders):
+    """Expand indexed tag & host address parts which are fixed per tag.
+
+    Args:
+        val (str): A string value with possible placeholder.
+        placeholders (dict): Placeholder value reference.
+
+    Returns:
+        str: Value string to be formatted per record.
+    """
     # expand tag_parts
     while True:
         m = ptrn_tag_parts.search(val)
@@ -88,11 +107,60 @@ def _expand(val, placeholders):
         phv = placeholders[key]
         val = val.replace(key, phv)
 
-    return val.format(**placeholders)
+    return val
+
+
+def _refers_record(val):
+    """Check whether a value string refers time or record.
+
+    Args:
+        val (str): Value string to be formatted per record.
+
+    Returns:
+        bool
+    """
+    for _, field, _, _ in Formatter().parse(val):
+        if field is not None and re.match(r'(time|record)\b', field):
+            return True
+    return False
+
+
+def _record_fields(val):
+    """Return record fields which a value string refers.
+
+    Args:
+        val (str): Value string to be formatted per record.
+
+    Returns:
+        set: Field names, or None if the whole record is referred.
+    """
+    fields = set()
+    for _, field, _, _ in Formatter().parse(val):
+        if field is None or not re.match(r'record\b', field):
+            continue
+        m = re.match(r'record\[([^\]]+)\]', field)
+        if m is None:
+            return None
+        fields.add(m.group(1))
+    return fields
+
+
+_default_placeholders = None
 
 
 def _make_default_placeholders():
-    """Make a default placeholder."""
+    """Make a default placeholder.
+
+    Host information is resolved only once and copied afterwards.
+    """
+    global _default_placeholders
+    if _default_placeholders is None:
+        _default_placeholders = _resolve_host_placeholders()
+    return dict(_default_placeholders)
+
+
+def _resolve_host_placeholders():
+    """Resolve host name & address placeholders."""
     pholder = {}
     hostname = socket.gethostname()
     pholder['hostname'] = hostname
@@ -110,6 +178,8 @@ def _make_default_placeholders():
 class Reform(Modifier):
     """Reform class."""
 
+    commutative = True
+
     def __init__(self, writes, deletes=[]):
         """Init.
 
@@ -123,6 +193,27 @@ class Reform(Modifier):
             assert isinstance(k, string_types), "Value must be a string"
         self.writes = writes
         self.deletes = deletes
+        self.norm_writes = [(k, _normalize(v)) for k, v in writes]
+        self.expanded_writes = None
+        self.placeholders = None
+
+    def read_fields(self):
+        """Return record fields which values refer."""
+        fields = set()
+        for _, val in self.norm_writes:
+            refers = _record_fields(val)
+            if refers is None:
+                return None
+            fields |= refers
+        return fields
+
+    def write_fields(self):
+        """Return written & deleted fields."""
+        return set(k for k, _ in self.writes) | set(self.deletes)
+
+    def delete_fields(self):
+        """Return overwritten & deleted fields."""
+        return set(k for k, _ in self.writes) | set(self.deletes)
 
     def prepare_for_stream(self, tag, ds):
         """Prepare to modify data stream.
@@ -131,6 +222,10 @@ class Reform(Modifier):
             tag (str): data tag
             ds (datatream): data stream
         """
+        # Placeholders only depend on the tag.
+        if self.placeholders is not None and self.placeholders['tag'] == tag:
+            return
+
         placeholders = _make_default_placeholders()
         placeholders['tag'] = tag
         tag_parts = tag.split('.')
@@ -147,11 +242,14 @@ class Reform(Modifier):
         placeholders['tag_prefix'] = _tag_prefix(tag_parts)
         placeholders['tag_suffix'] = _tag_suffix(tag_parts)
         self.placeholders = placeholders
+        self.expanded_writes = [(k, _expand_parts(v, placeholders)) for k, v
+                                in self.norm_writes]
 
     def modify(self, tag, utime, record):
         """Modify an event by modifying.
 
-        If adds & dels conflicts, deleting key wins.
+        If adds & dels conflicts, deleting key wins. Deleting a missing key
+         is ignored, as the parser may not extract fields which are deleted.
 
         Args:
             tag (str): data tag
@@ -163,16 +261,68 @@ class Reform(Modifier):
             record: Modified record
         """
         assert type(record) is dict
-        self.placeholders['time'] = utime
-        self.placeholders['record'] = record
-        for key, val in self.writes:
-            record[key] = _expand(_normalize(val), self.placeholders)
+        placeholders = self.placeholders
+        placeholders['time'] = utime
+        placeholders['record'] = record
+        for key, val in self.expanded_writes:
+            record[key] = val.format(**placeholders)
 
         for key in self.deletes:
-            del record[key]
+            record.pop(key, None)
 
         return utime, record
 
+    def modify_stream(self, tag, ds):
+        """Modify data stream by reforming records in place.
+
+        Args:
+            tag (str): data tag
+            ds (DataStream): data stream
+
+        Returns:
+            DataStream: ``ds`` itself, or a modified copy for streams which
+              do not keep record objects.
+        """
+        if isinstance(ds, ColumnarDataStream):
+            return self._modify_columns(ds)
+        if type(ds) not in RECORD_STREAMS:
+            return super(Reform, self).modify_stream(tag, ds)
+
+        modify = self.modify
+        for utime, record in ds:
+            modify(tag, utime, record)
+        return ds
+
+    def _modify_columns(self, ds):
+        """Reform columns of columnar data stream.
+
+        Values which do not refer time or record are written as a constant
+         column.
+
+        Args:
+            ds (ColumnarDataStream): data stream
+
+        Returns:
+            ColumnarDataStream: ``ds`` itself.
+        """
+        placeholders = self.placeholders
+        cnt = len(ds)
+        for key, val in self.expanded_writes:
+            if not _refers_record(val):
+                ds.set_column(key, [val.format(**placeholders)] * cnt)
+                continue
+            values = []
+            for idx in range(cnt):
+                placeholders['time'] = ds.times[idx]
+                placeholders['record'] = ds.record(idx)
+                values.append(val.format(**placeholders))
+            ds.set_column(key, values)
+
+        for key in self.deletes:
+            if key in ds.key_index:
+                ds.del_column(key)
+        return ds
+
 
 @click.command(help="Write or delete record fields.")
 @click.option('-w', '--write', "writes", type=(str, str), multiple=True,
@@ -4,6 +4,8 @@ import socket
 
 from .m_reform import Reform, _tag_suffix, _normalize
 
+from swak.data import MultiDataStream, ColumnarDataStream
+
 
 def test_event_router_util():
     """Test event router utility."""
@@ -85,3 +87,36 @@ def test_reform_expand(agent):
     assert pholder['tag_parts'] == ['a', 'b', 'c']
     assert pholder['tag_prefix'] == ['a', 'a.b', 'a.b.c']
     assert pholder['tag_suffix'] == ['c', 'b.c', 'a.b.c']
+
+
+def test_reform_stream():
+    """Test reforming a whole data stream."""
+    writes = [("f1", "${record[f1]}_mod"), ("t", "${tag_parts[-1]}")]
+    times = [0.0, 1.0]
+    reform = Reform(writes, ["f2"])
+    reform.prepare_for_stream("a.b", None)
+
+    ds = MultiDataStream(times, [dict(f1="1", f2=1), dict(f1="2", f2=2)])
+    assert reform.modify_stream("a.b", ds) is ds
+    assert ds.records == [dict(f1="1_mod", t="b"), dict(f1="2_mod", t="b")]
+
+    cds = ColumnarDataStream.from_records(times, [dict(f1="1", f2=1),
+                                                  dict(f1="2", f2=2)])
+    modified = reform.modify_stream("a.b", cds)
+    assert modified is cds
+    assert cds.keys == ["f1", "t"]
+    assert cds.records == [dict(f1="1_mod", t="b"), dict(f1="2_mod", t="b")]
+
+
+def test_reform_fields():
+    """Test declared fields of reform."""
+    reform = Reform([("f1", "${record[f1]}_mod"), ("t", "${tag}")], ["f2"])
+    assert reform.read_fields() == {"f1"}
+    assert reform.write_fields() == {"f1", "t", "f2"}
+    assert reform.delete_fields() == {"f1", "t", "f2"}
+    # deleting a field the parser skipped.
+    reform.prepare_for_stream("test", None)
+    assert reform.modify("test", 0.0, {"f1": "a"})[1] == {"f1": "a_mod",
+                                                          "t": "test"}
+    reform = Reform([("f1", "${record}")])
+    assert reform.read_fields() is None
@@ -0,0 +1,543 @@
+"""This module implements binary wire format of data streams.
+
+A data stream is encoded into a frame of the following layout. All numbers
+are little endian.
+
+- Header: magic ``SWK``, version (u8), layout (u8), record count (u32).
+- Times: float64 per record.
+- Body:
+    - Columnar layout (every record is a dict): key count (u32), then per
+      key, the key string and the column.
+    - Generic layout: a generic value per record.
+
+A column starts with a type code (u8) and a flag (u8) which tells if a
+presence bitmap of a byte per record follows. Values of present records
+follow:
+
+- ``b``, ``h``, ``i``, ``q``: int8, int16, int32 or int64 array.
+- ``d``: float64 array.
+- ``s``: end offsets (u32 array) and a UTF-8 blob.
+- ``e``: distinct string count (u32), their end offsets and blob, then the
+  typecode (u8) and array of their indices.
+- ``o``: a generic value per record.
+
+Strings are length (u32) prefixed UTF-8. A generic value is a type code (u8)
+and its payload.
+
+For streaming, frames are prefixed with their length (u32).
+"""
+
+import sys
+import struct
+from array import array
+
+from six import string_types, binary_type, integer_types, PY2
+
+from swak.data import MultiDataStream, ColumnarDataStream, MISSING,\
+    INT64_TYPECODE
+from swak.exception import WireFormatError
+
+MAGIC = b'SWK'
+VERSION = 1
+
+LAYOUT_COLUMNAR = 0
+LAYOUT_GENERIC = 1
+
+HEADER = struct.Struct('<3sBBI')
+U32 = struct.Struct('<I')
+I64 = struct.Struct('<q')
+F64 = struct.Struct('<d')
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# Column types. Integer columns use the narrowest array typecode. The column
+#  type of 64 bit integers is 'q', whose array typecode is 'l' in Python 2.
+INT_TYPECODES = [tc for tc in ('b', 'h', 'i')
+                 if tc != 'i' or array('i').itemsize == 4]
+if INT64_TYPECODE is not None:
+    INT_TYPECODES.append(INT64_TYPECODE)
+INT_COLUMNS = {(b'q' if tc == INT64_TYPECODE else tc.encode()): tc
+               for tc in INT_TYPECODES}
+COL_FLOAT = b'd'
+COL_STR = b's'
+COL_ENUM = b'e'
+COL_OBJECT = b'o'
+
+# Generic value types
+VAL_NONE = b'N'
+VAL_TRUE = b'T'
+VAL_FALSE = b'F'
+VAL_INT = b'i'
+VAL_BIGINT = b'I'
+VAL_FLOAT = b'f'
+VAL_STR = b's'
+VAL_BYTES = b'b'
+VAL_LIST = b'l'
+VAL_DICT = b'd'
+
+_SWAP = sys.byteorder != 'little'
+# Python 2 arrays have ``tostring`` and ``fromstring`` only.
+_TOBYTES = 'tostring' if PY2 else 'tobytes'
+_FROMBYTES = 'fromstring' if PY2 else 'frombytes'
+
+
+def _array_bytes(arr):
+    """Return little endian bytes of an array."""
+    if _SWAP:
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return getattr(arr, _TOBYTES)()
+
+
+def _bytes_array(typecode, buf):
+    """Return an array from little endian bytes."""
+    arr = array(typecode)
+    getattr(arr, _FROMBYTES)(buf)
+    if _SWAP:
+        arr.byteswap()
+    return arr
+
+
+def _encode_str(out, strn):
+    """Encode a string."""
+    data = strn.encode('utf8')
+    out.append(U32.pack(len(data)))
+    out.append(data)
+
+
+def _encode_value(out, val):
+    """Encode a generic value."""
+    if val is None:
+        out.append(VAL_NONE)
+    elif val is True:
+        out.append(VAL_TRUE)
+    elif val is False:
+        out.append(VAL_FALSE)
+    elif isinstance(val, integer_types):
+        if INT64_MIN <= val <= INT64_MAX:
+            out.append(VAL_INT)
+            out.append(I64.pack(val))
+        else:
+            out.append(VAL_BIGINT)
+            _encode_str(out, str(val))
+    elif isinstance(val, float):
+        out.append(VAL_FLOAT)
+        out.append(F64.pack(val))
+    elif isinstance(val, string_types):
+        out.append(VAL_STR)
+        _encode_str(out, val)
+    elif isinstance(val, (binary_type, bytearray, memoryview)):
+        out.append(VAL_BYTES)
+        out.append(U32.pack(len(val)))
+        out.append(bytes(val))
+    elif isinstance(val, (list, tuple)):
+        out.append(VAL_LIST)
+        out.append(U32.pack(len(val)))
+        for item in val:
+            _encode_value(out, item)
+    elif isinstance(val, dict):
+        out.append(VAL_DICT)
+        out.append(U32.pack(len(val)))
+        for key, item in val.items():
+            _encode_str(out, key)
+            _encode_value(out, item)
+    else:
+        raise WireFormatError("Can not encode value of type {}".
+                              format(type(val)))
+
+
+def _int_column(typecode):
+    """Return the column type of an integer array typecode."""
+    return b'q' if typecode == INT64_TYPECODE else typecode.encode()
+
+
+def _int_typecode(values):
+    """Return the narrowest array typecode for integer values."""
+    low, high = min(values), max(values)
+    for typecode in INT_TYPECODES:
+        bits = array(typecode).itemsize * 8 - 1
+        if -2 ** bits <= low and high < 2 ** bits:
+            return typecode
+
+
+def _column_type(values):
+    """Decide column type for present values."""
+    types = set(type(val) for val in values)
+    if len(types) != 1:
+        return COL_OBJECT
+    vtype = types.pop()
+    if vtype in integer_types and vtype is not bool:
+        typecode = _int_typecode(values)
+        if typecode is not None:
+            return _int_column(typecode)
+    elif vtype is float:
+        return COL_FLOAT
+    elif issubclass(vtype, string_types):
+        if len(set(values)) <= len(values) // 2:
+            return COL_ENUM
+        return COL_STR
+    return COL_OBJECT
+
+
+def _encode_strs(out, strs):
+    """Encode strings as end offsets and a blob."""
+    datas = [strn.encode('utf8') for strn in strs]
+    ends = array('I')
+    end = 0
+    for data in datas:
+        end += len(data)
+        ends.append(end)
+    out.append(_array_bytes(ends))
+    out.append(b''.join(datas))
+
+
+def _encode_column(out, col):
+    """Encode a column."""
+    if isinstance(col, array) and col.typecode in (INT64_TYPECODE, 'd'):
+        # Typed column has no missing value.
+        if col.typecode == 'd':
+            out.append(COL_FLOAT)
+        else:
+            typecode = _int_typecode(col) if len(col) > 0 else\
+                INT64_TYPECODE
+            out.append(_int_column(typecode))
+            if typecode != INT64_TYPECODE:
+                col = array(typecode, col)
+        out.append(b'\x00')
+        out.append(_array_bytes(col))
+        return
+
+    present = bytearray(val is not MISSING for val in col)
+    values = col if all(present) else [val for val in col if val is not
+                                       MISSING]
+    ctype = _column_type(values) if len(values) > 0 else COL_OBJECT
+    out.append(ctype)
+    if len(values) == len(col):
+        out.append(b'\x00')
+    else:
+        out.append(b'\x01')
+        out.append(bytes(present))
+
+    if ctype in INT_COLUMNS or ctype == COL_FLOAT:
+        typecode = INT_COLUMNS.get(ctype, 'd')
+        out.append(_array_bytes(array(typecode, values)))
+    elif ctype == COL_STR:
+        _encode_strs(out, values)
+    elif ctype == COL_ENUM:
+        words = {}
+        indices = [words.setdefault(val, len(words)) for val in values]
+        out.append(U32.pack(len(words)))
+        _encode_strs(out, sorted(words, key=words.get))
+        typecode = _int_typecode(indices)
+        out.append(_int_column(typecode))
+        out.append(_array_bytes(array(typecode, indices)))
+    else:
+        for val in values:
+            _encode_value(out, val)
+
+
+def _columnize(ds):
+    """Return keys and columns of a stream of dict records."""
+    keys = []
+    key_index = {}
+    columns = []
+    for i, (_, record) in enumerate(ds):
+        for key, val in record.items():
+            idx = key_index.get(key)
+            if idx is None:
+                idx = key_index[key] = len(keys)
+                keys.append(key)
+                columns.append([MISSING] * i)
+            columns[idx].append(val)
+        for col in columns:
+            if len(col) == i:
+                col.append(MISSING)
+    return keys, columns
+
+
+def encode(ds):
+    """Encode a data stream into a frame.
+
+    Args:
+        ds (DataStream): Data stream to encode.
+
+    Returns:
+        bytes: Encoded frame.
+    """
+    count = len(ds)
+    if isinstance(ds, ColumnarDataStream):
+        times = ds.times
+        layout = LAYOUT_COLUMNAR
+        keys, columns = ds.keys, ds.columns
+    else:
+        times = array('d')
+        records = []
+        for utime, record in ds:
+            times.append(utime)
+            records.append(record)
+        if all(type(record) is dict for record in records):
+            layout = LAYOUT_COLUMNAR
+            keys, columns = _columnize(MultiDataStream(times, records))
+        else:
+            layout = LAYOUT_GENERIC
+
+    out = [HEADER.pack(MAGIC, VERSION, layout, count), _array_bytes(times)]
+    if layout == LAYOUT_COLUMNAR:
+        out.append(U32.pack(len(keys)))
+        for key, col in zip(keys, columns):
+            _encode_str(out, key)
+            _encode_column(out, col)
+    else:
+        for record in records:
+            _encode_value(out, record)
+    return b''.join(out)
+
+
+class _Reader(object):
+    """Sequential reader over a buffer."""
+
+    def __init__(self, buf, zero_copy):
+        """Init.
+
+        Args:
+            buf (bytes-like): Buffer to read.
+            zero_copy (bool): Decode string values as memoryview of UTF-8
+              bytes in the buffer. Python 2 decodes them as copied bytes.
+        """
+        self.view = memoryview(buf)
+        self.pos = 0
+        self.zero_copy = zero_copy
+
+    def read(self, size):
+        """Read bytes as memoryview."""
+        end = self.pos + size
+        if end > len(self.view):
+            raise WireFormatError("Unexpected end of frame.")
+        data = self.view[self.pos:end]
+        self.pos = end
+        # Python 2 struct, array and bytes do not take memoryview.
+        return data.tobytes() if PY2 else data
+
+    def unpack(self, fmt):
+        """Read a struct."""
+        return fmt.unpack(self.read(fmt.size))[0]
+
+    def read_str(self):
+        """Read a string."""
+        data = self.read(self.unpack(U32))
+        return data if self.zero_copy else bytes(data).decode('utf8')
+
+    def read_key(self):
+        """Read a key, which is always decoded."""
+        return bytes(self.read(self.unpack(U32))).decode('utf8')
+
+    def read_value(self):
+        """Read a generic value."""
+        vtype = bytes(self.read(1))
+        if vtype == VAL_NONE:
+            return None
+        elif vtype == VAL_TRUE:
+            return True
+        elif vtype == VAL_FALSE:
+            return False
+        elif vtype == VAL_INT:
+            return self.unpack(I64)
+        elif vtype == VAL_BIGINT:
+            return int(self.read_key())
+        elif vtype == VAL_FLOAT:
+            return self.unpack(F64)
+        elif vtype == VAL_STR:
+            return self.read_str()
+        elif vtype == VAL_BYTES:
+            return bytes(self.read(self.unpack(U32)))
+        elif vtype == VAL_LIST:
+            return [self.read_value() for _ in range(self.unpack(U32))]
+        elif vtype == VAL_DICT:
+            result = {}
+            for _ in range(self.unpack(U32)):
+                key = self.read_key()
+                result[key] = self.read_value()
+            return result
+        raise WireFormatError("Unknown value type {}".format(vtype))
+
+    def read_strs(self, count):
+        """Read strings encoded as end offsets and a blob."""
+        ends = _bytes_array('I', self.read(count * 4))
+        blob = self.read(ends[-1] if count > 0 else 0)
+        strs = []
+        start = 0
+        for end in ends:
+            data = blob[start:end]
+            strs.append(data if self.zero_copy else
+                        bytes(data).decode('utf8'))
+            start = end
+        return strs
+
+    def read_column(self, count):
+        """Read a column."""
+        ctype = bytes(self.read(1))
+        has_missing = bytes(self.read(1)) == b'\x01'
+        # Flags as ints on Python 2 too.
+        present = bytearray(self.read(count)) if has_missing else None
+        npresent = count if present is None else sum(present)
+
+        if ctype in INT_COLUMNS or ctype == COL_FLOAT:
+            typecode = INT_COLUMNS.get(ctype, 'd')
+            itemsize = array(typecode).itemsize
+            values = _bytes_array(typecode, self.read(npresent * itemsize))
+            if present is None:
+                return values
+            values = list(values)
+        elif ctype == COL_STR:
+            values = self.read_strs(npresent)
+        elif ctype == COL_ENUM:
+            words = self.read_strs(self.unpack(U32))
+            itype = bytes(self.read(1))
+            if itype not in INT_COLUMNS:
+                raise WireFormatError("Unknown index type {}".format(itype))
+            typecode = INT_COLUMNS[itype]
+            itemsize = array(typecode).itemsize
+            indices = _bytes_array(typecode, self.read(npresent * itemsize))
+            values = [words[idx] for idx in indices]
+        elif ctype == COL_OBJECT:
+            values = [self.read_value() for _ in range(npresent)]
+        else:
+            raise WireFormatError("Unknown column type {}".format(ctype))
+
+        if present is None:
+            return values
+        column = [MISSING] * count
+        it = iter(values)
+        for i in range(count):
+            if present[i]:
+                column[i] = next(it)
+        return column
+
+
+def decode(buf, zero_copy=False):
+    """Decode a frame into a data stream.
+
+    Args:
+        buf (bytes-like): Encoded frame.
+        zero_copy (bool): Decode string values as memoryview of UTF-8 bytes in
+          the buffer instead of str. Python 2 decodes them as copied bytes.
+
+    Returns:
+        ColumnarDataStream: If every record was a dict.
+        MultiDataStream: Otherwise.
+
+    Raises:
+        WireFormatError: If the frame is malformed or of unknown version.
+    """
+    reader = _Reader(buf, zero_copy)
+    magic, version, layout, count = HEADER.unpack(reader.read(HEADER.size))
+    if magic != MAGIC:
+        raise WireFormatError("Not a swak wire format frame.")
+    if version != VERSION:
+        raise WireFormatError("Unsupported wire format version {}".
+                              format(version))
+    times = _bytes_array('d', reader.read(count * 8))
+    if layout == LAYOUT_COLUMNAR:
+        keys = []
+        columns = []
+        for _ in range(reader.unpack(U32)):
+            keys.append(reader.read_key())
+            columns.append(reader.read_column(count))
+        return ColumnarDataStream(keys, times, columns)
+    elif layout == LAYOUT_GENERIC:
+        records = [reader.read_value() for _ in range(count)]
+        return MultiDataStream(list(times), records)
+    raise WireFormatError("Unknown layout {}".format(layout))
+
+
+def encode_batch(streams):
+    """Encode data streams into length prefixed frames.
+
+    Args:
+        streams (list): List of DataStream.
+
+    Returns:
+        bytes: Concatenated frames.
+    """
+    out = []
+    for ds in streams:
+        frame = encode(ds)
+        out.append(U32.pack(len(frame)))
+        out.append(frame)
+    return b''.join(out)
+
+
+def iter_frames(buf, zero_copy=False):
+    """Iterate data streams from length prefixed frames in a buffer.
+
+    Args:
+        buf (bytes-like): Concatenated frames.
+        zero_copy (bool): Decode string values as memoryview.
+
+    Yields:
+        DataStream
+    """
+    view = memoryview(buf)
+    pos = 0
+    while pos < len(view):
+        if pos + U32.size > len(view):
+            raise WireFormatError("Unexpected end of frames.")
+        size = U32.unpack(view[pos:pos + U32.size])[0]
+        pos += U32.size
+        if pos + size > len(view):
+            raise WireFormatError("Unexpected end of frames.")
+        yield decode(view[pos:pos + size], zero_copy)
+        pos += size
+
+
+def decode_batch(buf, zero_copy=False):
+    """Decode length prefixed frames in a buffer.
+
+    Args:
+        buf (bytes-like): Concatenated frames.
+        zero_copy (bool): Decode string values as memoryview.
+
+    Returns:
+        list: List of DataStream.
+    """
+    return list(iter_frames(buf, zero_copy))
+
+
+def write_frame(fileobj, ds):
+    """Write a data stream as a length prefixed frame.
+
+    Args:
+        fileobj: Binary file-like object.
+        ds (DataStream): Data stream to write.
+
+    Returns:
+        int: Written bytes.
+    """
+    frame = encode(ds)
+    fileobj.write(U32.pack(len(frame)))
+    fileobj.write(frame)
+    return U32.size + len(frame)
+
+
+def read_frames(fileobj, zero_copy=False):
+    """Read length prefixed frames from a file-like object.
+
+    Args:
+        fileobj: Binary file-like object.
+        zero_copy (bool): Decode string values as memoryview.
+
+    Yields:
+        DataStream
+    """
+    while True:
+        head = fileobj.read(U32.size)
+        if len(head) == 0:
+            return
+        if len(head) < U32.size:
+            raise WireFormatError("Unexpected end of frames.")
+        size = U32.unpack(head)[0]
+        frame = fileobj.read(size)
+        if len(frame) < size:
+            raise WireFormatError("Unexpected end of frames.")
+        yield decode(frame, zero_copy)
@@ -1,11 +1,14 @@
 """This module implements service agent test."""
 from __future__ import absolute_import
 
+import re
 import yaml
 import time
 
 from swak.agent import ServiceAgent
-from swak.plugin import ProxyOutput, ProxyInput, Modifier, Input, Output
+from swak.plugin import ProxyOutput, ProxyInput, Modifier, Input, Output,\
+    CopyOutput, LabelOutput, TextInput
+from swak.data import MultiDataStream, RawDataStream
 
 
 def init_agent_from_cfg(cfgs, dryrun=False):
@@ -98,6 +101,218 @@ matches:
     assert isinstance(plugins[1], Output)
     assert set(plugins[0].recv_queues.values()) == set(proxy_queues)
 
+    # copying output thread
+    cfgs = '''
+sources:
+    - i.counter | tag test1
+
+matches:
+    test*:
+        - o.stdout
+        - m.reform -w a 1 | o.stdout
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    plugins = agent.output_threads[0].pluginpod.plugins
+    assert isinstance(plugins[0], ProxyInput)
+    copy_output = plugins[-1]
+    assert isinstance(copy_output, CopyOutput)
+    assert len(copy_output.branches) == 2
+    assert len(copy_output.branches[1].modifiers) == 1
+
+    # routing output thread
+    cfgs = '''
+sources:
+    - i.counter | tag test1
+
+matches:
+    test*:
+        - where: {level: [ERROR, CRITICAL]}
+          to: m.reform -w alert 1 | o.stdout
+        - to: o.stdout
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    router = agent.output_threads[0].pluginpod.router
+    pipeline = router.match('test1')
+    assert len(pipeline.routes) == 1
+    assert isinstance(pipeline.routes[0][1], CopyOutput)
+    assert pipeline.output is agent.output_threads[0].pluginpod.plugins[-1]
+
+    # labelled sub-pipelines
+    cfgs = '''
+sources:
+    - i.counter | tag test1
+
+labels:
+    alert: m.reform -w alert 1 | label store
+    store: o.stdout
+
+matches:
+    test*:
+        - where: {f1: 1}
+          to: label alert
+        - to: label store
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    pod = agent.output_threads[0].pluginpod
+    alert = pod.labels['alert']
+    store = pod.labels['store']
+    assert isinstance(alert, LabelOutput)
+    assert alert.pipeline.output is store
+    pipeline = pod.router.match('test1')
+    assert pipeline.routes[0][1] is alert
+    assert pipeline.output is store
+    pipeline.emit_stream('test1', MultiDataStream([0.0, 0.0],
+                                                  [dict(f1=1), dict(f1=2)]),
+                         None)
+    out, err = capsys.readouterr()
+    # Python 2 shows unicode fields with u prefix.
+    assert len(re.findall(r"'alert': u?'1'", out)) == 1
+    assert "'f1': 2" in out
+
+    cfgs = '''
+sources:
+    - i.counter | tag test1
+
+labels:
+    a: label b
+    b: label a
+
+matches:
+    test*: label a
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    out, err = capsys.readouterr()
+    assert "jumps to itself" in err
+
+    # quotas apply to input thread routers before modifiers.
+    cfgs = '''
+sources:
+    - i.counter | m.reform -w k v | tag test1
+
+matches:
+    test*: o.stdout
+
+quota:
+    - match: test1
+      records: 1
+      policy: divert
+      divert: test.shed
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    assert len(agent.output_threads[0].pluginpod.router.quotas) == 0
+    router = agent.input_threads[0].pluginpod.router
+    assert len(router.quotas) == 1
+    # diverted records are passed to the output thread with divert tag.
+    router.emit_stream('test1', MultiDataStream([0.0, 1.0], [dict(v=1),
+                                                             dict(v=2)]),
+                       None)
+    queue = agent.input_threads[0].plugins[-1].send_queue
+    tags = []
+    while not queue.empty():
+        tag, ds, _ = queue.get()
+        tags.append(tag)
+        if tag == 'test.shed':
+            assert [record for _, record in ds] == [dict(v=2)]
+    assert sorted(tags) == ['test.shed', 'test1']
+
+    # buffered outputs are flushed in background.
+    cfgs = '''
+sources:
+    - i.counter | tag test1
+
+matches:
+    test1: o.stdout b.memory
+
+flusher:
+    tick: 0.5
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    output = agent.output_threads[0].pluginpod.plugins[-1]
+    assert output.buffer.flusher.tick == 0.5
+
+    # memory buffers and thread queues share a memory budget.
+    cfgs = '''
+sources:
+    - i.counter | tag test1
+
+matches:
+    test1: o.stdout b.memory -o drop_oldest
+
+memory:
+    max_size: 1m
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    budget = agent.budget
+    assert budget.max_size == 1024 ** 2
+    assert agent.input_threads[0].pluginpod.plugins[-1].budget is budget
+    otrd_plugins = agent.output_threads[0].pluginpod.plugins
+    assert otrd_plugins[0].budget is budget
+    assert otrd_plugins[-1].buffer.budget is budget
+    assert otrd_plugins[-1].buffer.overflow == 'drop_oldest'
+
+
+def test_agent_lazy(monkeypatch, capsys):
+    """Test lazy decoding of text inputs by config."""
+    from swak import pluginpod
+
+    class FooInput(TextInput):
+        def generate_line(self):
+            for line in ["line1", "line2"]:
+                yield line.encode('utf8')
+
+    create_plugin_by_name = pluginpod.create_plugin_by_name
+
+    def _create_plugin(plugin_name, args):
+        if plugin_name != 'i.foo':
+            return create_plugin_by_name(plugin_name, args)
+        plugin = FooInput()
+        plugin.fullname = plugin_name
+        return plugin
+
+    monkeypatch.setattr(pluginpod, 'create_plugin_by_name', _create_plugin)
+    cfgs = '''
+sources:
+    - i.foo | tag test1
+    - i.counter | tag test2
+
+matches:
+    test*: o.stdout
+
+lazy:
+    inputs: [i.foo, i.counter]
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    finput = agent.input_threads[0].plugins[0]
+    assert finput.lazy
+    streams = [ds for _, ds in finput.read(None)]
+    assert isinstance(streams[0], RawDataStream)
+    assert streams[0].raw(1).tobytes() == b"line2"
+    # not a text input.
+    assert not hasattr(agent.input_threads[1].plugins[0], 'lazy')
+
+    cfgs = '''
+sources:
+    - i.foo | tag test1
+
+matches:
+    test*: o.stdout
+    '''
+    agent = init_agent_from_cfg(cfgs, False)
+    assert not agent.input_threads[0].plugins[0].lazy
+
+    cfgs = '''
+sources:
+    - i.foo | tag test1
+
+matches:
+    test*: o.stdout
+
+lazy: true
+    '''
+    assert init_agent_from_cfg(cfgs, False) is None
+    out, err = capsys.readouterr()
+    assert "'lazy' field" in err
+
 
 def test_agent_run(capsys):
     """Test service agent run."""
@@ -6,6 +6,12 @@ from queue import Queue
 
 
 from swak.data import MultiDataStream
+from swak.datarouter import Pipeline, compile_modifiers
+from swak.plugin import Modifier, DummyOutput
+from swak.memorybuffer import MemoryBuffer
+from swak.match import MatchPattern, GlobMatchPattern
+from swak.stdplugins.filter.m_filter import Filter
+from swak.stdplugins.reform.m_reform import Reform
 
 
 def test_bench_queue_events():
@@ -60,3 +66,148 @@ def test_bench_queue_events():
     q.put(None)
     ot.join()
     assert total[0] == int(num_events * num_thread / events_per_stream)
+
+
+class AddField(Modifier):
+    """Per record modifier for benchmark."""
+
+    def modify(self, tag, utime, record):
+        """Add a field."""
+        record['tag'] = tag
+        return utime, record
+
+
+class DropOdd(Modifier):
+    """Per record modifier for benchmark."""
+
+    def modify(self, tag, utime, record):
+        """Drop records with odd score."""
+        return None if record['score'] % 2 else (utime, record)
+
+
+def _make_bench_stream(num_records):
+    times = [float(i) for i in range(num_records)]
+    records = [dict(name="kjj" if i % 2 else "xyz", score=i,
+                    host="localhost") for i in range(num_records)]
+    return MultiDataStream(times, records)
+
+
+def test_bench_compiled_pipeline():
+    """Bench interpreted & compiled pipelines."""
+    num_records = 20000
+    tag = "test.bench"
+
+    def make_pipeline():
+        pline = Pipeline(tag)
+        pline.add_modifier(AddField())
+        pline.add_modifier(DropOdd())
+        pline.add_modifier(AddField())
+        return pline
+
+    interp = make_pipeline()
+    st = time.time()
+    expected = interp.modify_stream(tag, _make_bench_stream(num_records))
+    interp_elapsed = time.time() - st
+
+    compiled = make_pipeline()
+    compiled.compile()
+    ds = _make_bench_stream(num_records)
+    st = time.time()
+    modified = compiled.modify_stream(tag, ds)
+    compiled_elapsed = time.time() - st
+
+    print("interpreted: {:.3f}s, compiled: {:.3f}s".format(interp_elapsed,
+                                                           compiled_elapsed))
+    assert len(modified) == num_records / 2
+    assert list(modified) == list(expected)
+
+
+def test_bench_batch_modifiers():
+    """Bench per record & batch modifiers."""
+    num_records = 20000
+    tag = "test.bench"
+
+    def make_modifiers():
+        return [Filter([("host", "local")], [("name", "^x")]),
+                Reform([("tag", "${tag}"), ("prev", "${record[score]}")],
+                       ["host"])]
+
+    mods = make_modifiers()
+    for mod in mods:
+        mod.prepare_for_stream(tag, None)
+    fused = compile_modifiers(mods)
+    selected = []
+    changes = {}
+    ds = _make_bench_stream(num_records)
+    st = time.time()
+    fused(tag, ds, selected.append, changes)
+    expected = Pipeline(tag).select_stream(ds, selected, changes)
+    record_elapsed = time.time() - st
+
+    pline = Pipeline(tag)
+    for mod in make_modifiers():
+        pline.add_modifier(mod)
+    pline.compile()
+    ds = _make_bench_stream(num_records)
+    st = time.time()
+    modified = pline.modify_stream(tag, ds)
+    batch_elapsed = time.time() - st
+
+    print("per record: {:.3f}s, batch: {:.3f}s".format(record_elapsed,
+                                                       batch_elapsed))
+    assert list(modified) == list(expected)
+
+
+def test_bench_match_patterns():
+    """Bench specialized & glob patterns of the documented pattern table."""
+    ptrns = ['a*', '*a*', 'a.*', 'a.*.c', 'a.**', 'a**', '**.a', 'a.{b,c}',
+             'a.b', 'a.b.**', '**']
+    tags = ['a', 'ab', 'ba', 'bac', 'a.b', 'a.c', 'a.d', 'ab.c', 'a.b.c',
+            'a.c.c', 'ab.d.e', 'b.a', 'cb.a', 'c.ba', 'a.cd']
+    num_loop = 200
+    for ptrn in ptrns:
+        specialized = MatchPattern().create(ptrn)
+        glob = GlobMatchPattern(ptrn)
+        st = time.time()
+        for _ in range(num_loop):
+            for tag in tags:
+                glob.match(tag)
+        glob_elapsed = time.time() - st
+        st = time.time()
+        for _ in range(num_loop):
+            for tag in tags:
+                specialized.match(tag)
+        spec_elapsed = time.time() - st
+        print("{:10} {:20} glob: {:.4f}s, specialized: {:.4f}s".format(
+              ptrn, type(specialized).__name__, glob_elapsed, spec_elapsed))
+        for tag in tags:
+            assert specialized.match(tag) == glob.match(tag)
+
+
+def test_bench_flusher():
+    """Bench appending with inline & background flushing to slow output."""
+    num_records = 200
+
+    class SlowOutput(DummyOutput):
+        def _write(self, bulk):
+            time.sleep(0.01)
+
+    elapsed = {}
+    for background in (False, True):
+        buf = MemoryBuffer(SlowOutput(), True, chunk_max_record=10,
+                           buffer_max_chunk=1)
+        if background:
+            buf.set_flusher()
+        buf.start()
+        st = time.time()
+        for i in range(num_records):
+            buf.append("data{}\n".format(i))
+            buf.may_flushing()
+        elapsed[background] = time.time() - st
+        buf.stop()
+        buf.flushing(True)
+
+    print("inline: {:.3f}s, background: {:.3f}s".format(elapsed[False],
+                                                        elapsed[True]))
+    # input is not slowed down by output latency.
+    assert elapsed[True] < elapsed[False]
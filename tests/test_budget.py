@@ -0,0 +1,160 @@
+"""This module implements memory budget test."""
+from __future__ import absolute_import
+
+import os
+import time
+import threading
+
+import pytest
+from queue import Queue
+
+from swak.budget import MemoryBudget, make_budget
+from swak.buffer import DiskChunk
+from swak.memorybuffer import MemoryBuffer
+from swak.plugin import DummyOutput, ProxyOutput, ProxyInput
+from swak.data import MultiDataStream
+from swak.exception import ConfigError
+
+
+def test_budget_basic():
+    """Test budget accounting."""
+    budget = MemoryBudget(10)
+    assert budget.try_acquire(6)
+    assert not budget.try_acquire(6)
+    budget.force(6)
+    assert budget.used == 12
+    budget.release(12)
+    assert budget.stats == dict(max_size=10, used=0, peak=12)
+
+    assert make_budget(dict(max_size='2k')).max_size == 2048
+    with pytest.raises(ConfigError):
+        make_budget(dict())
+    with pytest.raises(ConfigError):
+        make_budget(dict(max_size='0'))
+    with pytest.raises(ConfigError):
+        make_budget(dict(max_size='1x'))
+
+
+def _fill(buf, num):
+    """Append fixed size records."""
+    for i in range(num):
+        buf.append("data{}".format(i))
+
+
+def test_budget_buffer_block():
+    """Test buffer which flushes itself when the budget is full."""
+    budget = MemoryBudget(10)
+    output = DummyOutput()
+    buf = MemoryBuffer(output, False, chunk_max_record=2)
+    buf.set_budget(budget)
+    _fill(buf, 4)
+    # appending thread flushed older data to make room.
+    assert output.bulks == ["data0", "data1"]
+    assert budget.used == 10
+    buf.flushing(True)
+    assert budget.used == 0
+    assert budget.peak <= 10
+
+    # admitted over the budget if nothing to flush.
+    budget.force(10)
+    buf.append("data4")
+    assert budget.used == 15
+
+
+def test_budget_buffer_drop():
+    """Test buffer which drops data when the budget is full."""
+    budget = MemoryBudget(10)
+    output = DummyOutput()
+    buf = MemoryBuffer(output, False, chunk_max_record=2,
+                       overflow='drop_newest')
+    buf.set_budget(budget)
+    _fill(buf, 4)
+    assert buf.cnt_dropped == 2
+    buf.flushing(True)
+    assert output.bulks == ["data0", "data1"]
+
+    output = DummyOutput()
+    buf = MemoryBuffer(output, False, chunk_max_record=2,
+                       overflow='drop_oldest')
+    buf.set_budget(budget)
+    _fill(buf, 4)
+    assert buf.cnt_dropped == 2
+    assert budget.used == 10
+    buf.flushing(True)
+    assert output.bulks == ["data2", "data3"]
+    assert budget.used == 0
+
+
+def test_budget_buffer_spill(tmpdir):
+    """Test buffer which spills chunks to files when the budget is full."""
+    path = str(tmpdir.join('spill'))
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, overflow='spill')
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, overflow='unknown')
+
+    class CopyOutput(DummyOutput):
+        def _write(self, bulk):
+            if type(bulk) is not list:
+                bulk = bytes(bulk)
+            super(CopyOutput, self)._write(bulk)
+
+    for binary in (False, True):
+        budget = MemoryBudget(10)
+        output = CopyOutput()
+        buf = MemoryBuffer(output, binary, chunk_max_record=2,
+                           buffer_max_chunk=10, overflow='spill', spill=path)
+        buf.set_budget(budget)
+        _fill(buf, 6)
+        assert buf.cnt_spilled == 2
+        assert isinstance(buf.chunks[0], DiskChunk)
+        assert isinstance(buf.chunks[1], DiskChunk)
+        assert len(os.listdir(path)) == 2
+        assert budget.used == 10
+        buf.flushing(True)
+        assert budget.used == 0
+        assert len(os.listdir(path)) == 0
+        if binary:
+            assert b''.join(output.bulks) == b''.join(
+                "data{}".format(i).encode('utf8') for i in range(6))
+        else:
+            assert output.bulks == ["data{}".format(i) for i in range(6)]
+
+
+def test_budget_proxy():
+    """Test thread queue accounting against the budget."""
+    budget = MemoryBudget(30)
+    queue = Queue()
+    pout = ProxyOutput(queue)
+    pout.set_budget(budget)
+    pin = ProxyInput()
+    pin.set_budget(budget)
+    pin.append_recv_queue('test', queue)
+    stop_event = threading.Event()
+
+    def _ds():
+        return MultiDataStream([time.time()], [dict(k='v' * 19)])
+
+    pout.emit_stream('test', _ds(), stop_event)
+    assert budget.used == 20
+    # emitting waits until the receiver releases.
+    emitter = threading.Thread(target=pout.emit_stream,
+                               args=('test', _ds(), stop_event))
+    emitter.start()
+    time.sleep(0.2)
+    assert emitter.is_alive()
+    gen = pin.generate_stream(None, stop_event)
+    tag, ds = next(gen)
+    assert tag == 'test'
+    emitter.join(1)
+    assert not emitter.is_alive()
+    assert budget.used == 20
+    next(gen)
+    assert budget.used == 0
+
+    # stop event breaks the wait.
+    budget.force(30)
+    pout.emit_stream('test', _ds(), stop_event)
+    stop_event.set()
+    pout.emit_stream('test', _ds(), stop_event)
+    assert queue.qsize() == 1
@@ -1,11 +1,19 @@
 """This module implements buffer test."""
 from __future__ import absolute_import
 
+import os
 import time
+import shutil
+import threading
 
 import pytest
 
+from swak import buffer
+from swak.budget import MemoryBudget
 from swak.memorybuffer import MemoryBuffer
+from swak.filebuffer import FileBuffer
+from swak.journal import JOURNAL_ROTATE_SIZE
+from swak.plugin import DummyOutput
 from swak.exception import ConfigError
 
 
@@ -126,3 +134,235 @@ def test_buffer_multi(def_output):
     assert buf.cnt_chunking == 1
     buf.flushing(True)
     assert len(def_output.bulks) == 2
+
+
+def test_buffer_file(tmpdir):
+    """Test file buffer."""
+    path = str(tmpdir.join('buf'))
+    output = DummyOutput()
+    buf = FileBuffer(output, False, path, chunk_max_record=2)
+    assert not buf.memory
+    for i in range(5):
+        buf.append("data{}".format(i))
+    assert buf.num_chunk == 3
+    assert sorted(tmpdir.join('buf').listdir()) ==\
+        [tmpdir.join('buf', 'chunk.{}.t'.format(i)) for i in range(3)]
+    buf.flushing()
+    assert output.bulks == ["data0", "data1"]
+    assert not tmpdir.join('buf', 'chunk.0.t').exists()
+
+    # chunks left unflushed are recovered in order.
+    buf.active_chunk.sync()
+    output = DummyOutput()
+    buf = FileBuffer(output, False, path)
+    assert buf.num_chunk == 3
+    assert buf.seq == 4
+    buf.append("data5")
+    buf.flushing(True)
+    assert output.bulks == ["data2", "data3", "data4", "data5"]
+    assert tmpdir.join('buf').listdir() == []
+
+
+def test_buffer_file_binary(tmpdir):
+    """Test binary file buffer."""
+    path = str(tmpdir.join('buf'))
+
+    class CopyOutput(DummyOutput):
+        def _write(self, bulk):
+            self.bulks.append(bytes(bulk))
+
+    output = CopyOutput()
+    buf = FileBuffer(output, True, path)
+    buf.append("data0\n")
+    buf.append(b"data1\n", True)
+    buf.flushing(True)
+    assert output.bulks == [b"data0\ndata1\n"]
+
+    # sent to the output file directly.
+    out_path = tmpdir.join('out')
+    with open(str(out_path), 'wb') as f:
+        output.fileno = f.fileno
+        buf.append("data2\n")
+        buf.flushing(True)
+    if hasattr(os, 'sendfile'):
+        assert out_path.read_binary() == b"data2\n"
+        assert output.bulks == [b"data0\ndata1\n"]
+    else:
+        assert output.bulks == [b"data0\ndata1\n", b"data2\n"]
+
+    # partial text record is truncated at recovery.
+    with open(os.path.join(path, 'chunk.7.t'), 'wb') as f:
+        f.write(b"\x05\x00\x00\x00data0\x05\x00\x00\x00da")
+    # binary chunk is skipped by text buffer.
+    with open(os.path.join(path, 'chunk.8.b'), 'wb') as f:
+        f.write(b"data1\n")
+    output = DummyOutput()
+    buf = FileBuffer(output, False, path)
+    assert buf.num_chunk == 2
+    buf.flushing(True)
+    assert output.bulks == ["data0"]
+    assert os.listdir(path) == ['chunk.8.b']
+
+    # chunk file with no whole record is removed at recovery.
+    with open(os.path.join(path, 'chunk.9.t'), 'wb') as f:
+        f.write(b"\x05\x00\x00\x00da")
+    buf = FileBuffer(output, False, path)
+    assert os.listdir(path) == ['chunk.8.b']
+    buf.append("data2")
+    buf.flushing(True)
+    assert output.bulks == ["data0", "data2"]
+    assert os.listdir(path) == ['chunk.8.b']
+
+    with pytest.raises(ConfigError):
+        FileBuffer(output, False, None)
+
+
+def test_buffer_journal(tmpdir):
+    """Test journal of memory buffer."""
+    path = str(tmpdir.join('journal'))
+    output = DummyOutput()
+    buf = MemoryBuffer(output, False, chunk_max_record=2, journal=path,
+                       journal_sync='1s')
+    for i in range(5):
+        buf.append("data{}".format(i))
+    # appends share one sync in the interval.
+    assert buf.journal.cnt_sync == 1
+    buf.flushing()
+    assert output.bulks == ["data0", "data1"]
+    buf.journal.sync()
+
+    # crash without flushing, and only data not flushed are replayed.
+    output = DummyOutput()
+    buf = MemoryBuffer(output, False, journal=path)
+    assert buf.num_chunk == 3
+    buf.append("data5")
+    buf.flushing(True)
+    assert output.bulks == ["data2", "data3", "data4", "data5"]
+    buf.shutdown()
+    buf = MemoryBuffer(output, True, journal=path)
+    assert buf.num_chunk == 1 and buf.active_chunk.empty()
+
+    # journal is rewritten with pending chunks when grown.
+    buf.append(b"data6\n", True)
+    buf.append(b"data7\n", True)
+    buf.journal.written = JOURNAL_ROTATE_SIZE
+    buf.chunking()
+    buf.flushing()
+    assert buf.journal.written == 0
+    buf.journal.close()
+    output = DummyOutput()
+    buf = MemoryBuffer(output, True, journal=path)
+    buf.flushing(True)
+    assert output.bulks == []
+    buf.journal.close()
+
+    # not rewritten while another thread is writing a chunk.
+    class BlockOutput(DummyOutput):
+        def _write(self, bulk):
+            if bulk == ["data8"]:
+                writing.set()
+                resume.wait(1)
+            super(BlockOutput, self)._write(bulk)
+
+    writing = threading.Event()
+    resume = threading.Event()
+    output = BlockOutput()
+    buf = MemoryBuffer(output, False, chunk_max_record=1, journal=path)
+    buf.append("data8")
+    buf.append("data9")
+    flusher = threading.Thread(target=buf.flushing)
+    flusher.start()
+    assert writing.wait(1)
+    buf.journal.written = JOURNAL_ROTATE_SIZE
+    buf.flushing()
+    assert output.bulks == ["data9"]
+    assert buf.journal.need_rotate()
+    buf.journal.sync()
+    # crash while writing, and the chunk being written is replayed.
+    shutil.copy(path, path + '.copy')
+    replayed = MemoryBuffer(DummyOutput(), False, journal=path + '.copy')
+    replayed.flushing(True)
+    assert replayed.output.bulks == ["data8"]
+    replayed.journal.close()
+    resume.set()
+    flusher.join(1)
+    # rotated by the last flush.
+    assert not buf.journal.need_rotate()
+    assert buf.writing == []
+    buf.journal.close()
+
+    with pytest.raises(ConfigError):
+        MemoryBuffer(None, False, journal=path, journal_sync='-1s')
+
+
+def test_buffer_flusher():
+    """Test flushing in background thread."""
+    class SlowOutput(DummyOutput):
+        def _write(self, bulk):
+            time.sleep(0.05)
+            super(SlowOutput, self)._write(bulk)
+
+    output = SlowOutput()
+    buf = MemoryBuffer(output, False, chunk_max_record=1, buffer_max_chunk=1)
+    buf.set_flusher(0.01)
+    buf.start()
+    st = time.time()
+    for i in range(5):
+        buf.append("data{}".format(i))
+        assert buf.may_flushing() is None
+    # appending is not blocked by writing.
+    assert time.time() - st < 0.05
+    time.sleep(0.5)
+    assert output.bulks == ["data0", "data1", "data2", "data3"]
+    buf.stop()
+    assert not buf.flusher.is_alive()
+    buf.flushing(True)
+    assert output.bulks[-1] == "data4"
+
+
+def test_buffer_retry(monkeypatch):
+    """Test writing a chunk again after a write failure."""
+    class FailOutput(DummyOutput):
+        def _write(self, bulk):
+            if self.fails > 0:
+                self.fails -= 1
+                raise IOError("output is down")
+            super(FailOutput, self)._write(bulk)
+
+    output = FailOutput()
+    output.fails = 1
+    buf = MemoryBuffer(output, False, chunk_max_record=1, buffer_max_chunk=1)
+    budget = MemoryBudget(100)
+    buf.set_budget(budget)
+    buf.append("data0")
+    buf.append("data1")
+    with pytest.raises(IOError):
+        buf.may_flushing()
+    # the chunk is put back to the head with its budget.
+    assert buf.num_chunk == 2
+    assert buf.chunks[0].bulk == ["data0"]
+    assert buf.writing == []
+    assert budget.used == 10
+    # no flushing while backing off.
+    assert buf.backing_off()
+    assert buf.may_flushing() is None
+    assert output.bulks == []
+    buf.retry_at = 0
+    buf.may_flushing()
+    assert output.bulks == ["data0"]
+    assert budget.used == 5
+    assert buf.retry_wait == 0
+
+    # flusher thread retries with doubled wait.
+    monkeypatch.setattr(buffer, 'FLUSH_RETRY_MIN_WAIT', 0.05)
+    output = FailOutput()
+    output.fails = 2
+    buf = MemoryBuffer(output, False, chunk_max_record=1, buffer_max_chunk=1)
+    buf.set_flusher(0.01)
+    buf.start()
+    buf.append("data0")
+    buf.append("data1")
+    time.sleep(0.5)
+    assert output.fails == 0
+    assert output.bulks == ["data0"]
+    buf.stop()
@@ -91,9 +91,20 @@ matches:
 sources:
     - i.counter | tag foo
 matches:
-    boo:
-        - o.stdout
-    ''', capsys, "each match must be a string.")
+    foo:
+        - 1
+    ''', capsys, "each copying match must be a string.")
+
+    assert_cfg_error('''
+sources:
+    - i.counter | tag foo
+matches:
+    foo:
+        - where: {level: ERROR}
+          to: o.stdout
+        - to: o.stdout
+        - to: o.stdout
+    ''', capsys, "only one route without 'where' field.")
 
     assert_cfg_error('''
 sources:
@@ -1,11 +1,18 @@
 """This module implements    test."""
 import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 import pytest
 
 from swak.stdplugins.filter.m_filter import Filter
 from swak.stdplugins.reform.m_reform import Reform
-from swak.plugin import DummyOutput
+from swak.plugin import DummyOutput, Modifier
+from swak.datarouter import Pipeline, ParallelStage, DataRouter
+from swak.predicate import PredicateIndex
+from swak.data import MultiDataStream, SelectedDataStream, \
+    ColumnarDataStream
+from swak.exception import ConfigError
 
 
 @pytest.fixture()
@@ -111,3 +118,287 @@ def test_datarouter_complex(agent):
     assert len(router.match_cache['a'].modifiers) == 2
     assert len(router.match_cache['b'].modifiers) == 2
     assert len(router.match_cache['c'].modifiers) == 1
+
+
+class Double(Modifier):
+    """Per record modifier for test."""
+
+    def modify(self, tag, utime, record):
+        """Double value."""
+        record['v'] *= 2
+        return utime, record
+
+
+def test_datarouter_stages():
+    """Test pipeline stages of batch & per record modifiers."""
+    pline = Pipeline("test")
+    pline.add_modifier(Double())
+    pline.add_modifier(Double())
+    pline.add_modifier(Filter([("k", "v")]))
+    pline.add_modifier(Double())
+    for fuse in (False, True):
+        stages = pline.make_stages(fuse)
+        assert [batch for batch, _ in stages] == [False, True, False]
+        assert len(stages[0][1][0]) == 2
+        assert (stages[0][1][1] is not None) == fuse
+
+    ds = MultiDataStream([0.0, 1.0], [dict(k="v", v=1), dict(k="x", v=1)])
+    pline.compile()
+    modified = pline.modify_stream("test", ds)
+    assert list(modified) == [(0.0, dict(k="v", v=8))]
+
+
+class Replace(Modifier):
+    """Per record modifier which returns a new record for test."""
+
+    def modify(self, tag, utime, record):
+        """Replace record."""
+        return utime, dict(record, r=1)
+
+
+def test_datarouter_selection():
+    """Test selection of records without rebuilding streams."""
+    pline = Pipeline("test")
+    pline.add_modifier(Double())
+    pline.add_modifier(Filter([("k", "v")]))
+    pline.compile()
+
+    # every record passes unchanged.
+    ds = MultiDataStream([0.0, 1.0], [dict(k="v", v=1), dict(k="v", v=2)])
+    assert pline.modify_stream("test", ds) is ds
+    assert ds.records == [dict(k="v", v=2), dict(k="v", v=4)]
+
+    # dropped records are skipped by a selection view.
+    pline = Pipeline("test")
+    pline.add_modifier(Double())
+    pline.add_modifier(Filter([("k", "v")]))
+    pline.add_modifier(Double())
+    pline.compile()
+    ds = MultiDataStream([0.0, 1.0, 2.0], [dict(k="v", v=1), dict(k="x", v=2),
+                                           dict(k="v", v=3)])
+    modified = pline.modify_stream("test", ds)
+    assert isinstance(modified, SelectedDataStream)
+    assert modified.parent is ds
+    assert list(modified) == [(0.0, dict(k="v", v=4)),
+                              (2.0, dict(k="v", v=12))]
+
+    # replaced records make a new stream.
+    pline = Pipeline("test")
+    pline.add_modifier(Replace())
+    pline.add_modifier(Double())
+    pline.compile()
+    ds = MultiDataStream([0.0], [dict(v=1)])
+    modified = pline.modify_stream("test", ds)
+    assert type(modified) is MultiDataStream
+    assert modified.records == [dict(v=2, r=1)]
+    assert ds.records == [dict(v=1)]
+
+    # in place changes of records built on access are kept.
+    pline = Pipeline("test")
+    pline.add_modifier(Double())
+    pline.compile()
+    ds = ColumnarDataStream.from_records([0.0, 1.0], [dict(v=1), dict(v=2)])
+    modified = pline.modify_stream("test", ds)
+    assert list(modified) == [(0.0, dict(v=2)), (1.0, dict(v=4))]
+
+
+def test_datarouter_cache(router):
+    """Test bounded pipeline cache."""
+    router.set_cache(2)
+    router.emit("a", 0, {})
+    router.emit("b", 0, {})
+    router.emit("a", 0, {})
+    # "b" is least recently used.
+    router.emit("c", 0, {})
+    assert list(router.match_cache.keys()) == ['a', 'c']
+    stats = router.cache_stats
+    assert stats['hits'] == 1
+    assert stats['misses'] == 3
+    assert stats['evictions'] == 1
+    router.set_cache(1)
+    assert list(router.match_cache.keys()) == ['c']
+    with pytest.raises(ConfigError):
+        router.set_cache(0)
+
+    # fold tags which match the same rules.
+    router.set_cache(10, True)
+    assert len(router.match_cache) == 0
+    router.add_rule("host.*", Reform([('h', "1")]), False)
+    for i in range(5):
+        router.emit("host.{}".format(i), 0, {})
+    router.emit("other", 0, {})
+    plines = set(id(pline) for pline in router.match_cache.values())
+    assert len(router.match_cache) == 6
+    assert len(plines) == 2
+    assert router.cache_stats['shared'] == 2
+
+
+def test_datarouter_dynamic_rule(router):
+    """Test adding & removing rules at runtime."""
+    router.emit("a.b", 0, {})
+    router.emit("c.d", 0, {})
+    pline_cd = router.match_cache["c.d"]
+
+    # only pipelines of matching tags are invalidated.
+    reform = Reform([('r', "1")])
+    router.add_rule("a.**", reform, False)
+    assert list(router.match_cache.keys()) == ["c.d"]
+    router.def_output.reset()
+    router.emit("a.b", 0, {})
+    assert "'r': '1'" in router.def_output.bulks[0]
+    assert router.match_cache["c.d"] is pline_cd
+
+    assert router.remove_rule(reform) == 1
+    assert router.remove_rule(reform) == 0
+    assert "a.b" not in router.match_cache
+    router.def_output.reset()
+    router.emit("a.b", 0, {})
+    assert "'r'" not in router.def_output.bulks[0]
+    assert router.cache_stats['invalidations'] == 2
+
+    # rule changes wait until the routing thread releases the router.
+    changed = threading.Event()
+
+    def change():
+        router.add_rule("a.**", reform, False)
+        changed.set()
+
+    with router.lock:
+        trd = threading.Thread(target=change)
+        trd.start()
+        assert not changed.wait(0.1)
+    trd.join()
+    assert changed.is_set()
+
+
+def test_datarouter_parallel():
+    """Test running parallel modifiers in worker processes."""
+    def make_pipeline(executor):
+        pline = Pipeline("test")
+        for mod in [Double(), Filter([("k", "v")]), Reform([("r", "1")])]:
+            mod.set_parallel(not isinstance(mod, Double))
+            pline.add_modifier(mod)
+        if executor is not None:
+            pline.set_executor(executor, 3, 1)
+        pline.compile()
+        return pline
+
+    def make_stream():
+        return MultiDataStream([float(i) for i in range(10)],
+                               [dict(k="v" if i % 3 else "x", v=i)
+                                for i in range(10)])
+
+    expected = make_pipeline(None).modify_stream("test", make_stream())
+    executor = ProcessPoolExecutor(2)
+    try:
+        pline = make_pipeline(executor)
+        assert [batch for batch, _ in pline.stages] == [False, True]
+        assert isinstance(pline.stages[1][1], ParallelStage)
+        modified = pline.modify_stream("test", make_stream())
+    finally:
+        executor.shutdown()
+    assert list(modified) == list(expected)
+
+    # short streams share one in process pipeline.
+    stage = pline.stages[1][1]
+    stage.min_record = 100
+    stage.modify_stream("test", make_stream())
+    local = stage.local
+    assert local is not None and local.profile_interval is None
+    stage.modify_stream("test", make_stream())
+    assert stage.local is local
+
+
+def test_datarouter_routes():
+    """Test routing records by field predicates."""
+    index = PredicateIndex([dict(level="ERROR"),
+                            dict(level=["WARN", "ERROR"], app="a"),
+                            dict(app="b")])
+    assert index.route(dict(level="ERROR", app="a")) == 0
+    assert index.route(dict(level="WARN", app="a")) == 1
+    assert index.route(dict(level="WARN", app="b")) == 2
+    assert index.route(dict(level="INFO", app="c")) == 3
+    assert index.route(dict(level=["ERROR"])) == 3
+
+    error_output = DummyOutput()
+    b_output = DummyOutput()
+    def_output = DummyOutput()
+    router = DataRouter(def_output)
+    router.add_rule("test", Double(), False)
+    router.add_rule("test", error_output, False, dict(level="ERROR"))
+    router.add_rule("test", b_output, False, dict(app="b"))
+    ds = MultiDataStream([0.0, 1.0, 2.0, 3.0],
+                         [dict(level="ERROR", app="b", v=1),
+                          dict(level="INFO", app="b", v=1),
+                          dict(level="INFO", app="a", v=1),
+                          dict(level="ERROR", app="a", v=1)])
+    router.emit_stream("test", ds, None)
+    assert len(error_output.bulks) == 2
+    assert len(b_output.bulks) == 1
+    assert len(def_output.bulks) == 1
+    # modifiers run before routing.
+    assert "'v': 2" in b_output.bulks[0]
+
+    # only output rules have predicates.
+    with pytest.raises(ConfigError):
+        router.add_rule("test", Double(), False, dict(level="ERROR"))
+
+
+class Slow(Modifier):
+    """Expensive commutative modifier for test."""
+
+    commutative = True
+
+    def __init__(self, writes):
+        """Init."""
+        self.writes = set(writes)
+
+    def read_fields(self):
+        """Read no field."""
+        return set()
+
+    def write_fields(self):
+        """Return written fields."""
+        return self.writes
+
+    def modify_stream(self, tag, ds):
+        """Write fields slowly."""
+        time.sleep(0.01)
+        for _, record in ds:
+            for key in self.writes:
+                record[key] = "1"
+        return ds
+
+
+def test_datarouter_reorder():
+    """Test reordering commutative modifiers by profiled statistics."""
+    slow = Slow(["w"])
+    filtr = Filter([("k", "v")])
+    pline = Pipeline("test")
+    pline.add_modifier(slow)
+    pline.add_modifier(filtr)
+    pline.compile()
+    ds = MultiDataStream([0.0] * 10, [dict(k="v" if i == 0 else "x")
+                                      for i in range(10)])
+    modified = pline.modify_stream("test", ds)
+    assert list(modified) == [(0.0, dict(k="v", w="1"))]
+    # the selective filter runs first.
+    assert pline.modifiers == [filtr, slow]
+    stats = pline.stats
+    assert stats[0]['modifier'] is filtr
+    assert stats[0]['drop_rate'] == 0.9
+    assert stats[1]['records'] == 10
+
+    # not profiled until the interval.
+    pline.modify_stream("test", MultiDataStream([0.0], [dict(k="v")]))
+    assert pline.stats[0]['records'] == 10
+
+    # conflicting or non commutative modifiers are not reordered.
+    for slow in (Slow(["k"]), Double()):
+        pline = Pipeline("test")
+        pline.add_modifier(slow)
+        pline.add_modifier(Filter([("k", "v")]))
+        ds = MultiDataStream([0.0] * 10, [dict(k="v", v=1)
+                                          for i in range(10)])
+        pline.modify_stream("test", ds)
+        assert pline.modifiers[0] is slow
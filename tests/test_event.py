@@ -1,5 +1,8 @@
 """This module implements data test."""
-from swak.data import MultiDataStream
+from array import array
+
+from swak.data import DataStream, OneDataStream, MultiDataStream,\
+    ColumnarDataStream, MISSING
 
 
 def test_data_basic():
@@ -11,3 +14,74 @@ def test_data_basic():
     list(ds)
     assert len([r for r in ds]) == 2
     assert len(ds) == 2
+
+
+def test_data_columnar():
+    """Test columnar data stream."""
+    times = [0, 1, 2]
+    records = [dict(a=1, b="x"), dict(a=2), dict(a=3, c=1.5)]
+
+    ds = ColumnarDataStream.from_records(times, records)
+    assert len(ds) == 3
+    assert isinstance(ds.times, array)
+    assert ds.keys == ['a', 'b', 'c']
+    assert ds.column('a') == [1, 2, 3]
+    assert ds.column('b') == ["x", MISSING, MISSING]
+    # iterates as (utime, record) like other streams.
+    assert list(ds) == list(zip(times, records))
+    assert ds.records == records
+
+    # column-at-a-time modification
+    ds.set_column('d', [v * 10 for v in ds.column('a')])
+    ds.del_column('b')
+    assert ds.keys == ['a', 'c', 'd']
+    assert ds.record(1) == dict(a=2, d=20)
+
+    # typed columns
+    ds.compact()
+    assert isinstance(ds.column('a'), array)
+    assert not isinstance(ds.column('c'), array)
+    ds.append(3, dict(a="str"))
+    assert ds.column('a') == [1, 2, 3, "str"]
+    assert ds.record(3) == dict(a="str")
+
+
+def test_data_view():
+    """Test slicing, splitting and concatenation of data streams."""
+    times = list(range(10))
+    records = [dict(i=i) for i in range(10)]
+    ds = MultiDataStream(times, records)
+
+    # iteration is reentrant.
+    it1 = iter(ds)
+    it2 = iter(ds)
+    assert next(it1) == next(it2) == (0, dict(i=0))
+    assert next(it1) == (1, dict(i=1))
+
+    # views share records with the parent.
+    view = ds[2:5]
+    assert len(view) == 3
+    assert [r['i'] for _, r in view] == [2, 3, 4]
+    assert view[0][1] is records[2]
+    assert view[-1] == (4, dict(i=4))
+    assert len(view[1:]) == 2
+    assert view[1:][0] == (3, dict(i=3))
+    assert ds[5:2].empty()
+    assert ds[:] is ds
+
+    # split
+    parts = ds.split(3)
+    assert [len(p) for p in parts] == [4, 3, 3]
+    assert [u for p in parts for u, _ in p] == times
+
+    # concat
+    cat = DataStream.concat(parts + [OneDataStream(10, dict(i=10))])
+    assert len(cat) == 11
+    assert [u for u, _ in cat] == times + [10]
+    assert cat[4] == (4, dict(i=4))
+    assert [u for u, _ in cat[3:8]] == [3, 4, 5, 6, 7]
+    assert cat[3:8][4] == (7, dict(i=7))
+
+    # columnar stream views
+    cds = ColumnarDataStream.from_records(times, records)
+    assert [r for _, r in cds[8:]] == [dict(i=8), dict(i=9)]
@@ -1,6 +1,10 @@
 """Test match."""
 
-from swak.match import GlobMatchPattern
+import itertools
+
+from swak.match import GlobMatchPattern, TagMatcher, expand_braces,\
+    MatchPattern, AllMatchPattern, ExactMatchPattern, PrefixMatchPattern,\
+    SuffixMatchPattern, SetMatchPattern
 from swak.datarouter import Rule
 
 
@@ -124,3 +128,74 @@ def test_match_multi_pattern_or():
     assert_or_match('a.b.** a.c', 'a.b.c')
     assert_or_match('a.b.** a.c', 'a.c')
     assert_or_not_match('a.b.** a.c', 'a.c.d')
+
+
+def test_match_expand_braces():
+    """Test brace expansion."""
+    assert expand_braces('a.b') == ['a.b']
+    assert expand_braces('a.{b,c}') == ['a.b', 'a.c']
+    assert expand_braces('a.{b.**,c}.d') == ['a.b.**.d', 'a.c.d']
+    assert expand_braces('{a,b{c,d}}') == ['a', 'bc', 'bd']
+    assert expand_braces('a.{b') is None
+    assert expand_braces('a.b}') is None
+
+
+def test_match_tag_matcher():
+    """Test combined tag matcher agrees with glob patterns."""
+    ptrns = ['a', 'a.b', 'a*', '*a', '*a*', 'a.*', 'a.*.c', 'a.**', 'a**',
+             '**.a', '**a', 'a.{b,c}', 'a.{b,c}.**', 'a.{b.**,c}', '**',
+             'a.**.c', '{a,b}*.c']
+    matcher = TagMatcher()
+    for i, ptrn in enumerate(ptrns):
+        matcher.add(ptrn, i)
+    # patterns with partial ``**`` fall back to regex.
+    assert len(matcher.fallbacks) == 2
+
+    segs = ['a', 'b', 'c', 'ab', 'ba', 'cd']
+    for cnt in range(1, 4):
+        for parts in itertools.product(segs, repeat=cnt):
+            tag = '.'.join(parts)
+            expected = [i for i, ptrn in enumerate(ptrns)
+                        if GlobMatchPattern(ptrn).match(tag)]
+            assert matcher.match(tag) == expected, tag
+
+    # regex metacharacters are literal.
+    ptrns = ['a+*', 'x|*', 'a(*', '*)', 'a?', '[a]*', '^a*', '*$', 'a.*^']
+    matcher = TagMatcher()
+    for i, ptrn in enumerate(ptrns):
+        matcher.add(ptrn, i)
+    assert len(matcher.fallbacks) == 0
+    for tag in ['aaa', 'y', 'a', 'a+b', 'x|y', 'a(', 'b)', 'a?', 'ab',
+                '[a]b', '^ab', 'b$', 'a.b^', 'a.b']:
+        expected = [i for i, ptrn in enumerate(ptrns)
+                    if GlobMatchPattern(ptrn).match(tag)]
+        assert matcher.match(tag) == expected, tag
+
+
+def test_match_specialized():
+    """Test specialized patterns."""
+    def create(ptrn):
+        return MatchPattern().create(ptrn)
+
+    assert isinstance(create('**'), AllMatchPattern)
+    assert isinstance(create('a.b'), ExactMatchPattern)
+    assert isinstance(create('a.**'), PrefixMatchPattern)
+    assert isinstance(create('a**'), PrefixMatchPattern)
+    assert isinstance(create('**.a'), SuffixMatchPattern)
+    assert isinstance(create('**a'), SuffixMatchPattern)
+    assert isinstance(create('a.{b,c}'), SetMatchPattern)
+    assert isinstance(create('a.*'), GlobMatchPattern)
+
+    assert_or_match('**', 'a.b')
+    assert_or_match('**', '')
+    assert_or_match('web-01.**', 'web-01.access')
+    assert_glob_match('web-01.*', 'web-01.access')
+    assert_glob_not_match('web-01.*', 'web#-01.access')
+
+    segs = ['a', 'b', 'ab', 'a-b']
+    for ptrn in ['a.b', 'a.**', 'a**', '**.a', '**a', 'a.{b,a-b}']:
+        for cnt in range(1, 4):
+            for parts in itertools.product(segs, repeat=cnt):
+                tag = '.'.join(parts)
+                assert create(ptrn).match(tag) ==\
+                    GlobMatchPattern(ptrn).match(tag), (ptrn, tag)
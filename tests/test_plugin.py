@@ -2,14 +2,23 @@
 from __future__ import absolute_import
 
 import os
+import ast
 import types
+import threading
 
 from swak.config import get_exe_dir
 from swak.plugin import iter_plugins, import_plugins_package, TextInput,\
-    Parser, get_plugins_dir, Output
+    Parser, get_plugins_dir, Output, RecordInput, DummyOutput, CopyOutput,\
+    ProxyOutput, DEFAULT_BATCH_MAX_WAIT
+from swak.datarouter import Pipeline
+from swak.stdplugins.reform.m_reform import Reform
+from swak.stdplugins.filter.m_filter import Filter
+from swak.pluginpod import PluginPod
 # from swak.util import test_logconfig
 from swak.const import PLUGINDIR_PREFIX
 from swak.memorybuffer import MemoryBuffer
+from swak.formatter import RawFormatter, StdoutFormatter
+from swak.data import RawDataStream, MultiDataStream
 
 
 # test_logconfig()
@@ -88,3 +97,274 @@ def test_plugin_output():
     assert out.buffer.started
     out.stop()
     assert not out.buffer.started
+
+
+def test_plugin_batch():
+    """Test micro-batching of input data stream."""
+    class FooInput(RecordInput):
+        def __init__(self, records):
+            super(FooInput, self).__init__()
+            self.records = records
+
+        def generate_record(self):
+            for record in self.records:
+                yield record
+
+    # batch by record count, blank records are omitted.
+    records = [dict(i=i) if i % 3 else {} for i in range(10)]
+    finput = FooInput(records)
+    finput.set_batch(max_record=2)
+    # thresholds not given are kept.
+    assert finput.batch_max_wait == DEFAULT_BATCH_MAX_WAIT
+    streams = [ds for _, ds in finput.read(None)]
+    assert [len(ds) for ds in streams] == [2, 2, 2]
+    assert [r['i'] for ds in streams for _, r in ds] == [1, 2, 4, 5, 7, 8]
+
+    # batch by estimated size.
+    finput = FooInput([dict(k='v' * 10)] * 5)
+    finput.set_batch(max_record=100, max_size=20)
+    assert [len(ds) for _, ds in finput.read(None)] == [2, 2, 1]
+
+    # batch by waiting time.
+    finput = FooInput([dict(k=1)] * 3)
+    finput.set_batch(max_wait=0)
+    assert [len(ds) for _, ds in finput.read(None)] == [1, 1, 1]
+    finput.set_batch(max_wait=None)
+    assert finput.batch_max_wait is None
+
+    # blank record means idle source, yield batch so far.
+    finput = FooInput([dict(k=1), {}, {}, dict(k=2), dict(k=3)])
+    assert [len(ds) for _, ds in finput.read(None)] == [1, 2]
+
+    # stop event is checked once per batch.
+    stop_event = threading.Event()
+    stop_event.set()
+    finput = FooInput([dict(k=1)] * 5)
+    finput.set_batch(max_record=2)
+    assert [len(ds) for _, ds in finput.read(stop_event)] == [2]
+
+
+def test_plugin_lazy():
+    """Test lazy decoding of text input."""
+    parsed = []
+
+    class FooInput(TextInput):
+        def generate_line(self):
+            for line in ["john 1", "jane 2", "smith 3"]:
+                yield line.encode('utf8')
+
+    class FooParser(Parser):
+        def parse(self, line):
+            parsed.append(line)
+            name, rank = line.split()
+            return dict(name=name, rank=rank)
+
+    class FooOutput(Output):
+        def _write(self, bulk):
+            self.bulk = bytes(bulk)
+
+    dtinput = FooInput()
+    dtinput.set_encoding('utf8')
+    dtinput.set_parser(FooParser())
+    dtinput.set_lazy(True)
+    dtinput.set_filter_func(lambda line: 'j' in line)
+    streams = [ds for _, ds in dtinput.read(None)]
+    assert len(streams) == 1
+    ds = streams[0]
+    assert isinstance(ds, RawDataStream)
+    assert ds.raw(1).tobytes() == b"jane 2"
+    assert len(parsed) == 0
+
+    # raw lines are copied straight into the binary buffer.
+    output = FooOutput(RawFormatter(), MemoryBuffer(None, True))
+    output.emit_stream("test", ds, None)
+    output.flush()
+    assert output.bulk == b"john 1\njane 2\n"
+    assert len(parsed) == 0
+
+    # decode when a record is accessed.
+    assert ds[1][1] == dict(name="jane", rank="2")
+    assert parsed == ["jane 2"]
+    assert ds.materialized
+
+
+def test_plugin_pushdown():
+    """Test pushing filters down to text input."""
+    parsed = []
+
+    class AccessInput(TextInput):
+        def generate_line(self):
+            for line in ["/health 200", "/login 200", "/health 500",
+                         "/order 404"]:
+                yield line
+
+    class AccessParser(Parser):
+        def parse(self, line):
+            parsed.append(line)
+            path, status = line.split()
+            return dict(path=path, status=status)
+
+        def raw_field(self, key):
+            if key == 'path':
+                return lambda line: line.split(' ', 1)[0]
+
+    pod = PluginPod(DummyOutput())
+    tinput = AccessInput()
+    tinput.set_parser(AccessParser())
+    pod.register_plugin("test", tinput)
+    pod.register_plugin("test", Reform([("host", "a")]))
+    pod.register_plugin("test", Filter([], [("path", "^/health")]))
+    # a filter after a modifier writing its field is not pushed.
+    pod.register_plugin("test", Reform([("status", "200")]))
+    pod.register_plugin("test", Filter([("status", "200")]))
+    assert pod.push_down_filters() == 1
+
+    records = [record for _, record in tinput.generate_data(None)]
+    assert parsed == ["/login 200", "/order 404"]
+    assert records == [dict(path="/login", status="200"),
+                       dict(path="/order", status="404")]
+
+    # whole line excludes are pushed without a parser.
+    pod = PluginPod(DummyOutput())
+    tinput = AccessInput()
+    pod.register_plugin("test", tinput)
+    pod.register_plugin("test", Filter([("path", "^/login")]))
+    pod.register_plugin("test", Filter([], [], [" 200$"]))
+    assert pod.push_down_filters() == 1
+    records = [record for _, record in tinput.generate_data(None)]
+    assert records == ["/health 500", "/order 404"]
+
+    # pushed filters give the same output as the pipeline.
+    def process(parser, push):
+        output = DummyOutput()
+        pod = PluginPod(output)
+        tinput = AccessInput()
+        tinput.set_parser(parser)
+        pod.register_plugin("test", tinput)
+        pod.register_plugin("test", Filter([], [("path", "^/login")],
+                                           [" 500$"]))
+        pod.register_plugin("test", output)
+        if push:
+            pod.push_down_filters()
+        pod.simple_process(tinput)
+        return [bulk.split('\t')[-1] for bulk in output.bulks]
+
+    for parser in [None, AccessParser()]:
+        assert process(parser, True) == process(parser, False)
+    assert process(None, False) == ["/health 200", "/login 200",
+                                    "/order 404"]
+    assert len(process(AccessParser(), False)) == 3
+    assert "'/login'" not in ''.join(process(AccessParser(), False))
+
+
+def test_plugin_projection():
+    """Test projecting fields the pipeline uses to the parser."""
+    class WideInput(TextInput):
+        def generate_line(self):
+            yield "1 2 3 4 5"
+
+    class WideParser(Parser):
+        def parse(self, line):
+            record = dict(zip("abcde", line.split()))
+            if self.fields is None:
+                return record
+            return dict((k, v) for k, v in record.items() if k in
+                        self.fields)
+
+    class FieldsFormatter(StdoutFormatter):
+        def emit_fields(self):
+            return set(["a", "b"])
+
+    output = DummyOutput()
+    output.formatter = FieldsFormatter()
+    pod = PluginPod(output)
+    tinput = WideInput()
+    tinput.set_parser(WideParser())
+    pod.register_plugin("test", tinput)
+    pod.register_plugin("test", Reform([("c", "${record[d]}")], ["b"]))
+    pod.register_plugin("test", Filter([("e", "5")]))
+    pod.register_plugin("test", output)
+    assert pod.project_fields() == set(["a", "d", "e"])
+    # fields the formatter emits are not changed.
+    assert output.formatter.emit_fields() == set(["a", "b"])
+    pod.simple_process(tinput)
+    record = ast.literal_eval(output.bulks[0].split('\t')[-1])
+    assert record == {'a': '1', 'd': '4', 'e': '5', 'c': '4'}
+
+    # projected again when rules are changed.
+    pod = PluginPod(DummyOutput())
+    tinput = WideInput()
+    tinput.set_parser(WideParser())
+    pod.register_plugin("test", tinput)
+    reform = Reform([("f", "${record[c]}")], [])
+    pod.register_plugin("test", reform)
+    pod.register_plugin("test", output)
+    pod.start()
+    assert tinput.parser.fields == set(["a", "b", "c"])
+    pod.unregister_plugin(reform)
+    assert tinput.parser.fields == set(["a", "b"])
+    pod.unregister_plugin(output)
+    assert tinput.parser.fields is None
+
+    # streams sent to other threads are projected by receiving routers.
+    output = DummyOutput()
+    output.formatter = FieldsFormatter()
+    recv_pod = PluginPod(output)
+    recv_pod.register_plugin("test", output)
+    proxy_output = ProxyOutput(None)
+    proxy_output.add_receiver(recv_pod.router)
+    pod = PluginPod(DummyOutput())
+    tinput = WideInput()
+    tinput.set_parser(WideParser())
+    pod.register_plugin("test", tinput)
+    pod.register_plugin("test", proxy_output)
+    pod.start()
+    assert tinput.parser.fields == set(["a", "b"])
+    recv_pod.register_plugin("test", Reform([("f", "${record[e]}")], []),
+                             True)
+    assert tinput.parser.fields == set(["a", "b", "e"])
+
+    # the whole record is needed by a formatter not declaring fields.
+    pod = PluginPod(DummyOutput())
+    tinput = WideInput()
+    tinput.set_parser(WideParser())
+    pod.register_plugin("test", tinput)
+    pod.register_plugin("test", Filter([("e", "5")]))
+    assert pod.project_fields() is None
+    assert tinput.parser.fields is None
+
+
+def test_plugin_copy():
+    """Test copying output."""
+    formatted = []
+
+    class CountingOutput(DummyOutput):
+        def format_stream(self, tag, ds):
+            formatted.append(self)
+            return super(CountingOutput, self).format_stream(tag, ds)
+
+    def branch(output, modifier=None):
+        pline = Pipeline("test")
+        if modifier is not None:
+            pline.add_modifier(modifier)
+        pline.set_output(output)
+        return pline
+
+    outputs = [CountingOutput() for _ in range(4)]
+    copy_output = CopyOutput([branch(outputs[0]),
+                              branch(outputs[1], Reform([("a", "1")])),
+                              branch(outputs[2]),
+                              branch(outputs[3], Reform([("b", "2")]))])
+    records = [dict(k=1), dict(k=2)]
+    copy_output.emit_stream("test", MultiDataStream([0.0, 1.0], records),
+                            None)
+    # formatted once for the same formatter config without modifiers.
+    assert formatted.count(outputs[0]) == 1
+    assert outputs[2] not in formatted
+    assert outputs[0].bulks == outputs[2].bulks
+    assert "{'k': 1}" in outputs[0].bulks[0]
+    # modifications are not shared between branches.
+    assert "'a': '1'" in outputs[1].bulks[0]
+    assert "'b'" not in outputs[1].bulks[0]
+    assert "'b': '2'" in outputs[3].bulks[0]
+    assert "'a'" not in outputs[3].bulks[0]
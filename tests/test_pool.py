@@ -0,0 +1,135 @@
+"""This module implements object pool test."""
+from __future__ import absolute_import
+
+from queue import Queue
+
+from swak.pool import ObjectPool, make_stream_pool
+from swak.buffer import make_chunk_pool
+from swak.memorybuffer import MemoryBuffer
+from swak.data import MultiDataStream
+from swak.datarouter import DataRouter
+from swak.pluginpod import PluginPod
+from swak.plugin import DummyOutput, Modifier, RecordInput, ProxyOutput
+
+
+class CopyOutput(DummyOutput):
+    """Output which copies bulks since pooled chunks are reused."""
+
+    def _write(self, bulk):
+        if type(bulk) is list:
+            self.bulks += bulk
+        elif type(bulk) is str:
+            self.bulks.append(bulk)
+        else:
+            self.bulks.append(bytes(bulk))
+
+
+def test_pool_basic():
+    """Test basic features of object pool."""
+    def _clear(lst):
+        del lst[:]
+
+    pool = ObjectPool(list, _clear, 2)
+    a = pool.acquire()
+    b = pool.acquire()
+    c = pool.acquire()
+    assert pool.stats['misses'] == 3
+    a.append(1)
+    assert pool.release(a)
+    assert pool.release(b)
+    # pool is full.
+    assert not pool.release(c)
+    assert len(pool) == 2
+    assert pool.stats['discards'] == 1
+
+    # released objects are reset and reused.
+    d = pool.acquire()
+    assert d is b
+    assert pool.acquire() == []
+    assert pool.stats['hits'] == 2
+    assert len(pool) == 0
+
+
+def test_pool_chunk():
+    """Test recycling memory chunks."""
+    output = CopyOutput()
+    buf = MemoryBuffer(output, True, chunk_max_record=2)
+    pool = make_chunk_pool(True, 4)
+    buf.set_chunk_pool(pool)
+    for i in range(6):
+        buf.append("data{}\n".format(i))
+        buf.may_flushing()
+    buf.flushing(True)
+    expect = ''.join("data{}\n".format(i) for i in range(6))
+    assert b''.join(output.bulks) == expect.encode('utf8')
+    # chunks are reused after the first flushing.
+    assert pool.stats['hits'] > 0
+    chunk = pool.acquire()
+    assert chunk.binary
+    assert chunk.bytesize == 0 and chunk.num_record == 0
+    # the bulk keeps its capacity for the next use.
+    assert len(chunk.bulk) > 0
+
+    # text chunks
+    output = CopyOutput()
+    buf = MemoryBuffer(output, False, chunk_max_record=1)
+    buf.set_chunk_pool(make_chunk_pool(False))
+    for i in range(3):
+        buf.append("data{}".format(i))
+        buf.may_flushing()
+    buf.flushing(True)
+    assert output.bulks == ["data0", "data1", "data2"]
+
+
+def test_pool_stream():
+    """Test recycling data streams in pipelines."""
+    class StampModifier(Modifier):
+        def modify(self, tag, utime, record):
+            return utime, dict(record, stamp=True)
+
+    output = CopyOutput()
+    router = DataRouter(output)
+    pool = make_stream_pool()
+    router.set_stream_pool(pool)
+    ds = MultiDataStream([0.0, 1.0], [{"k": 1}, {"k": 2}])
+    router.emit_stream("a.b", ds, None)
+    assert len(output.bulks) == 2
+    # the given stream is owned by the caller.
+    assert len(pool) == 0
+    assert len(ds) == 2
+
+    # stream made by modifiers is released and reset.
+    router.add_rule("a.*", StampModifier(), True)
+    router.emit_stream("a.b", ds, None)
+    assert len(output.bulks) == 4
+    assert "'stamp': True" in output.bulks[-1]
+    assert len(ds) == 2
+    assert len(pool) == 1
+    assert len(pool.acquire()) == 0
+
+    # pod releases streams read from the input once emitted.
+    class FooInput(RecordInput):
+        def generate_record(self):
+            for i in range(3):
+                yield {"k": i}
+
+    output = CopyOutput()
+    pod = PluginPod(output)
+    finput = FooInput()
+    pod.register_plugin("test", finput)
+    pod.register_plugin("test", output)
+    pod.set_pools(pool, dict())
+    pod.simple_process(finput)
+    assert len(output.bulks) == 3
+    assert len(pool) == 1
+    batch = pool.acquire()
+    assert len(batch) == 0
+
+    # not released if queued to another thread.
+    pod = PluginPod(DummyOutput())
+    finput = FooInput()
+    pod.register_plugin("test", finput)
+    pod.register_plugin("test", ProxyOutput(Queue()))
+    pod.set_pools(pool, dict())
+    pod.simple_process(finput)
+    assert len(pool) == 0
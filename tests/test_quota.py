@@ -0,0 +1,83 @@
+"""This module implements tag quota test."""
+from __future__ import absolute_import
+
+import pytest
+
+from swak.quota import TokenBucket, Quota, make_quotas
+from swak.data import MultiDataStream
+from swak.datarouter import DataRouter
+from swak.plugin import DummyOutput
+from swak.exception import ConfigError
+
+
+def _make_stream(num_records):
+    return MultiDataStream([float(i) for i in range(num_records)],
+                           [dict(v=i) for i in range(num_records)])
+
+
+def test_quota_bucket():
+    """Test token bucket refill."""
+    bucket = TokenBucket(10, 0.0)
+    assert bucket.tokens == 10
+    bucket.tokens = 0
+    bucket.refill(0.5)
+    assert bucket.tokens == 5
+    # no more than one second worth of tokens.
+    bucket.refill(10.0)
+    assert bucket.tokens == 10
+
+
+def test_quota_policy():
+    """Test quota overflow policies."""
+    quota = Quota('a.**', records=3)
+    ds = _make_stream(5)
+    admitted, diverted = quota.admit('a.b', ds, 0.0)
+    assert [r['v'] for _, r in admitted] == [0, 1, 2]
+    assert diverted is None
+    assert quota.shed == {'a.b': 2}
+    # another tag has its own bucket.
+    admitted, _ = quota.admit('a.c', ds, 0.0)
+    assert len(admitted) == 3
+    # refilled after a second.
+    admitted, _ = quota.admit('a.b', _make_stream(2), 1.0)
+    assert len(admitted) == 2
+
+    quota = Quota('a', records=2, policy='sample', sample=2)
+    admitted, _ = quota.admit('a', _make_stream(7), 0.0)
+    assert [r['v'] for _, r in admitted] == [0, 1, 2, 4, 6]
+    assert quota.shed == {'a': 5}
+
+    quota = Quota('a', bytes=10, policy='divert', divert='shed')
+    # estimated size of dict(v=i) is 9.
+    admitted, diverted = quota.admit('a', _make_stream(3), 0.0)
+    assert [r['v'] for _, r in admitted] == [0]
+    assert [r['v'] for _, r in diverted] == [1, 2]
+
+    with pytest.raises(ConfigError):
+        Quota('a')
+    with pytest.raises(ConfigError):
+        Quota('a', records=1, policy='delay')
+    with pytest.raises(ConfigError):
+        Quota('a.*', records=1, policy='divert', divert='a.b')
+    with pytest.raises(ConfigError):
+        make_quotas([dict(match='a', records=1, unknown=1)])
+
+
+def test_quota_router():
+    """Test router admission before routing."""
+    output = DummyOutput()
+    router = DataRouter(output)
+    shed_output = DummyOutput()
+    router.add_rule('shed', shed_output, False)
+    router.set_quotas(make_quotas([dict(match='debug.**', records=2,
+                                        policy='divert', divert='shed')]))
+    router.emit_stream('debug.a', _make_stream(5), None)
+    router.emit_stream('info', _make_stream(5), None)
+    assert len(output.bulks) == 7
+    assert len(shed_output.bulks) == 3
+    assert router.quota_stats == {'debug.a': 3}
+
+    # fully shed stream is not routed.
+    router.set_quotas(make_quotas([dict(match='debug.**', records=1)]))
+    router.emit_stream('debug.a', _make_stream(1), None)
+    assert router.emit_stream('debug.a', _make_stream(1), None) == 0
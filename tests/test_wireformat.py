@@ -0,0 +1,89 @@
+"""This module implements wire format test."""
+import io
+import pickle
+
+import pytest
+from six import PY2
+
+from swak.data import MultiDataStream, OneDataStream, ColumnarDataStream
+from swak.wireformat import encode, decode, encode_batch, decode_batch,\
+    write_frame, read_frames
+from swak.exception import WireFormatError
+
+
+def test_wireformat_basic():
+    """Test encoding and decoding of data streams."""
+    times = [0.5, 1.5, 2.5]
+    records = [
+        dict(name="john", score=100, ratio=0.5, tags=["a", 1], ok=True),
+        dict(name="jane", score=2 ** 70, extra=None),
+        dict(name="smith", score=-1, sub=dict(k=b"v")),
+    ]
+    ds = decode(encode(MultiDataStream(times, records)))
+    assert isinstance(ds, ColumnarDataStream)
+    assert list(ds) == list(zip(times, records))
+
+    # columnar stream with typed columns.
+    cds = ColumnarDataStream.from_records(times, [dict(i=i, f=i * 1.0)
+                                                  for i in range(3)])
+    cds.compact()
+    assert list(decode(encode(cds))) == list(cds)
+
+    # repeated strings, narrow integers and missing fields.
+    records = [dict(host="a" if i % 2 else "b", i=i) for i in range(10)]
+    records[3]['extra'] = "x"
+    ds = decode(encode(MultiDataStream(list(range(10)), records)))
+    assert ds.records == records
+    ds.append(10.0, dict(i=2 ** 40))
+    assert ds.record(10) == dict(i=2 ** 40)
+
+    # non dict records.
+    ds = decode(encode(MultiDataStream([1.0, 2.0], ["line1", "line2"])))
+    assert list(ds) == [(1.0, "line1"), (2.0, "line2")]
+
+    # empty stream.
+    assert len(decode(encode(MultiDataStream()))) == 0
+
+
+def test_wireformat_zero_copy():
+    """Test zero-copy decoding of string values."""
+    buf = encode(MultiDataStream([0.0, 1.0], [dict(k="v1"), dict(k="v2")]))
+    ds = decode(buf, zero_copy=True)
+    value = ds.column('k')[1]
+    if PY2:
+        # Python 2 reads copied bytes.
+        assert value == b"v2"
+        return
+    assert isinstance(value, memoryview)
+    assert value.obj is buf
+    assert bytes(value) == b"v2"
+
+
+def test_wireformat_frames():
+    """Test length prefixed framing."""
+    streams = [OneDataStream(float(i), dict(i=i)) for i in range(3)]
+    buf = encode_batch(streams)
+    assert [list(ds) for ds in decode_batch(buf)] ==\
+        [list(ds) for ds in streams]
+
+    fileobj = io.BytesIO()
+    for ds in streams:
+        write_frame(fileobj, ds)
+    fileobj.seek(0)
+    assert [list(ds) for ds in read_frames(fileobj)] ==\
+        [list(ds) for ds in streams]
+
+    # truncated & malformed frames.
+    with pytest.raises(WireFormatError):
+        decode_batch(buf[:-1])
+    with pytest.raises(WireFormatError):
+        decode(b'XXX' + encode(streams[0])[3:])
+
+
+def test_wireformat_size():
+    """Encoded size is smaller than pickle of records."""
+    times = [float(i) for i in range(1000)]
+    records = [dict(name="john", host="localhost", score=i)
+               for i in range(1000)]
+    buf = encode(MultiDataStream(times, records))
+    assert len(buf) < len(pickle.dumps((times, records), 2))